@@ -3,8 +3,10 @@
 FastAPI endpoints za kompletan agent sistem
 """
 
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from typing import Dict, List, Any, Optional
+from datetime import datetime
 import logging
 import sys
 import os
@@ -13,6 +15,7 @@ import os
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 from .core.agent_dispatcher import dispatcher
+from db.export import memory_batches, check_format, encode, export_filename, ExportError, MEMORY_EXPORT_COLUMNS, EXPORT_MEDIA_TYPES
 try:
     from db.models import User  # Fixed import path
     from api.auth import get_current_user
@@ -76,12 +79,12 @@ async def get_available_agents():
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/agents/health")
-async def agents_health_check():
+async def agents_health_check(refresh: bool = False):
     """
-    🩺 AGENT SYSTEM HEALTH CHECK
+    🩺 AGENT SYSTEM HEALTH CHECK (cached, ?refresh=true waits for fresh checks)
     """
     try:
-        health_status = await dispatcher.health_check()
+        health_status = await dispatcher.health_check(force=refresh)
         return {
             'success': True,
             'health': health_status
@@ -336,6 +339,83 @@ async def web_search_agent(
         logger.error(f"❌ Web search error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/agents/memory/search")
+async def search_memory_agent(
+    q: str,
+    limit: int = 20,
+    user = Depends(get_current_user)
+):
+    """
+    🧠 MEMORY AGENT - Full-text search (BM25 ranked, highlighted snippets)
+    """
+    try:
+        memory_agent = dispatcher.agents['memory']
+        return await memory_agent.search_memories(user["id"], q, limit)
+        
+    except Exception as e:
+        logger.error(f"❌ Memory search error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/agents/memory/export")
+async def export_memory_agent(
+    format: str = "ndjson",
+    user_id: Optional[int] = None,
+    all_users: bool = False,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    user = Depends(get_current_user)
+):
+    """
+    🧠 MEMORY AGENT - Stream memories as ndjson / csv / parquet
+    Own memories by default; admins can pass user_id or all_users=true
+    """
+    if (user_id is not None and user_id != user["id"]) or all_users:
+        if not user.get("is_admin"):
+            raise HTTPException(status_code=403, detail="Admin access required")
+    else:
+        user_id = user["id"]
+    try:
+        check_format(format)
+    except ExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    memory_agent = dispatcher.agents['memory']
+    batches = memory_batches(memory_agent.store, user_id=None if all_users else user_id, since=since, until=until)
+    return StreamingResponse(
+        encode(format, batches, MEMORY_EXPORT_COLUMNS),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{export_filename("memories", format)}"'}
+    )
+
+@router.post("/agents/memory/compact")
+async def compact_memory_agent(
+    summarize: Optional[bool] = None,
+    user = Depends(get_current_user)
+):
+    """
+    🧹 MEMORY AGENT - Run retention / dedup / summarization now (admin)
+    """
+    if not user.get("is_admin"):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    try:
+        memory_agent = dispatcher.agents['memory']
+        return {
+            'success': True,
+            'report': await memory_agent.compactor.run(summarize=summarize)
+        }
+        
+    except Exception as e:
+        logger.error(f"❌ Memory compaction error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/agents/memory/compact")
+async def memory_compaction_status(user = Depends(get_current_user)):
+    """
+    🧹 MEMORY AGENT - Compaction schedule and last report
+    """
+    memory_agent = dispatcher.agents['memory']
+    return memory_agent.compactor.get_status()
+
 @router.post("/agents/files/create")
 async def create_file_agent(
     request: Dict[str, Any],
@@ -372,61 +452,80 @@ async def create_file_agent(
 @router.post("/agents/background/start")
 async def start_background_agent(
     request: Dict[str, Any],
-    background_tasks: BackgroundTasks,
     user = Depends(get_current_user)
 ):
     """
     🔄 START BACKGROUND AGENT TASK
+    Queued as an agent job - poll /agents/jobs/{job_id} for state and result
     """
     try:
         agent_type = request.get('agent_type', 'email')
         task_params = request.get('params', {})
         
-        # Add background task
-        background_tasks.add_task(
-            run_background_agent_task,
+        if agent_type not in dispatcher.agents:
+            raise HTTPException(status_code=404, detail=f"Agent {agent_type} not found")
+        
+        job = await dispatcher.jobs.submit(
             agent_type,
-            task_params,
-            user.id
+            task_params.get('input', ''),
+            user["id"],
+            task_params
         )
         
         return {
             'success': True,
-            'message': f"Background {agent_type} agent task started",
-            'task_id': f"bg_{agent_type}_{user.id}"
+            'message': f"Background {agent_type} agent task queued",
+            'task_id': job['id'],
+            'job': job
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"❌ Background agent error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-async def run_background_agent_task(agent_type: str, task_params: Dict, user_id: int):
+async def get_agent_job_or_404(job_id: str, user: dict) -> Dict[str, Any]:
+    job = await dispatcher.jobs.get(job_id)
+    # Other users' jobs look the same as missing ones
+    if job is None or (job['user_id'] != user["id"] and not user.get("is_admin")):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/agents/jobs")
+async def list_agent_jobs(
+    state: Optional[str] = None,
+    agent_type: Optional[str] = None,
+    user_id: Optional[int] = None,
+    limit: int = 50,
+    user = Depends(get_current_user)
+):
     """
-    🔄 BACKGROUND AGENT TASK RUNNER
+    📋 LIST AGENT JOBS (own jobs; admin may pass user_id or see everyone's)
     """
-    try:
-        logger.info(f"🔄 Running background {agent_type} task for user {user_id}")
-        
-        agent = dispatcher.agents.get(agent_type)
-        if not agent:
-            logger.error(f"❌ Agent {agent_type} not found")
-            return
-        
-        user_context = {
-            'user_id': user_id,
-            'background_task': True
-        }
-        
-        # Run agent task
-        result = await agent.execute(
-            task_params.get('input', ''),
-            user_context
-        )
-        
-        logger.info(f"✅ Background {agent_type} task completed: {result.get('success')}")
-        
-    except Exception as e:
-        logger.error(f"❌ Background agent task error: {e}")
+    owner = user_id if user.get("is_admin") else user["id"]
+    return {
+        'success': True,
+        'jobs': await dispatcher.jobs.list(user_id=owner, state=state, agent_type=agent_type, limit=limit),
+        'queue': dispatcher.jobs.get_status()
+    }
+
+@router.get("/agents/jobs/{job_id}")
+async def get_agent_job(job_id: str, user = Depends(get_current_user)):
+    """
+    🔍 POLL AGENT JOB (state, timings, stored result)
+    """
+    return await get_agent_job_or_404(job_id, user)
+
+@router.post("/agents/jobs/{job_id}/cancel")
+async def cancel_agent_job(job_id: str, user = Depends(get_current_user)):
+    """
+    🛑 CANCEL QUEUED / RUNNING AGENT JOB
+    """
+    await get_agent_job_or_404(job_id, user)
+    if not await dispatcher.jobs.cancel(job_id):
+        raise HTTPException(status_code=409, detail="Job already finished")
+    return {'success': True, 'job': await dispatcher.jobs.get(job_id)}
 
 # Agent Statistics
 
@@ -434,30 +533,28 @@ async def run_background_agent_task(agent_type: str, task_params: Dict, user_id:
 async def get_agent_stats(user = Depends(get_current_user)):
     """
     📊 GET AGENT USAGE STATISTICS
+    Live counters since server start + cached health (never waits on a slow check)
     """
     try:
+        usage = dispatcher.metrics.snapshot()
+        health = await dispatcher.health.get()
         stats = {
             'total_agents': len(dispatcher.agents),
-            'agent_health': {},
+            'agent_health': health['agents'],
+            'health_checked_at': health['checked_at'],
             'usage_stats': {
-                'total_dispatches': 0,  # Would be tracked in real system
-                'most_used_agent': 'email',
-                'success_rate': 0.94
+                'total_dispatches': usage['total_dispatches'],
+                'total_agent_calls': usage['total_agent_calls'],
+                'in_flight': usage['in_flight'],
+                'most_used_agent': usage['most_used_agent'],
+                'success_rate': usage['success_rate'],
+                'since': usage['since']
             },
-            'user_preferences': {
-                'preferred_agents': ['email', 'calendar', 'task'],
-                'auto_dispatch': True
-            }
+            'dispatches_by_agent': usage['dispatches_by_agent'],
+            'agents': usage['agents'],
+            'jobs': dispatcher.jobs.get_status()
         }
         
-        # Get health for each agent
-        for agent_name, agent in dispatcher.agents.items():
-            try:
-                health = await agent.health_check()
-                stats['agent_health'][agent_name] = health
-            except:
-                stats['agent_health'][agent_name] = {'status': 'unknown'}
-        
         return {
             'success': True,
             'stats': stats
@@ -7,6 +7,8 @@ Ima permisije na sve i koordinira sav rad
 import asyncio
 import json
 import logging
+import os
+import time
 from typing import Dict, List, Any, Optional
 from datetime import datetime
 import re
@@ -19,9 +21,20 @@ from ..web.web_agent import WebAgent
 from ..files.file_agent import FileAgent
 from ..thinking.thinking_agent import ThinkingAgent
 from ..memory.memory_agent import MemoryAgent
+from .keyword_matcher import KeywordMatcher
+from .job_registry import AgentJobRegistry
+from .metrics import AgentMetrics, HealthCache
 
 logger = logging.getLogger(__name__)
 
+# Matcher group for the exclusion phrases (not an agent)
+SIMPLE_CONVERSATION = '_simple_conversation'
+
+# Multi-agent requests: run all detected agents concurrently and merge their results
+AGENT_FAN_OUT = os.getenv("AGENT_FAN_OUT", "true").lower() == "true"
+# How long dispatch waits for one agent before answering without it (it keeps running)
+AGENT_TIMEOUT_SECONDS = float(os.getenv("AGENT_TIMEOUT_SECONDS", "15"))
+
 class AgentDispatcher:
     """
     🎯 BRUTALNI AGENT DISPATCHER 🎯
@@ -83,9 +96,37 @@ class AgentDispatcher:
             ]
         }
         
+        # 🚫 EXCLUSION FILTERS - Prevent unnecessary web searches
+        self.simple_conversational = [
+            'how are you', 'kako si', 'hello', 'hi', 'zdravo', 'hey',
+            'good morning', 'dobro jutro', 'good evening', 'dobro veče',
+            'thank you', 'hvala', 'thanks', 'bye', 'goodbye', 'doviđenja',
+            'what is your name', 'kako se zoveš', 'who are you', 'ko si ti',
+            'how do you feel', 'šta osećaš', 'are you okay', 'da li si dobro'
+        ]
+        
         # 🎯 PRIORITY MATRIX - neki agenti imaju prioritet
         self.priority_order = ['thinking', 'memory', 'email', 'calendar', 'viber', 'task', 'web', 'file']
         
+        # 🔤 All keywords + exclusion phrases in one automaton (single pass per input)
+        self._build_keyword_matcher()
+        
+        # ⏱️ FAN-OUT - per-agent wait limits (agents that call the model / network get longer)
+        self.fan_out = AGENT_FAN_OUT
+        self.agent_timeouts = {
+            'thinking': AGENT_TIMEOUT_SECONDS * 4,
+            'web': AGENT_TIMEOUT_SECONDS * 2,
+            'email': AGENT_TIMEOUT_SECONDS * 2
+        }
+        self._background_tasks = set()
+        
+        # 🔄 Background agent jobs (persisted in agent_jobs, pollable via /agents/jobs)
+        self.jobs = AgentJobRegistry(self._execute_agent)
+        
+        # 📊 Usage metrics (every agent call goes through _execute_agent) + cached health checks
+        self.metrics = AgentMetrics()
+        self.health = HealthCache(self.agents)
+        
         logger.info("🤖 Agent Dispatcher initialized with brutal efficiency!")
     
     async def dispatch(self, user_input: str, user_context: Dict[str, Any]) -> Dict[str, Any]:
@@ -98,6 +139,7 @@ class AgentDispatcher:
             
             # 1. Detektuj tip zadatka
             detected_agents = self._detect_agent_type(user_input)
+            self.metrics.record_dispatch(detected_agents[0] if detected_agents else None)
             
             if not detected_agents:
                 # Fallback na general assistant
@@ -113,19 +155,25 @@ class AgentDispatcher:
             
             logger.info(f"🎯 Selected agent: {primary_agent}")
             
-            # 3. Pozovi odgovarajućeg agenta
+            # 3. Više agenata: svi paralelno, rezultati spojeni (latencija = najsporiji, ne zbir)
+            if len(detected_agents) > 1 and self.fan_out:
+                return await self._dispatch_fan_out(detected_agents, user_input, user_context)
+            
+            # 4. Pozovi odgovarajućeg agenta
             result = await self._execute_agent(primary_agent, user_input, user_context)
             
-            # 4. Ako treba koordinacija između više agenata
+            # 5. Ako treba koordinacija između više agenata
             if len(detected_agents) > 1:
                 result['multi_agent'] = True
                 result['coordinated_agents'] = detected_agents
                 
-                # Pokreni ostale agente u background-u ako treba
+                # Ostali agenti idu u job queue - rezultat se čuva i može se pratiti
+                result['background_jobs'] = {}
                 for agent_type in detected_agents[1:]:
-                    asyncio.create_task(
-                        self._execute_agent_background(agent_type, user_input, user_context)
+                    job = await self.jobs.submit(
+                        agent_type, user_input, user_context.get('user_id', 0), {'context': user_context}
                     )
+                    result['background_jobs'][agent_type] = job['id']
             
             return result
             
@@ -137,6 +185,17 @@ class AgentDispatcher:
                 'agent_type': 'error'
             }
     
+    def _build_keyword_matcher(self):
+        """(Re)compile the keyword automaton - call after changing agent_keywords / simple_conversational"""
+        groups = dict(self.agent_keywords)
+        groups[SIMPLE_CONVERSATION] = self.simple_conversational
+        self.keyword_matcher = KeywordMatcher(groups)
+    
+    def set_agent_keywords(self, agent_type: str, keywords: List[str]):
+        """Replace one agent's routing keywords and rebuild the matcher"""
+        self.agent_keywords[agent_type] = list(keywords)
+        self._build_keyword_matcher()
+    
     def _detect_agent_type(self, user_input: str) -> List[str]:
         """
         🔍 DETEKTUJE KOJI AGENT TREBA
@@ -144,34 +203,13 @@ class AgentDispatcher:
         """
         input_lower = user_input.lower()
         
-        # 🚫 EXCLUSION FILTERS - Prevent unnecessary web searches
-        simple_conversational = [
-            'how are you', 'kako si', 'hello', 'hi', 'zdravo', 'hey',
-            'good morning', 'dobro jutro', 'good evening', 'dobro veče',
-            'thank you', 'hvala', 'thanks', 'bye', 'goodbye', 'doviđenja',
-            'what is your name', 'kako se zoveš', 'who are you', 'ko si ti',
-            'how do you feel', 'šta osećaš', 'are you okay', 'da li si dobro'
-        ]
+        # Score svih agenata u jednom prolazu (veći score za duže keywords)
+        agent_scores = self.keyword_matcher.scores(input_lower)
         
         # Skip web search for simple conversational queries
-        is_simple_conversation = any(phrase in input_lower for phrase in simple_conversational)
-        
-        agent_scores = {}
-        
-        # Score svaki agent
-        for agent_type, keywords in self.agent_keywords.items():
-            # Skip web agent for simple conversational queries
-            if agent_type == 'web' and is_simple_conversation:
-                continue
-                
-            score = 0
-            for keyword in keywords:
-                if keyword in input_lower:
-                    # Veći score za duže keywords
-                    score += len(keyword) * input_lower.count(keyword)
-            
-            if score > 0:
-                agent_scores[agent_type] = score
+        is_simple_conversation = agent_scores.pop(SIMPLE_CONVERSATION, 0) > 0
+        if is_simple_conversation:
+            agent_scores.pop('web', None)
         
         # Sortiraj po score-u i priority
         detected = []
@@ -194,39 +232,107 @@ class AgentDispatcher:
         """
         ⚡ EXECUTES SPECIFIC AGENT
         """
+        agent = self.agents.get(agent_type)
+        if not agent:
+            return {
+                'success': False, 
+                'error': f'Agent {agent_type} not found',
+                'agent_type': agent_type
+            }
+        
+        started = self.metrics.call_started(agent_type)
+        outcome = {'success': False, 'error': 'Cancelled', 'exception': False}
         try:
-            agent = self.agents.get(agent_type)
-            if not agent:
-                return {
-                    'success': False, 
-                    'error': f'Agent {agent_type} not found',
-                    'agent_type': agent_type
-                }
-            
             # Execute agent sa full context
             result = await agent.execute(user_input, user_context)
             result['agent_type'] = agent_type
             result['timestamp'] = datetime.now().isoformat()
+            outcome = {'success': bool(result.get('success', True)), 'error': result.get('error'), 'exception': False}
             
             return result
             
         except Exception as e:
             logger.error(f"❌ Agent {agent_type} execution error: {e}")
+            outcome = {'success': False, 'error': str(e), 'exception': True}
             return {
                 'success': False,
                 'error': str(e),
                 'agent_type': agent_type
             }
+        finally:
+            self.metrics.call_finished(agent_type, started, **outcome)
     
-    async def _execute_agent_background(self, agent_type: str, user_input: str, user_context: Dict[str, Any]):
+    async def _dispatch_fan_out(self, detected_agents: List[str], user_input: str,
+                                user_context: Dict[str, Any]) -> Dict[str, Any]:
         """
-        🔄 Background agent execution
+        🔀 FAN-OUT / FAN-IN
+        Runs every detected agent concurrently, waits for each up to its timeout and
+        merges the results. Agents that miss their timeout keep running in the
+        background (their side effects still happen) and are reported as pending.
         """
-        try:
-            result = await self._execute_agent(agent_type, user_input, user_context)
-            logger.info(f"🔄 Background agent {agent_type} completed: {result.get('success')}")
-        except Exception as e:
-            logger.error(f"❌ Background agent {agent_type} error: {e}")
+        started = time.perf_counter()
+        tasks = {
+            agent_type: asyncio.create_task(self._execute_agent(agent_type, user_input, user_context))
+            for agent_type in detected_agents
+        }
+        
+        async def collect(agent_type: str, task: asyncio.Task):
+            timeout = self.agent_timeouts.get(agent_type, AGENT_TIMEOUT_SECONDS)
+            try:
+                # shield: a timeout stops the waiting, not the agent
+                result = await asyncio.wait_for(asyncio.shield(task), timeout)
+                return agent_type, result, round((time.perf_counter() - started) * 1000, 1)
+            except asyncio.TimeoutError:
+                self._track(task)
+                task.add_done_callback(lambda t, name=agent_type: self._log_late_result(name, t))
+                return agent_type, None, round(timeout * 1000, 1)
+        
+        collected = await asyncio.gather(*(collect(agent_type, task) for agent_type, task in tasks.items()))
+        
+        agent_results = {}
+        timings = {}
+        timed_out = []
+        for agent_type, result, elapsed_ms in collected:
+            timings[agent_type] = elapsed_ms
+            if result is None:
+                timed_out.append(agent_type)
+                result = {
+                    'success': False,
+                    'pending': True,
+                    'error': f'Agent {agent_type} did not finish in time - still running in background',
+                    'agent_type': agent_type
+                }
+            agent_results[agent_type] = result
+        
+        # Primary agent's result stays the top-level response (same shape as single-agent dispatch):
+        # success/error belong to the primary agent, any_success aggregates all of them
+        primary_agent = detected_agents[0]
+        merged = dict(agent_results[primary_agent])
+        merged.update({
+            'success': bool(agent_results[primary_agent].get('success')),
+            'any_success': any(result.get('success') for result in agent_results.values()),
+            'agent_type': primary_agent,
+            'multi_agent': True,
+            'coordinated_agents': detected_agents,
+            'agent_results': agent_results,
+            'partial': bool(timed_out),
+            'timed_out_agents': timed_out,
+            'agent_timings_ms': timings,
+            'total_ms': round((time.perf_counter() - started) * 1000, 1)
+        })
+        logger.info(f"🔀 Fan-out {detected_agents}: {merged['total_ms']}ms, timed out: {timed_out}")
+        return merged
+    
+    def _track(self, task: asyncio.Task):
+        """Keep a reference to background work so it isn't garbage collected mid-run"""
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    def _log_late_result(self, agent_type: str, task: asyncio.Task):
+        if task.cancelled():
+            return
+        result = task.result()
+        logger.info(f"🔄 Late agent {agent_type} completed: {result.get('success')}")
     
     def get_available_agents(self) -> Dict[str, Any]:
         """
@@ -247,30 +353,19 @@ class AgentDispatcher:
             'dispatch_keywords': self.agent_keywords
         }
     
-    async def health_check(self) -> Dict[str, Any]:
+    async def health_check(self, force: bool = False) -> Dict[str, Any]:
         """
         🩺 HEALTH CHECK ZA SVE AGENTE
+        Cached (AGENT_HEALTH_TTL_SECONDS) - checks run concurrently, refreshed in background
         """
-        health_status = {}
-        
-        for agent_type, agent in self.agents.items():
-            try:
-                if hasattr(agent, 'health_check'):
-                    status = await agent.health_check()
-                else:
-                    status = {'status': 'unknown', 'message': 'No health check implemented'}
-                
-                health_status[agent_type] = status
-                
-            except Exception as e:
-                health_status[agent_type] = {
-                    'status': 'error',
-                    'error': str(e)
-                }
+        cached = await self.health.get(force=force)
         
         return {
             'dispatcher_status': 'healthy',
-            'agents_health': health_status,
+            'agents_health': cached['agents'],
+            'checked_at': cached['checked_at'],
+            'age_seconds': cached['age_seconds'],
+            'refreshing': cached['refreshing'],
             'timestamp': datetime.now().isoformat()
         }
 
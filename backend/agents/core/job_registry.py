@@ -0,0 +1,193 @@
+"""
+🔄 AGENT JOB REGISTRY - QUEUED, TRACKED BACKGROUND AGENT WORK 🔄
+- Every background agent run is a job with a unique id, stored in agent_jobs (data.db)
+- States: queued -> running -> succeeded | failed | cancelled
+  (jobs running when the server stopped become 'interrupted', queued ones are resumed)
+- Bounded concurrency per agent type (AGENT_JOB_CONCURRENCY, overrides per type),
+  extra jobs wait in the queue instead of piling onto the agent
+- Results are kept in SQLite, so clients poll /agents/jobs/{id} instead of losing them
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from db.database import database, engine
+from api.models import agent_jobs
+
+logger = logging.getLogger(__name__)
+
+AGENT_JOB_CONCURRENCY = int(os.getenv("AGENT_JOB_CONCURRENCY", "2"))
+# Agents that hold the model / a browser get fewer parallel jobs
+AGENT_JOB_LIMITS = {
+    'thinking': 1,
+    'web': 2,
+    'file': 4,
+}
+FINISHED_STATES = ("succeeded", "failed", "cancelled", "interrupted")
+
+
+def _row_to_dict(row) -> Dict[str, Any]:
+    job = dict(row)
+    for key in ("params", "result"):
+        job[key] = json.loads(job[key]) if job.get(key) else None
+    finished = job.get("finished_at")
+    started = job.get("started_at")
+    job["queued_seconds"] = round((started or finished or time.time()) - job["created_at"], 3)
+    job["run_seconds"] = round((finished or time.time()) - started, 3) if started else None
+    return job
+
+
+class AgentJobRegistry:
+    """
+    Runs agent jobs via run(agent_type, user_input, user_context) -> result dict
+    (the dispatcher's _execute_agent) and records every state change.
+    """
+
+    def __init__(self, run: Callable[[str, str, Dict[str, Any]], Awaitable[Dict[str, Any]]]):
+        self._run = run
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._running: Dict[str, int] = {}
+        self._table_ready = False
+        self._stopping = False
+
+    # ==================== LIFECYCLE ====================
+    async def _ensure_table(self):
+        if not self._table_ready:
+            await asyncio.to_thread(agent_jobs.create, engine, checkfirst=True)
+            self._table_ready = True
+
+    async def start(self):
+        """Create the table, mark jobs cut off by a restart, resume queued ones (call at startup)"""
+        await self._ensure_table()
+        self._stopping = False
+        await database.execute(
+            agent_jobs.update()
+            .where(agent_jobs.c.state == "running")
+            .values(state="interrupted", error="Server restarted while the job was running", finished_at=time.time())
+        )
+        queued = await database.fetch_all(
+            agent_jobs.select().where(agent_jobs.c.state == "queued").order_by(agent_jobs.c.created_at)
+        )
+        for row in queued:
+            self._spawn(row["id"], row["agent_type"], row["input"] or "", row["user_id"],
+                        json.loads(row["params"]) if row["params"] else {})
+        if queued:
+            logger.info(f"🔄 Resumed {len(queued)} queued agent jobs")
+
+    def stop(self):
+        """Cancel in-process tasks; queued jobs stay queued in the DB and resume on next start"""
+        self._stopping = True
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+
+    # ==================== SUBMIT ====================
+    def limit(self, agent_type: str) -> int:
+        return AGENT_JOB_LIMITS.get(agent_type, AGENT_JOB_CONCURRENCY)
+
+    async def submit(self, agent_type: str, user_input: str, user_id: int,
+                     params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Queue a job, returns its row (state 'queued')"""
+        await self._ensure_table()
+        job_id = uuid.uuid4().hex
+        params = params or {}
+        await database.execute(agent_jobs.insert().values(
+            id=job_id, agent_type=agent_type, user_id=user_id, state="queued",
+            input=user_input, params=json.dumps(params, default=str), created_at=time.time()
+        ))
+        self._spawn(job_id, agent_type, user_input, user_id, params)
+        return await self.get(job_id)
+
+    def _spawn(self, job_id: str, agent_type: str, user_input: str, user_id: int, params: Dict[str, Any]):
+        task = asyncio.create_task(self._execute(job_id, agent_type, user_input, user_id, params))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _, jid=job_id: self._tasks.pop(jid, None))
+
+    async def _execute(self, job_id: str, agent_type: str, user_input: str, user_id: int, params: Dict[str, Any]):
+        semaphore = self._semaphores.setdefault(agent_type, asyncio.Semaphore(self.limit(agent_type)))
+        try:
+            async with semaphore:
+                self._running[agent_type] = self._running.get(agent_type, 0) + 1
+                try:
+                    await self._update(job_id, state="running", started_at=time.time())
+                    user_context = dict(params.get('context', {}), user_id=user_id, background_task=True, job_id=job_id)
+                    result = await self._run(agent_type, user_input, user_context)
+                finally:
+                    self._running[agent_type] -= 1
+        except asyncio.CancelledError:
+            if self._stopping:
+                # Shutdown, not a user cancel: queued stays queued, running becomes interrupted on start()
+                raise
+            await asyncio.shield(self._update(job_id, state="cancelled", error="Cancelled", finished_at=time.time()))
+            raise
+        except Exception as e:
+            logger.error(f"❌ Agent job {job_id} ({agent_type}) failed: {e}")
+            await self._update(job_id, state="failed", error=str(e), finished_at=time.time())
+            return
+
+        state = "succeeded" if result.get('success', True) else "failed"
+        await self._update(
+            job_id, state=state, result=json.dumps(result, default=str),
+            error=None if state == "succeeded" else str(result.get('error') or 'Agent reported failure'),
+            finished_at=time.time()
+        )
+        logger.info(f"✅ Agent job {job_id} ({agent_type}) {state}")
+
+    async def _update(self, job_id: str, **values):
+        await database.execute(agent_jobs.update().where(agent_jobs.c.id == job_id).values(**values))
+
+    # ==================== QUERY / CANCEL ====================
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        await self._ensure_table()
+        row = await database.fetch_one(agent_jobs.select().where(agent_jobs.c.id == job_id))
+        return _row_to_dict(row) if row else None
+
+    async def list(self, user_id: Optional[int] = None, state: Optional[str] = None,
+                   agent_type: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        await self._ensure_table()
+        query = agent_jobs.select()
+        if user_id is not None:
+            query = query.where(agent_jobs.c.user_id == user_id)
+        if state:
+            query = query.where(agent_jobs.c.state == state)
+        if agent_type:
+            query = query.where(agent_jobs.c.agent_type == agent_type)
+        rows = await database.fetch_all(query.order_by(agent_jobs.c.created_at.desc()).limit(max(1, min(limit, 500))))
+        return [_row_to_dict(row) for row in rows]
+
+    async def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job; False if it already finished"""
+        job = await self.get(job_id)
+        if job is None or job["state"] in FINISHED_STATES:
+            return False
+        task = self._tasks.get(job_id)
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        else:
+            # Queued in the DB but not owned by this process (e.g. not resumed yet)
+            await self._update(job_id, state="cancelled", error="Cancelled", finished_at=time.time())
+        return True
+
+    def get_status(self) -> Dict[str, Any]:
+        agent_types = set(self._semaphores) | set(AGENT_JOB_LIMITS)
+        return {
+            'active_jobs': len(self._tasks),
+            'default_concurrency': AGENT_JOB_CONCURRENCY,
+            'per_agent': {
+                agent_type: {
+                    'limit': self.limit(agent_type),
+                    'running': self._running.get(agent_type, 0)
+                }
+                for agent_type in sorted(agent_types)
+            }
+        }
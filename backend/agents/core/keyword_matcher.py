@@ -0,0 +1,115 @@
+"""
+🔤 KEYWORD MATCHER - AHO-CORASICK AUTOMATON FOR AGENT ROUTING 🔤
+- All keywords of all groups (agents) compiled once into one automaton
+- Full DFA (failure links folded into the transition table), so the scan is
+  one dict lookup per character - O(len(text)) no matter how many keywords
+- Same semantics as `keyword in text` / text.count(keyword): plain substrings, found
+  also inside longer keywords (e.g. 'web' in 'website'), and like str.count repeats of
+  one keyword don't overlap ('aa' occurs twice in 'aaaa', not three times)
+- The automaton counts overlapping hits, so keywords that can overlap themselves
+  (a prefix that is also a suffix, e.g. 'aa', 'aba') and did match are recounted
+  with text.count - rare, and only for keywords that actually occur
+- Score of a group = sum(len(keyword) * occurrences), computed in the same pass
+"""
+
+from collections import Counter, deque
+from typing import Dict, Iterable, List, Tuple
+
+
+class KeywordMatcher:
+    """Multi-pattern matcher over {group: [keywords]} (immutable - build a new one to change keywords)"""
+
+    def __init__(self, groups: Dict[str, Iterable[str]]):
+        self.groups = {group: [keyword.lower() for keyword in keywords] for group, keywords in groups.items()}
+        self._delta: List[Dict[str, int]] = []
+        # state -> ids of every keyword ending at that state
+        self._outputs: List[Tuple[int, ...]] = []
+        # keyword id -> (keyword, groups it scores for, can overlap itself)
+        self._keywords: List[Tuple[str, Tuple[str, ...], bool]] = []
+        self._build()
+
+    def _build(self):
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[List[int]] = [[]]
+
+        # 1. Trie of all distinct keywords (a keyword listed under several groups scores for each)
+        keyword_groups: Dict[str, List[str]] = {}
+        for group, keywords in self.groups.items():
+            for keyword in keywords:
+                if keyword:
+                    keyword_groups.setdefault(keyword, []).append(group)
+        for keyword, groups in keyword_groups.items():
+            state = 0
+            for ch in keyword:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    goto.append({})
+                    outputs.append([])
+                    nxt = goto[state][ch] = len(goto) - 1
+                state = nxt
+            overlaps = any(keyword[:k] == keyword[-k:] for k in range(1, len(keyword)))
+            outputs[state].append(len(self._keywords))
+            self._keywords.append((keyword, tuple(groups), overlaps))
+
+        # 2. Failure links (BFS), outputs of the fallback state are inherited
+        fail = [0] * len(goto)
+        order = []
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            order.append(state)
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                fallback = fail[state]
+                while fallback and ch not in goto[fallback]:
+                    fallback = fail[fallback]
+                target = goto[fallback].get(ch, 0)
+                fail[nxt] = target if target != nxt else 0
+                outputs[nxt] = outputs[nxt] + outputs[fail[nxt]]
+
+        # 3. Fold failure links into a full transition table (BFS order: fallbacks are done first)
+        delta: List[Dict[str, int]] = [dict() for _ in goto]
+        delta[0] = dict(goto[0])
+        for state in order:
+            table = dict(delta[fail[state]])
+            table.update(goto[state])
+            delta[state] = table
+
+        self._delta = delta
+        self._outputs = [tuple(output) for output in outputs]
+
+    def _scan(self, text: str) -> Counter:
+        """state -> number of times it was reached (only states where a keyword ends)"""
+        delta, outputs = self._delta, self._outputs
+        state = 0
+        hits = []
+        append = hits.append
+        for ch in text:
+            state = delta[state].get(ch, 0)
+            if outputs[state]:
+                append(state)
+        return Counter(hits)
+
+    def scores(self, text: str) -> Dict[str, int]:
+        """{group: sum(len(keyword) * occurrences)} for groups with at least one match (text must be lowercase)"""
+        counts: Counter = Counter()
+        for state, count in self._scan(text).items():
+            for keyword_id in self._outputs[state]:
+                counts[keyword_id] += count
+
+        scores: Dict[str, int] = {}
+        for keyword_id, count in counts.items():
+            keyword, groups, overlaps = self._keywords[keyword_id]
+            if overlaps:
+                count = text.count(keyword)  # non-overlapping, like the old routing
+            for group in groups:
+                scores[group] = scores.get(group, 0) + len(keyword) * count
+        return scores
+
+    def get_stats(self) -> dict:
+        return {
+            'groups': len(self.groups),
+            'keywords': sum(len(keywords) for keywords in self.groups.values()),
+            'self_overlapping': sum(1 for _, _, overlaps in self._keywords if overlaps),
+            'states': len(self._delta)
+        }
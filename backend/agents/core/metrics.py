@@ -0,0 +1,210 @@
+"""
+📊 AGENT METRICS - IN-PROCESS USAGE COUNTERS + CACHED HEALTH 📊
+- Per agent: calls, failures, exceptions, in-flight, latency histogram
+- Histograms use fixed log-spaced buckets (1 ms .. ~2 min), so recording is one
+  bisect + increment and p50/p95/p99 are interpolated from the bucket counts
+  (no samples kept)
+- Everything is updated from the event loop thread only - plain ints, no locks
+- Health checks are cached for AGENT_HEALTH_TTL_SECONDS and refreshed in the
+  background (concurrently, each with a timeout), so /agents/stats never waits
+  on a slow check like the web agent's connectivity probe
+"""
+
+import asyncio
+import bisect
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+AGENT_HEALTH_TTL_SECONDS = float(os.getenv("AGENT_HEALTH_TTL_SECONDS", "60"))
+AGENT_HEALTH_TIMEOUT_SECONDS = float(os.getenv("AGENT_HEALTH_TIMEOUT_SECONDS", "5"))
+
+# Bucket upper bounds in ms: 1, 1.25, 1.56 ... ~140 s (x1.25 per bucket)
+LATENCY_BUCKETS_MS: List[float] = [1.25 ** i for i in range(0, 54)]
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram (ms)"""
+
+    def __init__(self, bounds: List[float] = LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last bucket = overflow
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, ms: float):
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+
+    def percentile(self, p: float) -> Optional[float]:
+        """p-th percentile, linearly interpolated inside its bucket (capped at the observed max)"""
+        if not self.count:
+            return None
+        rank = p / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.bounds[i - 1] if i else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.max_ms
+                value = lower + (upper - lower) * (rank - seen) / count
+                return round(min(value, self.max_ms), 2)
+            seen += count
+        return round(self.max_ms, 2)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total_ms / self.count, 2) if self.count else None,
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'max_ms': round(self.max_ms, 2) if self.count else None
+        }
+
+
+class AgentCallStats:
+    """Counters for one agent"""
+
+    def __init__(self):
+        self.calls = 0
+        self.succeeded = 0
+        self.failed = 0       # agent returned success=False
+        self.exceptions = 0   # agent raised
+        self.in_flight = 0
+        self.last_call: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.latency = LatencyHistogram()
+
+    def to_dict(self) -> Dict[str, Any]:
+        finished = self.succeeded + self.failed + self.exceptions
+        return {
+            'calls': self.calls,
+            'succeeded': self.succeeded,
+            'failed': self.failed,
+            'exceptions': self.exceptions,
+            'in_flight': self.in_flight,
+            'error_rate': round((self.failed + self.exceptions) / finished, 4) if finished else 0.0,
+            'latency': self.latency.summary(),
+            'last_call': datetime.fromtimestamp(self.last_call).isoformat() if self.last_call else None,
+            'last_error': self.last_error
+        }
+
+
+class AgentMetrics:
+    """Usage metrics for all agents (fed by AgentDispatcher._execute_agent)"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.dispatches = 0
+        self.primary_counts: Dict[str, int] = {}
+        self._agents: Dict[str, AgentCallStats] = {}
+
+    def _stats(self, agent_type: str) -> AgentCallStats:
+        stats = self._agents.get(agent_type)
+        if stats is None:
+            stats = self._agents[agent_type] = AgentCallStats()
+        return stats
+
+    def record_dispatch(self, primary_agent: Optional[str]):
+        self.dispatches += 1
+        if primary_agent:
+            self.primary_counts[primary_agent] = self.primary_counts.get(primary_agent, 0) + 1
+
+    def call_started(self, agent_type: str) -> float:
+        stats = self._stats(agent_type)
+        stats.calls += 1
+        stats.in_flight += 1
+        stats.last_call = time.time()
+        return time.perf_counter()
+
+    def call_finished(self, agent_type: str, started: float, success: bool = True,
+                      error: Optional[str] = None, exception: bool = False):
+        stats = self._stats(agent_type)
+        stats.in_flight -= 1
+        stats.latency.record((time.perf_counter() - started) * 1000)
+        if exception:
+            stats.exceptions += 1
+        elif success:
+            stats.succeeded += 1
+        else:
+            stats.failed += 1
+        if error and not success:
+            stats.last_error = str(error)[:300]
+
+    def snapshot(self) -> Dict[str, Any]:
+        agents = {agent_type: stats.to_dict() for agent_type, stats in sorted(self._agents.items())}
+        calls = sum(stats['calls'] for stats in agents.values())
+        finished = sum(stats['succeeded'] + stats['failed'] + stats['exceptions'] for stats in agents.values())
+        succeeded = sum(stats['succeeded'] for stats in agents.values())
+        return {
+            'since': datetime.fromtimestamp(self.started_at).isoformat(),
+            'total_dispatches': self.dispatches,
+            'total_agent_calls': calls,
+            'in_flight': sum(stats['in_flight'] for stats in agents.values()),
+            'success_rate': round(succeeded / finished, 4) if finished else None,
+            'most_used_agent': max(self.primary_counts, key=self.primary_counts.get) if self.primary_counts else None,
+            'dispatches_by_agent': dict(sorted(self.primary_counts.items(), key=lambda item: -item[1])),
+            'agents': agents
+        }
+
+
+class HealthCache:
+    """Per-agent health_check() results, refreshed in the background once older than ttl"""
+
+    def __init__(self, agents: Dict[str, Any], ttl: float = AGENT_HEALTH_TTL_SECONDS,
+                 timeout: float = AGENT_HEALTH_TIMEOUT_SECONDS):
+        self.agents = agents
+        self.ttl = ttl
+        self.timeout = timeout
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self._checked_at: Optional[float] = None
+        self._refresh: Optional[asyncio.Task] = None
+        self.refreshes = 0
+
+    async def _check(self, agent_type: str, agent) -> Dict[str, Any]:
+        if not hasattr(agent, 'health_check'):
+            return {'status': 'unknown', 'message': 'No health check implemented'}
+        try:
+            return await asyncio.wait_for(agent.health_check(), self.timeout)
+        except asyncio.TimeoutError:
+            return {'status': 'degraded', 'error': f'Health check timed out after {self.timeout:g}s'}
+        except Exception as e:
+            return {'status': 'error', 'error': str(e)}
+
+    async def _run_refresh(self):
+        started = time.perf_counter()
+        names = list(self.agents)
+        results = await asyncio.gather(*(self._check(name, self.agents[name]) for name in names))
+        self._results = dict(zip(names, results))
+        self._checked_at = time.time()
+        self.refreshes += 1
+        logger.info(f"🩺 Agent health refreshed in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    def refresh(self) -> asyncio.Task:
+        """Start a refresh unless one is running (returns the running/new task)"""
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.create_task(self._run_refresh())
+        return self._refresh
+
+    async def get(self, force: bool = False) -> Dict[str, Any]:
+        """Cached results; stale ones are served while a background refresh runs"""
+        if force or self._checked_at is None:
+            # Nothing cached yet (or explicitly asked) - wait for the first round
+            await asyncio.shield(self.refresh())
+        elif time.time() - self._checked_at > self.ttl:
+            self.refresh()
+        return {
+            'agents': dict(self._results),
+            'checked_at': datetime.fromtimestamp(self._checked_at).isoformat() if self._checked_at else None,
+            'age_seconds': round(time.time() - self._checked_at, 1) if self._checked_at else None,
+            'ttl_seconds': self.ttl,
+            'refreshing': self._refresh is not None and not self._refresh.done()
+        }
@@ -0,0 +1,389 @@
+"""
+🧹 MEMORY COMPACTION - KEEPS memory.db BOUNDED 🧹
+Scheduled job (MEMORY_COMPACTION_INTERVAL_HOURS) that enforces memory_config:
+- Retention: memories older than memory_retention_days with importance below
+  importance_threshold (and never recalled) are deleted
+- Near-duplicates: same user + type, identical normalized text or embedding
+  cosine >= MEMORY_DEDUP_SIMILARITY - the best one is kept and absorbs the
+  others' access counts / importance
+- Summaries (auto_summarize): old conversation_topic memories are clustered
+  (embeddings, or by week without them) and each cluster is rolled into one
+  conversation_summary memory written by the loaded model
+- Cap: at most max_memory_entries per user (lowest importance, oldest go first)
+- Maintenance: FTS optimize, ANALYZE, VACUUM when enough pages are free
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .vector_index import from_blob, to_blob
+
+logger = logging.getLogger(__name__)
+
+MEMORY_COMPACTION_INTERVAL_HOURS = float(os.getenv("MEMORY_COMPACTION_INTERVAL_HOURS", "24"))
+# First run after startup (don't compete with model auto-load)
+MEMORY_COMPACTION_DELAY_SECONDS = float(os.getenv("MEMORY_COMPACTION_DELAY_SECONDS", "600"))
+MEMORY_DEDUP_SIMILARITY = float(os.getenv("MEMORY_DEDUP_SIMILARITY", "0.95"))
+MEMORY_CLUSTER_SIMILARITY = float(os.getenv("MEMORY_CLUSTER_SIMILARITY", "0.75"))
+# conversation_topic memories younger than this are left alone
+MEMORY_SUMMARIZE_AFTER_DAYS = int(os.getenv("MEMORY_SUMMARIZE_AFTER_DAYS", "14"))
+MIN_CLUSTER_SIZE = 3
+MAX_CLUSTER_SIZE = 20
+MAX_SUMMARIES_PER_RUN = 50
+SUMMARY_MAX_TOKENS = 160
+# VACUUM only pays off once a good part of the file is free pages
+VACUUM_FREE_RATIO = 0.2
+DEDUP_BLOCK = 1024
+
+_NORMALIZE = re.compile(r"[\W_]+", re.UNICODE)
+
+SUMMARY_PROMPT = """Summarize the following notes about past conversations with the user into one short paragraph.
+Keep names, preferences, decisions and open tasks. Do not add anything that is not in the notes.
+
+Notes:
+{notes}
+
+Summary:"""
+
+EXPIRE_SQL = '''
+    SELECT id, user_id FROM memories
+    WHERE created_at < datetime('now', ?)
+      AND importance_score < ?
+      AND COALESCE(accessed_count, 0) = 0
+'''
+DEDUP_CANDIDATES_SQL = '''
+    SELECT m.id, m.user_id, m.memory_type, m.content, m.importance_score,
+           COALESCE(m.accessed_count, 0), e.embedding
+    FROM memories m LEFT JOIN memory_embeddings e ON e.memory_id = m.id
+    ORDER BY m.user_id, m.memory_type, m.importance_score DESC, m.created_at DESC
+'''
+SUMMARY_CANDIDATES_SQL = '''
+    SELECT m.id, m.user_id, m.content, m.importance_score, m.created_at,
+           strftime('%Y-%W', m.created_at), e.embedding
+    FROM memories m LEFT JOIN memory_embeddings e ON e.memory_id = m.id
+    WHERE m.memory_type = 'conversation_topic' AND m.created_at < datetime('now', ?)
+    ORDER BY m.user_id, m.created_at
+'''
+OVER_CAP_SQL = '''
+    SELECT id, user_id FROM (
+        SELECT id, user_id, ROW_NUMBER() OVER (
+            PARTITION BY user_id
+            ORDER BY importance_score DESC, COALESCE(last_accessed, created_at) DESC
+        ) AS rank
+        FROM memories
+    ) WHERE rank > ?
+'''
+INSERT_SUMMARY_SQL = '''
+    INSERT INTO memories
+    (user_id, memory_type, content, context, importance_score, created_at, tags, summary, related_memories)
+    VALUES (?, 'conversation_summary', ?, ?, ?, ?, 'summary', ?, ?)
+'''
+
+
+def normalize_text(text: str) -> str:
+    return _NORMALIZE.sub(" ", text.lower()).strip()
+
+
+def delete_memories(conn, memory_ids: List[int]):
+    """Delete memories + their embeddings (FTS rows go via the memories_fts_ad trigger)"""
+    for start in range(0, len(memory_ids), 500):
+        chunk = memory_ids[start:start + 500]
+        marks = ','.join(['?'] * len(chunk))
+        conn.execute(f"DELETE FROM memory_embeddings WHERE memory_id IN ({marks})", chunk)
+        conn.execute(f"DELETE FROM memories WHERE id IN ({marks})", chunk)
+
+
+def find_duplicates(rows: List[tuple], threshold: float = MEMORY_DEDUP_SIMILARITY) -> Dict[int, List[int]]:
+    """
+    rows: (id, content, embedding blob or None) of ONE user + memory type, best first.
+    Returns {kept_id: [duplicate ids]} - a memory is only ever folded into a better one.
+    """
+    merged: Dict[int, List[int]] = defaultdict(list)
+    removed = set()
+
+    # Exact duplicates after normalization
+    seen: Dict[str, int] = {}
+    for memory_id, content, _ in rows:
+        key = normalize_text(content)
+        if key in seen:
+            merged[seen[key]].append(memory_id)
+            removed.add(memory_id)
+        else:
+            seen[key] = memory_id
+
+    # Near-duplicates by cosine (vectors are normalized), greedy in priority order
+    embedded = [(memory_id, from_blob(blob)) for memory_id, _, blob in rows
+                if blob is not None and memory_id not in removed]
+    dims = {len(vector) for _, vector in embedded}
+    if len(embedded) > 1 and len(dims) == 1:
+        ids = np.array([memory_id for memory_id, _ in embedded], dtype=np.int64)
+        matrix = np.stack([vector for _, vector in embedded])
+        alive = np.ones(len(ids), dtype=bool)
+        for start in range(0, len(ids), DEDUP_BLOCK):
+            sims = matrix[start:start + DEDUP_BLOCK] @ matrix.T
+            for offset, row in enumerate(sims):
+                i = start + offset
+                if not alive[i]:
+                    continue
+                dupes = np.nonzero(alive & (row >= threshold))[0]
+                dupes = dupes[dupes > i]
+                if len(dupes):
+                    alive[dupes] = False
+                    merged[int(ids[i])].extend(int(ids[j]) for j in dupes)
+    return dict(merged)
+
+
+def cluster_memories(rows: List[tuple], threshold: float = MEMORY_CLUSTER_SIMILARITY) -> List[List[tuple]]:
+    """
+    rows: (id, content, importance, created_at, week, embedding blob or None) of ONE user.
+    Leader clustering on embeddings; memories without one are grouped by week.
+    Only clusters of MIN_CLUSTER_SIZE..MAX_CLUSTER_SIZE memories are returned.
+    """
+    clusters: List[List[tuple]] = []
+    by_week: Dict[str, List[tuple]] = defaultdict(list)
+    leaders: List[Tuple[np.ndarray, List[tuple]]] = []
+    dim = None
+
+    for row in rows:
+        blob = row[5]
+        vector = from_blob(blob) if blob is not None else None
+        if vector is not None and dim is None:
+            dim = len(vector)
+        if vector is None or len(vector) != dim:
+            by_week[row[4]].append(row)
+            continue
+        best, best_score = None, threshold
+        for leader, members in leaders:
+            if len(members) >= MAX_CLUSTER_SIZE:
+                continue
+            score = float(leader @ vector)
+            if score >= best_score:
+                best, best_score = members, score
+        if best is None:
+            leaders.append((vector, [row]))
+        else:
+            best.append(row)
+
+    clusters.extend(members for _, members in leaders)
+    for members in by_week.values():
+        clusters.extend(members[start:start + MAX_CLUSTER_SIZE] for start in range(0, len(members), MAX_CLUSTER_SIZE))
+    return [members for members in clusters if len(members) >= MIN_CLUSTER_SIZE]
+
+
+class MemoryCompactor:
+    """Runs compaction for a MemoryAgent (store, vector index, memory_config)"""
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.store = agent.store
+        self._task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+        # Stats
+        self.runs = 0
+        self.last_run: Optional[str] = None
+        self.last_report: Optional[Dict[str, Any]] = None
+        self.last_error: Optional[str] = None
+
+    # ==================== SCHEDULER ====================
+    def start(self):
+        """Start the periodic job on the running loop (idempotent)"""
+        if MEMORY_COMPACTION_INTERVAL_HOURS <= 0 or (self._task is not None and not self._task.done()):
+            return
+        self._task = asyncio.create_task(self._loop())
+        logger.info(f"🧹 Memory compaction every {MEMORY_COMPACTION_INTERVAL_HOURS:g}h")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _loop(self):
+        await asyncio.sleep(MEMORY_COMPACTION_DELAY_SECONDS)
+        while True:
+            try:
+                await self.run()
+            except Exception as e:
+                logger.error(f"❌ Memory compaction failed: {e}")
+            await asyncio.sleep(MEMORY_COMPACTION_INTERVAL_HOURS * 3600)
+
+    # ==================== RUN ====================
+    async def run(self, summarize: Optional[bool] = None) -> Dict[str, Any]:
+        """One full compaction pass; concurrent calls wait for the running one"""
+        config = self.agent.memory_config
+        if summarize is None:
+            summarize = config.get('auto_summarize', False)
+
+        async with self._lock:
+            started = time.perf_counter()
+            touched_users = set()
+            report: Dict[str, Any] = {'started_at': datetime.now().isoformat()}
+            try:
+                report['expired'] = await self._expire(config, touched_users)
+                report['duplicates_merged'] = await self._merge_duplicates(touched_users)
+                report['summaries'] = await self._summarize(touched_users) if summarize else {'skipped': 'auto_summarize off'}
+                report['over_cap_removed'] = await self._enforce_cap(config, touched_users)
+                report['maintenance'] = await self.store.maintenance(self._maintenance)
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                report['error'] = str(e)
+                raise
+            finally:
+                # Changed users reload their semantic index lazily on next retrieval
+                for user_id in touched_users:
+                    self.agent.vector_index.drop(user_id)
+                report['users_touched'] = len(touched_users)
+                report['seconds'] = round(time.perf_counter() - started, 2)
+                self.runs += 1
+                self.last_run = report['started_at']
+                self.last_report = report
+
+        logger.info(f"🧹 Memory compaction done: {report}")
+        return report
+
+    async def _expire(self, config: Dict, touched_users: set) -> int:
+        rows = await self.store.fetch_all(
+            EXPIRE_SQL, (f"-{int(config['memory_retention_days'])} days", config['importance_threshold'])
+        )
+        if rows:
+            await self.store.write(delete_memories, [row[0] for row in rows])
+            touched_users.update(row[1] for row in rows)
+        return len(rows)
+
+    async def _merge_duplicates(self, touched_users: set) -> int:
+        rows = await self.store.fetch_all(DEDUP_CANDIDATES_SQL)
+        groups: Dict[tuple, List[tuple]] = defaultdict(list)
+        stats: Dict[int, tuple] = {}
+        for memory_id, user_id, memory_type, content, importance, accessed, blob in rows:
+            groups[(user_id, memory_type)].append((memory_id, content, blob))
+            stats[memory_id] = (importance, accessed)
+
+        merges = []
+        for (user_id, _), members in groups.items():
+            duplicates = await asyncio.to_thread(find_duplicates, members)
+            for kept, dupes in duplicates.items():
+                importance = max(stats[memory_id][0] for memory_id in [kept] + dupes)
+                accessed = sum(stats[memory_id][1] for memory_id in [kept] + dupes)
+                merges.append((kept, dupes, importance, accessed))
+                touched_users.add(user_id)
+
+        if not merges:
+            return 0
+
+        def apply(conn):
+            for kept, dupes, importance, accessed in merges:
+                conn.execute(
+                    "UPDATE memories SET importance_score = ?, accessed_count = ? WHERE id = ?",
+                    (importance, accessed, kept)
+                )
+                delete_memories(conn, dupes)
+
+        await self.store.write(apply)
+        return sum(len(dupes) for _, dupes, _, _ in merges)
+
+    async def _summarize(self, touched_users: set) -> Dict[str, Any]:
+        from inference.worker import inference_worker
+
+        if inference_worker.model is None:
+            return {'skipped': 'no model loaded'}
+
+        rows = await self.store.fetch_all(SUMMARY_CANDIDATES_SQL, (f"-{MEMORY_SUMMARIZE_AFTER_DAYS} days",))
+        by_user: Dict[int, List[tuple]] = defaultdict(list)
+        for memory_id, user_id, content, importance, created_at, week, blob in rows:
+            by_user[user_id].append((memory_id, content, importance, created_at, week, blob))
+
+        created, rolled_up, failed = 0, 0, 0
+        for user_id, user_rows in by_user.items():
+            for cluster in cluster_memories(user_rows):
+                if created >= MAX_SUMMARIES_PER_RUN:
+                    break
+                try:
+                    await self._roll_up(inference_worker, user_id, cluster)
+                except Exception as e:
+                    failed += 1
+                    logger.warning(f"⚠️ Memory summary failed for user {user_id}: {e}")
+                    continue
+                created += 1
+                rolled_up += len(cluster)
+                touched_users.add(user_id)
+        return {'created': created, 'memories_rolled_up': rolled_up, 'failed': failed}
+
+    async def _roll_up(self, worker, user_id: int, cluster: List[tuple]):
+        """Replace a cluster of conversation_topic memories with one model-written summary"""
+        cluster = sorted(cluster, key=lambda row: row[3])
+        notes = "\n".join(f"- [{row[3][:10]}] {row[1][:400]}" for row in cluster)
+        result = await worker.generate(
+            SUMMARY_PROMPT.format(notes=notes), user_id=user_id,
+            max_tokens=SUMMARY_MAX_TOKENS, temperature=0.2
+        )
+        summary = result["choices"][0]["text"].strip()
+        if not summary:
+            raise ValueError("model returned an empty summary")
+
+        source_ids = [row[0] for row in cluster]
+        importance = min(max(row[2] for row in cluster) + 0.1, 1.0)
+        period = {'from': cluster[0][3], 'to': cluster[-1][3]}
+        vectors = await self.agent._embed([summary])
+
+        def apply(conn):
+            # Keep the newest source timestamp so retention/time filters still see the period
+            memory_id = conn.execute(INSERT_SUMMARY_SQL, (
+                user_id, summary, json.dumps({'summarized_from': len(source_ids), 'period': period}),
+                importance, cluster[-1][3], f"Summary of {len(source_ids)} conversation topics",
+                json.dumps(source_ids)
+            )).lastrowid
+            if vectors is not None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO memory_embeddings (memory_id, embedding) VALUES (?, ?)",
+                    (memory_id, to_blob(vectors[0]))
+                )
+            delete_memories(conn, source_ids)
+            return memory_id
+
+        return await self.store.write(apply)
+
+    async def _enforce_cap(self, config: Dict, touched_users: set) -> int:
+        rows = await self.store.fetch_all(OVER_CAP_SQL, (int(config['max_memory_entries']),))
+        if rows:
+            await self.store.write(delete_memories, [row[0] for row in rows])
+            touched_users.update(row[1] for row in rows)
+        return len(rows)
+
+    @staticmethod
+    def _maintenance(conn) -> Dict[str, Any]:
+        """FTS merge + planner stats, VACUUM only when it reclaims enough (writer thread, autocommit)"""
+        conn.execute("INSERT INTO memories_fts(memories_fts) VALUES ('optimize')")
+        conn.execute("ANALYZE")
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        vacuumed = bool(page_count) and free_pages / page_count >= VACUUM_FREE_RATIO
+        if vacuumed:
+            conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return {
+            'analyzed': True,
+            'vacuumed': vacuumed,
+            'free_pages': free_pages,
+            'page_count': conn.execute("PRAGMA page_count").fetchone()[0]
+        }
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            'scheduled': self._task is not None and not self._task.done(),
+            'interval_hours': MEMORY_COMPACTION_INTERVAL_HOURS,
+            'running': self._lock.locked(),
+            'runs': self.runs,
+            'last_run': self.last_run,
+            'last_report': self.last_report,
+            'last_error': self.last_error
+        }
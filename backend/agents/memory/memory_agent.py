@@ -8,15 +8,147 @@
 """
 
 import asyncio
-import sqlite3
+import os
 from typing import Dict, List, Any, Optional
 from datetime import datetime, timedelta
 import logging
 import json
 import hashlib
+import re
+
+from .store import MemoryStore
+from .compaction import MemoryCompactor, SUMMARY_PROMPT, delete_memories
+from .vector_index import MemoryVectorIndex, UserVectorIndex, to_blob, from_blob
+from inference.embeddings import text_embedder
+from db.fts import ensure_fts, fts_query, TOKENIZER, HIGHLIGHT_START, HIGHLIGHT_END
 
 logger = logging.getLogger(__name__)
 
+MEMORY_DB_PATH = os.getenv("MEMORY_DB_PATH", '/root/MasterCoderAI/backend/memory.db')
+
+MEMORY_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS memories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        memory_type TEXT NOT NULL,
+        content TEXT NOT NULL,
+        context TEXT,
+        importance_score REAL NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        accessed_count INTEGER DEFAULT 0,
+        last_accessed TIMESTAMP,
+        tags TEXT,
+        summary TEXT,
+        related_memories TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS user_profiles (
+        user_id INTEGER PRIMARY KEY,
+        name TEXT,
+        preferences TEXT,
+        communication_style TEXT,
+        expertise_areas TEXT,
+        common_tasks TEXT,
+        last_interaction TIMESTAMP,
+        total_conversations INTEGER DEFAULT 0
+    )
+    ''',
+    # Memory embeddings table (for semantic search)
+    '''
+    CREATE TABLE IF NOT EXISTS memory_embeddings (
+        memory_id INTEGER,
+        embedding BLOB,
+        FOREIGN KEY (memory_id) REFERENCES memories (id)
+    )
+    ''',
+    # One embedding per memory (INSERT OR REPLACE on re-embed)
+    '''
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_memory_embeddings_memory
+    ON memory_embeddings (memory_id)
+    ''',
+    # Retrieval always filters by user and sorts by importance / recency
+    '''
+    CREATE INDEX IF NOT EXISTS idx_memories_user_type_created
+    ON memories (user_id, memory_type, created_at)
+    ''',
+]
+
+# 🔎 Full-text index over content/tags (external content table, synced by triggers)
+MEMORY_FTS_SCHEMA = [
+    f'''
+    CREATE VIRTUAL TABLE IF NOT EXISTS memories_fts USING fts5(
+        content, tags, content='memories', content_rowid='id', tokenize='{TOKENIZER}'
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS memories_fts_ai AFTER INSERT ON memories BEGIN
+        INSERT INTO memories_fts(rowid, content, tags) VALUES (new.id, new.content, new.tags);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS memories_fts_ad AFTER DELETE ON memories BEGIN
+        INSERT INTO memories_fts(memories_fts, rowid, content, tags) VALUES ('delete', old.id, old.content, old.tags);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS memories_fts_au AFTER UPDATE OF content, tags ON memories BEGIN
+        INSERT INTO memories_fts(memories_fts, rowid, content, tags) VALUES ('delete', old.id, old.content, old.tags);
+        INSERT INTO memories_fts(rowid, content, tags) VALUES (new.id, new.content, new.tags);
+    END
+    ''',
+]
+MEMORY_SEARCH_SQL = f'''
+    SELECT m.id, m.memory_type, m.content, m.importance_score, m.created_at, m.tags,
+           snippet(memories_fts, 0, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}', '…', 16) AS snippet,
+           bm25(memories_fts, 1.0, 0.5) AS score
+    FROM memories_fts JOIN memories m ON m.id = memories_fts.rowid
+    WHERE memories_fts MATCH ? AND m.user_id = ?
+    ORDER BY score
+    LIMIT ?
+'''
+
+# Statements used on the hot path (constant strings -> sqlite statement cache hits)
+INSERT_MEMORY_SQL = '''
+    INSERT INTO memories
+    (user_id, memory_type, content, context, importance_score, tags)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+UPSERT_PROFILE_SQL = '''
+    INSERT INTO user_profiles (user_id, total_conversations, last_interaction)
+    VALUES (?, 1, CURRENT_TIMESTAMP)
+    ON CONFLICT(user_id) DO UPDATE SET
+        total_conversations = total_conversations + 1,
+        last_interaction = CURRENT_TIMESTAMP
+'''
+UPSERT_EMBEDDING_SQL = '''
+    INSERT OR REPLACE INTO memory_embeddings (memory_id, embedding) VALUES (?, ?)
+'''
+LOAD_EMBEDDINGS_SQL = '''
+    SELECT e.memory_id, e.embedding
+    FROM memory_embeddings e JOIN memories m ON m.id = e.memory_id
+    WHERE m.user_id = ?
+'''
+MISSING_EMBEDDINGS_SQL = '''
+    SELECT m.id, m.content FROM memories m
+    WHERE m.user_id = ?
+      AND NOT EXISTS (SELECT 1 FROM memory_embeddings e WHERE e.memory_id = m.id)
+    ORDER BY m.id
+'''
+EMBED_BATCH_SIZE = 64
+# Command words dropped before matching what to forget ("forget that I like tea" -> like tea)
+FORGET_STOP_WORDS = {
+    'forget', 'delete', 'remove', 'zaboravi', 'obriši', 'obrisi', 'please', 'molim',
+    'that', 'about', 'my', 'the', 'a', 'an', 'memory', 'memories', 'what', 'said', 'da', 'sam', 'rekao', 'o', 'moje', 'moj'
+}
+MAX_FORGET = 50
+TOUCH_MEMORY_SQL = '''
+    UPDATE memories
+    SET accessed_count = accessed_count + 1, last_accessed = CURRENT_TIMESTAMP
+    WHERE id = ?
+'''
+
 class MemoryAgent:
     """
     🧠 BRUTALNI MEMORY AGENT 🧠
@@ -55,68 +187,35 @@ class MemoryAgent:
             'conversation_topic': 0.5,
             'system_interaction': 0.3,
             'error_handling': 0.6,
-            'learning_moment': 0.8
+            'learning_moment': 0.8,
+            'conversation_summary': 0.6  # written by the compaction job
         }
         
-        # Initialize memory database
+        # Initialize memory database (WAL, writer thread + reader pool)
+        self.store = MemoryStore(MEMORY_DB_PATH)
         self.memory_db = self._init_memory_db()
         
+        # Semantic search: per-user embedding matrices (EMBEDDING_MODEL_PATH, keyword ranking without it)
+        self.vector_index = MemoryVectorIndex()
+        self._index_load_lock = asyncio.Lock()
+        self._background_tasks = set()
+        
+        # Retention / dedup / summarization job (started from the API startup hook)
+        self.compactor = MemoryCompactor(self)
+        
         logger.info("🧠 Memory Agent initialized with intelligent storage!")
     
     def _init_memory_db(self) -> str:
         """
         🗄️ INITIALIZE MEMORY DATABASE
         """
-        db_path = '/root/MasterCoderAI/backend/memory.db'
+        db_path = self.store.db_path
         
         try:
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            
-            # Create memories table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS memories (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    memory_type TEXT NOT NULL,
-                    content TEXT NOT NULL,
-                    context TEXT,
-                    importance_score REAL NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    accessed_count INTEGER DEFAULT 0,
-                    last_accessed TIMESTAMP,
-                    tags TEXT,
-                    summary TEXT,
-                    related_memories TEXT
-                )
-            ''')
-            
-            # Create user profiles table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_profiles (
-                    user_id INTEGER PRIMARY KEY,
-                    name TEXT,
-                    preferences TEXT,
-                    communication_style TEXT,
-                    expertise_areas TEXT,
-                    common_tasks TEXT,
-                    last_interaction TIMESTAMP,
-                    total_conversations INTEGER DEFAULT 0
-                )
-            ''')
-            
-            # Create memory embeddings table (for semantic search)
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS memory_embeddings (
-                    memory_id INTEGER,
-                    embedding BLOB,
-                    FOREIGN KEY (memory_id) REFERENCES memories (id)
-                )
-            ''')
-            
-            conn.commit()
-            conn.close()
-            
+            self.store.initialize(
+                MEMORY_SCHEMA,
+                setup=lambda conn: ensure_fts(conn, "memories_fts", MEMORY_FTS_SCHEMA)
+            )
             logger.info(f"✅ Memory database initialized: {db_path}")
             return db_path
             
@@ -217,19 +316,14 @@ class MemoryAgent:
             context = json.dumps(user_context)
             tags = self._extract_tags(memory_content)
             
-            # Store in database
-            conn = sqlite3.connect(self.memory_db)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO memories 
-                (user_id, memory_type, content, context, importance_score, tags)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (user_id, memory_type, memory_content, context, importance_score, tags))
+            # Store in database (batched with other queued writes)
+            memory_id = await self.store.execute(
+                INSERT_MEMORY_SQL,
+                (user_id, memory_type, memory_content, context, importance_score, tags)
+            )
             
-            memory_id = cursor.lastrowid
-            conn.commit()
-            conn.close()
+            # Embed for semantic retrieval
+            await self._index_memory(user_id, memory_id, memory_content)
             
             # Update user profile
             await self._update_user_profile(user_id, memory_content, memory_type)
@@ -286,32 +380,47 @@ class MemoryAgent:
             else:  # recent
                 sql_conditions.append("created_at >= datetime('now', '-7 days')")
             
-            # Execute query
-            conn = sqlite3.connect(self.memory_db)
-            cursor = conn.cursor()
-            
-            sql = f'''
-                SELECT id, memory_type, content, importance_score, created_at, tags
-                FROM memories 
-                WHERE {' AND '.join(sql_conditions)}
-                ORDER BY importance_score DESC, created_at DESC
-                LIMIT 20
-            '''
-            
-            cursor.execute(sql, params)
-            results = cursor.fetchall()
-            
-            # Update access count
-            if results:
-                memory_ids = [str(row[0]) for row in results]
-                cursor.execute(f'''
-                    UPDATE memories 
-                    SET accessed_count = accessed_count + 1, last_accessed = CURRENT_TIMESTAMP
-                    WHERE id IN ({','.join(['?'] * len(memory_ids))})
-                ''', memory_ids)
-                conn.commit()
+            # 🧭 Semantic path: cosine top-k over ALL of the user's memories matching the filters
+            semantic_hits = await self._semantic_search(user_id, query, sql_conditions, params) if query else None
+            # 🔎 Otherwise BM25 full-text ranking inside the same filters
+            fulltext_hits = None
+            match = fts_query(query, match_any=True) if query and semantic_hits is None else None
+            if match:
+                fulltext_hits = await self.store.fetch_all(f'''
+                    SELECT m.id, m.memory_type, m.content, m.importance_score, m.created_at, m.tags,
+                           bm25(memories_fts, 1.0, 0.5) AS score
+                    FROM memories_fts JOIN memories m ON m.id = memories_fts.rowid
+                    WHERE memories_fts MATCH ? AND {' AND '.join(sql_conditions)}
+                    ORDER BY score
+                    LIMIT 20
+                ''', [match] + params) or None
+            
+            if semantic_hits is not None:
+                scores = dict(semantic_hits)
+                rows = await self.store.fetch_all(f'''
+                    SELECT id, memory_type, content, importance_score, created_at, tags
+                    FROM memories WHERE id IN ({','.join(['?'] * len(scores))})
+                ''', list(scores)) if scores else []
+                results = sorted(rows, key=lambda row: scores[row[0]], reverse=True)
+            elif fulltext_hits is not None:
+                # bm25() is lower-is-better
+                scores = {row[0]: -row[6] for row in fulltext_hits}
+                results = [row[:6] for row in fulltext_hits]
+            else:
+                # Execute query (reader pool)
+                sql = f'''
+                    SELECT id, memory_type, content, importance_score, created_at, tags
+                    FROM memories 
+                    WHERE {' AND '.join(sql_conditions)}
+                    ORDER BY importance_score DESC, created_at DESC
+                    LIMIT 20
+                '''
+                
+                results = await self.store.fetch_all(sql, params)
             
-            conn.close()
+            # Update access count - queued, no need to wait for the commit
+            for row in results:
+                self.store.execute_background(TOUCH_MEMORY_SQL, (row[0],))
             
             # Format results
             memories = []
@@ -326,7 +435,10 @@ class MemoryAgent:
                 })
             
             # Rank by relevance to current query
-            if query and memories:
+            if semantic_hits is not None or fulltext_hits is not None:
+                for memory in memories:
+                    memory['relevance_score'] = round(scores[memory['id']], 4)
+            elif query and memories:
                 memories = self._rank_by_relevance(memories, query)
             
             return {
@@ -334,6 +446,7 @@ class MemoryAgent:
                 'memories_found': len(memories),
                 'memories': memories,
                 'search_query': query,
+                'search_mode': 'semantic' if semantic_hits is not None else ('fulltext' if fulltext_hits is not None else 'keyword'),
                 'filters_applied': {
                     'memory_type': memory_type,
                     'time_range': time_range
@@ -357,32 +470,28 @@ class MemoryAgent:
         try:
             user_id = user_context.get('user_id', 1)
             
-            conn = sqlite3.connect(self.memory_db)
-            cursor = conn.cursor()
-            
-            # Get user profile
-            cursor.execute('''
-                SELECT name, preferences, communication_style, expertise_areas, 
-                       common_tasks, last_interaction, total_conversations
-                FROM user_profiles WHERE user_id = ?
-            ''', (user_id,))
-            
-            profile_result = cursor.fetchone()
-            
-            # Get memory statistics
-            cursor.execute('''
-                SELECT 
-                    memory_type,
-                    COUNT(*) as count,
-                    AVG(importance_score) as avg_importance
-                FROM memories 
-                WHERE user_id = ?
-                GROUP BY memory_type
-                ORDER BY count DESC
-            ''', (user_id,))
-            
-            memory_stats = cursor.fetchall()
-            conn.close()
+            def read_profile(conn):
+                # Get user profile
+                profile_row = conn.execute('''
+                    SELECT name, preferences, communication_style, expertise_areas, 
+                           common_tasks, last_interaction, total_conversations
+                    FROM user_profiles WHERE user_id = ?
+                ''', (user_id,)).fetchone()
+                
+                # Get memory statistics
+                stats = conn.execute('''
+                    SELECT 
+                        memory_type,
+                        COUNT(*) as count,
+                        AVG(importance_score) as avg_importance
+                    FROM memories 
+                    WHERE user_id = ?
+                    GROUP BY memory_type
+                    ORDER BY count DESC
+                ''', (user_id,)).fetchall()
+                return profile_row, stats
+            
+            profile_result, memory_stats = await self.store.read(read_profile)
             
             # Format profile
             if profile_result:
@@ -432,6 +541,191 @@ class MemoryAgent:
             logger.error(f"❌ Get user profile error: {e}")
             return {'success': False, 'error': str(e)}
     
+    async def _forget_memories(self, intent: Dict, user_context: Dict) -> Dict[str, Any]:
+        """
+        🗑️ FORGET MEMORIES MATCHING THE REQUEST
+        """
+        try:
+            user_id = user_context.get('user_id', 1)
+            words = [word for word in re.findall(r'\w+', intent.get('query', '').lower())
+                     if word not in FORGET_STOP_WORDS]
+            # Every remaining word must match - never wipe memories on a vague request
+            match = fts_query(' '.join(words))
+            if match is None:
+                return {
+                    'success': False,
+                    'error': 'Tell me what to forget',
+                    'examples': ["Forget that I prefer morning meetings", "Zaboravi moj stari email"]
+                }
+            
+            rows = await self.store.fetch_all(MEMORY_SEARCH_SQL, (match, user_id, MAX_FORGET))
+            memory_ids = [row[0] for row in rows]
+            if memory_ids:
+                await self.store.write(delete_memories, memory_ids)
+                index = self.vector_index.get(user_id)
+                if index is not None:
+                    index.remove(memory_ids)
+            
+            return {
+                'success': True,
+                'memories_forgotten': len(memory_ids),
+                'forgotten': [{'id': row[0], 'type': row[1], 'content': row[2]} for row in rows],
+                'message': f"Forgot {len(memory_ids)} memories" if memory_ids else "No matching memories found"
+            }
+            
+        except Exception as e:
+            logger.error(f"❌ Forget memories error: {e}")
+            return {'success': False, 'error': str(e)}
+    
+    async def _summarize_memories(self, intent: Dict, user_context: Dict) -> Dict[str, Any]:
+        """
+        📝 SUMMARIZE RECENT MEMORIES (model summary, extractive without a loaded model)
+        """
+        try:
+            user_id = user_context.get('user_id', 1)
+            since = {'today': '-1 day', 'yesterday': '-2 days', 'month': '-30 days'}.get(intent.get('time_range'), '-7 days')
+            rows = await self.store.fetch_all('''
+                SELECT id, memory_type, content, importance_score, created_at
+                FROM memories
+                WHERE user_id = ? AND created_at >= datetime('now', ?)
+                ORDER BY importance_score DESC, created_at DESC
+                LIMIT 30
+            ''', (user_id, since))
+            if not rows:
+                return {'success': True, 'summary': "No memories in this period yet.", 'memories_used': 0}
+            
+            breakdown: Dict[str, int] = {}
+            for row in rows:
+                breakdown[row[1]] = breakdown.get(row[1], 0) + 1
+            
+            from inference.worker import inference_worker
+            summary, mode = None, 'extractive'
+            if inference_worker.model is not None:
+                notes = "\n".join(f"- [{row[1]}] {row[2][:300]}" for row in sorted(rows, key=lambda row: row[4]))
+                result = await inference_worker.generate(
+                    SUMMARY_PROMPT.format(notes=notes), user_id=user_id, max_tokens=256, temperature=0.2
+                )
+                summary = result["choices"][0]["text"].strip() or None
+                mode = 'model'
+            if summary is None:
+                mode = 'extractive'
+                summary = "\n".join(f"• {row[2][:200]}" for row in rows[:5])
+            
+            return {
+                'success': True,
+                'summary': summary,
+                'summary_mode': mode,
+                'memories_used': len(rows),
+                'memory_breakdown': breakdown,
+                'time_range': intent.get('time_range')
+            }
+            
+        except Exception as e:
+            logger.error(f"❌ Summarize memories error: {e}")
+            return {'success': False, 'error': str(e)}
+    
+    async def search_memories(self, user_id: int, query: str, limit: int = 20) -> Dict[str, Any]:
+        """
+        🔎 FULL-TEXT MEMORY SEARCH (BM25 + highlighted snippets, all time ranges / types)
+        """
+        match = fts_query(query)
+        if match is None:
+            return {'success': False, 'error': 'Search query has no searchable words'}
+        rows = await self.store.fetch_all(MEMORY_SEARCH_SQL, (match, user_id, max(1, min(limit, 100))))
+        return {
+            'success': True,
+            'search_query': query,
+            'memories_found': len(rows),
+            'memories': [
+                {
+                    'id': row[0],
+                    'type': row[1],
+                    'content': row[2],
+                    'importance_score': row[3],
+                    'created_at': row[4],
+                    'tags': row[5].split(',') if row[5] else [],
+                    'snippet': row[6],
+                    'relevance_score': round(-row[7], 4)
+                }
+                for row in rows
+            ]
+        }
+    
+    # ==================== SEMANTIC INDEX ====================
+    async def _embed(self, texts: List[str]):
+        """Normalized float32 vectors, None without an embedding model"""
+        if not text_embedder.available:
+            return None
+        return await asyncio.to_thread(text_embedder.embed, texts)
+    
+    async def _index_memory(self, user_id: int, memory_id: int, content: str):
+        """Embed a stored memory into memory_embeddings + the in-memory index"""
+        try:
+            vectors = await self._embed([content])
+            if vectors is None:
+                return
+            await self.store.execute(UPSERT_EMBEDDING_SQL, (memory_id, to_blob(vectors[0])))
+            index = self.vector_index.get(user_id)
+            if index is not None and index.dim == vectors.shape[1]:
+                index.add([memory_id], vectors)
+        except Exception as e:
+            # Memory is stored either way - it gets embedded by the backfill later
+            logger.warning(f"⚠️ Memory embedding failed: {e}")
+    
+    async def _user_index(self, user_id: int, dim: int) -> UserVectorIndex:
+        """Per-user index, loaded from memory_embeddings on first use"""
+        index = self.vector_index.get(user_id)
+        if index is not None and index.dim == dim:
+            return index
+        async with self._index_load_lock:
+            index = self.vector_index.get(user_id)
+            if index is not None and index.dim == dim:
+                return index
+            rows = await self.store.fetch_all(LOAD_EMBEDDINGS_SQL, (user_id,))
+            # Vectors from a different embedding model (other dim) are ignored and re-embedded
+            rows = [(memory_id, from_blob(blob)) for memory_id, blob in rows if len(blob) == dim * 4]
+            index = UserVectorIndex(dim, capacity=max(64, len(rows)))
+            if rows:
+                index.add([memory_id for memory_id, _ in rows], [vector for _, vector in rows])
+            self.vector_index.put(user_id, index)
+        
+        # Memories stored before the embedding model was configured
+        task = asyncio.create_task(self._backfill_embeddings(user_id, index))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return index
+    
+    async def _backfill_embeddings(self, user_id: int, index: UserVectorIndex):
+        try:
+            rows = await self.store.fetch_all(MISSING_EMBEDDINGS_SQL, (user_id,))
+            rows = [row for row in rows if row[0] not in index]
+            for start in range(0, len(rows), EMBED_BATCH_SIZE):
+                chunk = rows[start:start + EMBED_BATCH_SIZE]
+                vectors = await self._embed([content for _, content in chunk])
+                if vectors is None:
+                    return
+                blobs = [(memory_id, to_blob(vector)) for (memory_id, _), vector in zip(chunk, vectors)]
+                await self.store.write(lambda conn: conn.executemany(UPSERT_EMBEDDING_SQL, blobs))
+                index.add([memory_id for memory_id, _ in chunk], vectors)
+            if rows:
+                logger.info(f"🧭 Embedded {len(rows)} older memories for user {user_id}")
+        except Exception as e:
+            logger.warning(f"⚠️ Memory embedding backfill failed: {e}")
+    
+    async def _semantic_search(self, user_id: int, query: str, sql_conditions: List[str],
+                               params: List, k: int = 20) -> Optional[List[tuple]]:
+        """[(memory_id, cosine)] for memories matching the SQL filters, None = no embeddings (keyword fallback)"""
+        query_vectors = await self._embed([query])
+        if query_vectors is None:
+            return None
+        index = await self._user_index(user_id, query_vectors.shape[1])
+        if not len(index):
+            return None
+        candidates = await self.store.fetch_all(
+            f"SELECT id FROM memories WHERE {' AND '.join(sql_conditions)}", params
+        )
+        return index.search(query_vectors[0], k=k, candidates=(row[0] for row in candidates))
+    
     def _calculate_importance(self, content: str, memory_type: str) -> float:
         """
         📊 CALCULATE MEMORY IMPORTANCE SCORE
@@ -494,30 +788,8 @@ class MemoryAgent:
         👤 UPDATE USER PROFILE BASED ON NEW MEMORY
         """
         try:
-            conn = sqlite3.connect(self.memory_db)
-            cursor = conn.cursor()
-            
-            # Check if profile exists
-            cursor.execute('SELECT total_conversations FROM user_profiles WHERE user_id = ?', (user_id,))
-            result = cursor.fetchone()
-            
-            if result:
-                # Update existing profile
-                new_conversation_count = result[0] + 1
-                cursor.execute('''
-                    UPDATE user_profiles 
-                    SET total_conversations = ?, last_interaction = CURRENT_TIMESTAMP
-                    WHERE user_id = ?
-                ''', (new_conversation_count, user_id))
-            else:
-                # Create new profile
-                cursor.execute('''
-                    INSERT INTO user_profiles (user_id, total_conversations, last_interaction)
-                    VALUES (?, 1, CURRENT_TIMESTAMP)
-                ''', (user_id,))
-            
-            conn.commit()
-            conn.close()
+            # Create or bump the profile in one statement (no read-modify-write race)
+            await self.store.execute(UPSERT_PROFILE_SQL, (user_id,))
             
         except Exception as e:
             logger.error(f"❌ Update user profile error: {e}")
@@ -553,16 +825,15 @@ class MemoryAgent:
         """
         try:
             # Test database connection
-            conn = sqlite3.connect(self.memory_db)
-            cursor = conn.cursor()
-            cursor.execute('SELECT COUNT(*) FROM memories')
-            total_memories = cursor.fetchone()[0]
-            conn.close()
+            total_memories = (await self.store.fetch_one('SELECT COUNT(*) FROM memories'))[0]
             
             return {
                 'status': 'healthy',
                 'database_connected': True,
                 'total_memories_stored': total_memories,
+                'storage': self.store.get_stats(),
+                'semantic_index': dict(self.vector_index.get_stats(), embeddings=text_embedder.get_stats()),
+                'compaction': self.compactor.get_status(),
                 'memory_enabled': self.memory_config['enabled'],
                 'capabilities_active': len(self.capabilities),
                 'last_check': datetime.now().isoformat()
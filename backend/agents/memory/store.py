@@ -0,0 +1,262 @@
+"""
+🗄️ MEMORY STORE - ASYNC SQLITE LAYER FOR memory.db 🗄️
+- WAL journal: readers never block the writer and vice versa
+- Single writer thread: writes are queued and committed in batches
+  (one transaction per batch, SAVEPOINT per write so one bad write
+  doesn't roll back the others)
+- Reader pool: MEMORY_DB_READERS threads, each with its own long-lived connection
+- Prepared statements: every connection keeps a statement cache
+  (sqlite3 cached_statements), SQL strings are constants so they hit it
+- Nothing runs on the event loop - callers await futures
+"""
+
+import asyncio
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+MEMORY_DB_READERS = int(os.getenv("MEMORY_DB_READERS", "4"))
+# Max writes committed in one transaction
+MEMORY_DB_WRITE_BATCH = int(os.getenv("MEMORY_DB_WRITE_BATCH", "64"))
+STATEMENT_CACHE_SIZE = 256
+BUSY_TIMEOUT_MS = 5000
+
+_STOP = object()
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    # isolation_level=None: we issue BEGIN / SAVEPOINT ourselves
+    conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA synchronous = NORMAL")  # safe with WAL, fsync only at checkpoints
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+
+def _resolve(future: asyncio.Future, result: Any, error: Optional[BaseException]):
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class _WriteOp:
+    __slots__ = ("fn", "args", "future", "loop", "exclusive")
+
+    def __init__(self, fn: Callable, args: tuple, future: Optional[asyncio.Future],
+                 loop: Optional[asyncio.AbstractEventLoop], exclusive: bool = False):
+        self.fn = fn
+        self.args = args
+        self.future = future
+        self.loop = loop
+        # Runs alone, outside any transaction (VACUUM can't run inside one)
+        self.exclusive = exclusive
+
+
+class MemoryStore:
+    """Shared async access to memory.db (one writer thread + reader pool)"""
+
+    def __init__(self, db_path: str, readers: int = MEMORY_DB_READERS,
+                 write_batch: int = MEMORY_DB_WRITE_BATCH):
+        self.db_path = db_path
+        self.write_batch = write_batch
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="memory-db-read")
+        self._reader_local = threading.local()
+        self._reader_connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._write_queue: "queue.Queue" = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_lock = threading.Lock()
+
+        # Stats
+        self.reads = 0
+        self.writes = 0
+        self.write_errors = 0
+        self.batches = 0
+        self.max_batch = 0
+        self.write_seconds = 0.0
+
+    # ==================== SETUP ====================
+    def initialize(self, schema: Iterable[str], setup: Optional[Callable[[sqlite3.Connection], Any]] = None):
+        """Create tables / indexes and switch the file to WAL (blocking, call once); setup(conn) runs last"""
+        conn = _connect(self.db_path)
+        try:
+            mode = conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+            for statement in schema:
+                conn.execute(statement)
+            if setup is not None:
+                setup(conn)
+        finally:
+            conn.close()
+        logger.info(f"🗄️ memory.db ready ({mode} journal, {self._readers._max_workers} readers)")
+
+    def close(self):
+        """Flush pending writes and close all connections (blocking)"""
+        if self._writer is not None and self._writer.is_alive():
+            self._write_queue.put(_STOP)
+            self._writer.join(timeout=10)
+        self._readers.shutdown(wait=True)
+        with self._connections_lock:
+            for conn in self._reader_connections:
+                conn.close()
+            self._reader_connections.clear()
+
+    # ==================== READS ====================
+    def _reader_connection(self) -> sqlite3.Connection:
+        conn = getattr(self._reader_local, "conn", None)
+        if conn is None:
+            conn = _connect(self.db_path)
+            conn.execute("PRAGMA query_only = 1")
+            self._reader_local.conn = conn
+            with self._connections_lock:
+                self._reader_connections.append(conn)
+        return conn
+
+    def _run_read(self, fn: Callable, args: tuple):
+        self.reads += 1
+        return fn(self._reader_connection(), *args)
+
+    async def read(self, fn: Callable[..., Any], *args) -> Any:
+        """fn(conn, *args) on a pooled read connection"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, self._run_read, fn, args)
+
+    async def fetch_all(self, sql: str, params: Sequence = ()) -> List[tuple]:
+        return await self.read(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def fetch_one(self, sql: str, params: Sequence = ()) -> Optional[tuple]:
+        return await self.read(lambda conn: conn.execute(sql, params).fetchone())
+
+    # ==================== WRITES ====================
+    def _ensure_writer(self):
+        if self._writer is not None and self._writer.is_alive():
+            return
+        with self._writer_lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, name="memory-db-write", daemon=True)
+                self._writer.start()
+
+    async def write(self, fn: Callable[..., Any], *args) -> Any:
+        """fn(conn, *args) on the writer connection; resolves after the batch is committed"""
+        self._ensure_writer()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._write_queue.put(_WriteOp(fn, args, future, loop))
+        return await future
+
+    async def execute(self, sql: str, params: Sequence = ()) -> int:
+        """Single write statement, returns lastrowid"""
+        return await self.write(lambda conn: conn.execute(sql, params).lastrowid)
+
+    async def maintenance(self, fn: Callable[..., Any], *args) -> Any:
+        """fn(conn, *args) on the writer connection in autocommit mode (VACUUM, ANALYZE, checkpoints)"""
+        self._ensure_writer()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._write_queue.put(_WriteOp(fn, args, future, loop, exclusive=True))
+        return await future
+
+    def execute_background(self, sql: str, params: Sequence = ()):
+        """Fire-and-forget write (counters, access stats) - errors are only logged"""
+        self._ensure_writer()
+        self._write_queue.put(_WriteOp(lambda conn: conn.execute(sql, params), (), None, None))
+
+    def _write_loop(self):
+        conn = _connect(self.db_path)
+        try:
+            while True:
+                op = self._write_queue.get()
+                if op is _STOP:
+                    return
+                if op.exclusive:
+                    self._run_exclusive(conn, op)
+                    continue
+                batch = [op]
+                stop = False
+                exclusive = None
+                # Whatever queued up while we were busy goes into the same transaction
+                while len(batch) < self.write_batch:
+                    try:
+                        op = self._write_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if op is _STOP:
+                        stop = True
+                        break
+                    if op.exclusive:
+                        exclusive = op
+                        break
+                    batch.append(op)
+                self._commit_batch(conn, batch)
+                if exclusive is not None:
+                    self._run_exclusive(conn, exclusive)
+                if stop:
+                    return
+        finally:
+            conn.close()
+
+    def _commit_batch(self, conn: sqlite3.Connection, batch: List[_WriteOp]):
+        started = time.perf_counter()
+        outcomes = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for op in batch:
+                conn.execute("SAVEPOINT write_op")
+                try:
+                    result = op.fn(conn, *op.args)
+                    conn.execute("RELEASE write_op")
+                    outcomes.append((op, result, None))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write_op")
+                    conn.execute("RELEASE write_op")
+                    outcomes.append((op, None, e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            # BEGIN/COMMIT itself failed (disk full, locked past busy_timeout...) - whole batch fails
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            outcomes = [(op, None, e) for op in batch]
+
+        self.batches += 1
+        self.max_batch = max(self.max_batch, len(batch))
+        self.write_seconds += time.perf_counter() - started
+        for op, result, error in outcomes:
+            self.writes += 1
+            if error is not None:
+                self.write_errors += 1
+            if op.future is not None:
+                op.loop.call_soon_threadsafe(_resolve, op.future, result, error)
+            elif error is not None:
+                logger.warning(f"⚠️ Background memory write failed: {error}")
+
+    def _run_exclusive(self, conn: sqlite3.Connection, op: _WriteOp):
+        result, error = None, None
+        try:
+            result = op.fn(conn, *op.args)
+        except Exception as e:
+            error = e
+        op.loop.call_soon_threadsafe(_resolve, op.future, result, error)
+
+    def get_stats(self) -> dict:
+        return {
+            "db_path": self.db_path,
+            "readers": self._readers._max_workers,
+            "reads": self.reads,
+            "writes": self.writes,
+            "write_errors": self.write_errors,
+            "write_batches": self.batches,
+            "avg_batch_size": round(self.writes / self.batches, 2) if self.batches else 0.0,
+            "max_batch_size": self.max_batch,
+            "pending_writes": self._write_queue.qsize(),
+            "avg_commit_ms": round(self.write_seconds / self.batches * 1000, 2) if self.batches else 0.0
+        }
@@ -0,0 +1,117 @@
+"""
+🧭 MEMORY VECTOR INDEX - SEMANTIC SEARCH OVER memory_embeddings 🧭
+- One in-memory float32 matrix per user (loaded from memory_embeddings on first use)
+- Vectors are L2-normalized, so cosine similarity = one matrix-vector product
+- Top-k with argpartition (no full sort) - sub-millisecond for 10k x 384
+- Appends are amortized (capacity doubles), removals compact the matrix
+"""
+
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+def to_blob(vector: np.ndarray) -> bytes:
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def from_blob(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype=np.float32)
+
+
+class UserVectorIndex:
+    """Embeddings of one user's memories"""
+
+    def __init__(self, dim: int, capacity: int = 64):
+        self.dim = dim
+        self._ids = np.empty(capacity, dtype=np.int64)
+        self._matrix = np.empty((capacity, dim), dtype=np.float32)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, memory_id: int) -> bool:
+        with self._lock:
+            return bool(np.any(self._ids[:self._size] == memory_id))
+
+    def add(self, memory_ids: Iterable[int], vectors: np.ndarray):
+        memory_ids = np.asarray(list(memory_ids), dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(memory_ids), -1)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding dim {vectors.shape[1]} != index dim {self.dim}")
+        with self._lock:
+            # Re-adding a memory replaces its vector
+            self._remove_locked(memory_ids)
+            needed = self._size + len(memory_ids)
+            if needed > len(self._ids):
+                capacity = max(needed, len(self._ids) * 2)
+                self._ids = np.resize(self._ids, capacity)
+                matrix = np.empty((capacity, self.dim), dtype=np.float32)
+                matrix[:self._size] = self._matrix[:self._size]
+                self._matrix = matrix
+            self._ids[self._size:needed] = memory_ids
+            self._matrix[self._size:needed] = vectors
+            self._size = needed
+
+    def remove(self, memory_ids: Iterable[int]) -> int:
+        with self._lock:
+            return self._remove_locked(np.asarray(list(memory_ids), dtype=np.int64))
+
+    def _remove_locked(self, memory_ids: np.ndarray) -> int:
+        if not self._size or not len(memory_ids):
+            return 0
+        keep = ~np.isin(self._ids[:self._size], memory_ids)
+        removed = self._size - int(keep.sum())
+        if removed:
+            kept = int(keep.sum())
+            self._ids[:kept] = self._ids[:self._size][keep]
+            self._matrix[:kept] = self._matrix[:self._size][keep]
+            self._size = kept
+        return removed
+
+    def search(self, query: np.ndarray, k: int = 20,
+               candidates: Optional[Iterable[int]] = None) -> List[Tuple[int, float]]:
+        """[(memory_id, cosine)] best first; `candidates` limits the search to those ids (SQL filters)"""
+        with self._lock:
+            ids = self._ids[:self._size]
+            scores = self._matrix[:self._size] @ np.asarray(query, dtype=np.float32)
+            if candidates is not None:
+                mask = np.isin(ids, np.fromiter(candidates, dtype=np.int64))
+                ids, scores = ids[mask], scores[mask]
+            if not len(ids):
+                return []
+            k = min(k, len(ids))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(int(ids[i]), float(scores[i])) for i in top]
+
+
+class MemoryVectorIndex:
+    """user_id -> UserVectorIndex (loaded lazily by the memory agent)"""
+
+    def __init__(self):
+        self._users: Dict[int, UserVectorIndex] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[UserVectorIndex]:
+        with self._lock:
+            return self._users.get(user_id)
+
+    def put(self, user_id: int, index: UserVectorIndex):
+        with self._lock:
+            self._users[user_id] = index
+
+    def drop(self, user_id: int):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "users_loaded": len(self._users),
+                "vectors": sum(len(index) for index in self._users.values()),
+                "memory_mb": round(sum(index._matrix.nbytes for index in self._users.values()) / 1e6, 2)
+            }
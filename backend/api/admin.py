@@ -2,7 +2,8 @@
 """
 Admin Routes - User Management, System Monitoring, Chat History
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
@@ -16,6 +17,14 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 from db.database import database
 from api.models import users, chats, user_settings, tasks
 from api.auth import get_current_user
+from db.chat_stats import users_with_chat_counts
+from db.chat_history import fetch_chat_page, CursorError
+from api.responses import compact_json_response, next_page_headers
+from db.export import chat_batches, check_format, encode, export_filename, ExportError, CHAT_EXPORT_COLUMNS, EXPORT_MEDIA_TYPES
+from inference.response_cache import response_cache
+from inference.context import context_builder
+from inference.embeddings import text_embedder
+from inference.catalog import model_catalog
 from werkzeug.security import generate_password_hash
 import psutil
 
@@ -109,23 +118,18 @@ async def get_system_stats(current_user=Depends(require_admin)):
 async def get_all_users(current_user=Depends(require_admin)):
     """Get all users with chat counts"""
     try:
-        # Fetch all users
-        query = users.select()
-        user_list = await database.fetch_all(query)
+        # Users + chat counts in one query (GROUP BY over the covering index)
+        user_list = await users_with_chat_counts()
         
         result = []
         for user in user_list:
-            # Get chat count for this user using SQLAlchemy query
-            count_query = chats.select().where(chats.c.user_id == user["id"])
-            count_result = await database.fetch_all(count_query)
-            chat_count = len(count_result)
-            
             result.append({
                 "id": user["id"],
                 "username": user["username"],
                 "is_admin": bool(user["is_admin"]),
                 "created_at": str(user["created_at"]) if user["created_at"] else None,
-                "total_chats": chat_count
+                "total_chats": user["total_chats"],
+                "last_chat_at": str(user["last_chat_at"]) if user["last_chat_at"] else None
             })
         
         return result
@@ -220,70 +224,54 @@ async def delete_user(user_id: int, current_user=Depends(require_admin)):
 
 # ==================== CHAT HISTORY (ALL USERS) ====================
 @router.get("/chats")
-async def get_all_chats(current_user=Depends(require_admin), limit: int = 100):
-    """Get chat history from all users"""
-    query = (
-        chats.select()
-        .order_by(chats.c.timestamp.desc())
-        .limit(limit)
-    )
-    rows = await database.fetch_all(query)
+async def get_all_chats(
+    request: Request,
+    current_user=Depends(require_admin),
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    fields: str = "full",
+    user_id: Optional[int] = None
+):
+    """
+    Get chat history from all users (username via JOIN)
+    Newest first, keyset paged: pass the X-Next-Cursor response header back as ?cursor=
+    fields: full | preview (first 100 chars) | meta (no text)
+    """
+    try:
+        rows, next_cursor = await fetch_chat_page(user_id, cursor=cursor, limit=limit, fields=fields)
+    except CursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    result = []
-    for row in rows:
-        # Get username
-        user_query = users.select().where(users.c.id == row["user_id"])
-        user_row = await database.fetch_one(user_query)
-        username = user_row["username"] if user_row else "Unknown"
-        
-        result.append({
+    payload = [
+        {
             "id": row["id"],
             "user_id": row["user_id"],
-            "username": username,
+            "username": row["username"] or "Unknown",
             "message": row["message"],
             "response": row["response"],
             "model_name": row["model_name"],
             "timestamp": str(row["timestamp"])
-        })
-    
-    return result
-
-@router.get("/chats")
-async def get_all_chats(current_user=Depends(require_admin)):
-    """Get all chats with user info"""
-    query = """
-        SELECT c.id, c.user_id, c.message, c.response, c.model_name, c.timestamp, u.username
-        FROM chats c
-        LEFT JOIN users u ON c.user_id = u.id
-        ORDER BY c.timestamp DESC
-        LIMIT 1000
-    """
-    rows = await database.fetch_all(query)
-    return [
-        {
-            "id": row["id"],
-            "user_id": row["user_id"],
-            "username": row["username"],
-            "message": row["message"][:100] if row["message"] else "",  # First 100 chars
-            "response": row["response"][:100] if row["response"] else "",  # First 100 chars
-            "model_name": row["model_name"],
-            "timestamp": str(row["timestamp"])
         }
         for row in rows
     ]
+    return compact_json_response(request, payload, next_page_headers(request, next_cursor))
 
 @router.delete("/chats/all")
 async def delete_all_chats(current_user=Depends(require_admin)):
     """Delete ALL chats from database (ADMIN ONLY)"""
     delete_query = chats.delete()
     result = await database.execute(delete_query)
+    context_builder.invalidate()
     return {"message": "All chats deleted from database", "deleted_count": result}
 
 @router.delete("/chats/{chat_id}")
 async def delete_chat(chat_id: int, current_user=Depends(require_admin)):
     """Delete specific chat"""
+    owner = await database.fetch_one(chats.select().with_only_columns(chats.c.user_id).where(chats.c.id == chat_id))
     delete_query = chats.delete().where(chats.c.id == chat_id)
     await database.execute(delete_query)
+    if owner:
+        context_builder.invalidate(owner["user_id"])
     return {"message": "Chat deleted successfully"}
 
 @router.delete("/chats/user/{user_id}")
@@ -291,4 +279,57 @@ async def delete_user_chats(user_id: int, current_user=Depends(require_admin)):
     """Delete all chats from specific user"""
     delete_query = chats.delete().where(chats.c.user_id == user_id)
     await database.execute(delete_query)
+    context_builder.invalidate(user_id)
     return {"message": f"All chats from user {user_id} deleted successfully"}
+
+# ==================== EXPORT ====================
+@router.get("/export/chats")
+async def export_chats(
+    current_user=Depends(require_admin),
+    format: str = "ndjson",
+    user_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+):
+    """
+    Stream chat history as ndjson / csv / parquet (oldest first)
+    Read in keyset batches - memory use is the same for 1k or 10M rows
+    since/until filter on the chat timestamp (since inclusive, until exclusive)
+    """
+    try:
+        check_format(format)
+    except ExportError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    stream = encode(format, chat_batches(user_id=user_id, since=since, until=until), CHAT_EXPORT_COLUMNS)
+    return StreamingResponse(
+        stream,
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{export_filename("chats", format)}"'}
+    )
+
+# ==================== RESPONSE CACHE ====================
+@router.get("/cache/responses")
+async def get_response_cache_stats(current_user=Depends(require_admin)):
+    """Chat response cache hit/miss counters (exact + semantic tier)"""
+    stats = response_cache.get_stats()
+    stats["embeddings"] = text_embedder.get_stats()
+    return stats
+
+@router.delete("/cache/responses")
+async def clear_response_cache(model_name: Optional[str] = None, current_user=Depends(require_admin)):
+    """Drop cached responses (all, or only one model's)"""
+    removed = response_cache.clear(model_name)
+    return {"message": "Response cache cleared", "removed": removed}
+
+# ==================== MODEL CATALOG ====================
+@router.get("/catalog")
+async def get_model_catalog(current_user=Depends(require_admin)):
+    """Indexed models with parsed GGUF metadata + watcher status"""
+    return {"status": model_catalog.get_status(), "models": model_catalog.list()}
+
+@router.post("/catalog/rescan")
+async def rescan_model_catalog(current_user=Depends(require_admin)):
+    """Force a directory rescan (e.g. models copied to a filesystem inotify can't see)"""
+    summary = await model_catalog.rescan()
+    return {"message": "Model catalog rescanned", **summary}
@@ -0,0 +1,190 @@
+"""
+🌐 SHARED HTTP CLIENT - one pooled aiohttp session for outbound requests 🌐
+- Keep-alive connection pool shared by all callers (HTTP_POOL_SIZE connections total)
+- At most HTTP_PER_HOST_CONCURRENCY requests in flight per host; extra requests wait for a
+  slot before their timeout starts, so a burst of tasks against one site queues instead of timing out
+- Timeouts: HTTP_CONNECT_TIMEOUT_SECONDS to connect, HTTP_TIMEOUT_SECONDS for the whole request
+- Retries (HTTP_RETRIES) with exponential backoff + jitter on connection errors, timeouts,
+  429 and 5xx; Retry-After is honoured
+- Bodies are read in chunks up to max_bytes (HTTP_MAX_RESPONSE_BYTES) - anything beyond is
+  dropped and the response is flagged truncated, nothing bigger is ever buffered
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+from multidict import CIMultiDict
+
+logger = logging.getLogger(__name__)
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "100"))
+HTTP_PER_HOST_CONCURRENCY = int(os.getenv("HTTP_PER_HOST_CONCURRENCY", "4"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "15"))
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", "2"))
+HTTP_MAX_RESPONSE_BYTES = int(os.getenv("HTTP_MAX_RESPONSE_BYTES", str(5 * 1024 * 1024)))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 10.0
+READ_CHUNK_BYTES = 64 * 1024
+DEFAULT_HEADERS = {"User-Agent": "MasterCoderAI/2.0 (task automation)"}
+
+
+class HttpResponse:
+    """
+    Status, headers and the (possibly truncated) body of a finished request
+    (headers keep aiohttp's case-insensitive lookup: headers.get('content-type') works)
+    """
+
+    def __init__(self, url: str, status: int, headers: CIMultiDict, body: bytes,
+                 truncated: bool, elapsed_ms: float, attempts: int, charset: Optional[str]):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.truncated = truncated
+        self.elapsed_ms = elapsed_ms
+        self.attempts = attempts
+        self.charset = charset
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status < 300
+
+    @property
+    def text(self) -> str:
+        return self.body.decode(self.charset or "utf-8", errors="replace")
+
+    def json(self) -> Any:
+        return json.loads(self.body)
+
+
+class HttpClient:
+    """Lazily created shared aiohttp session (created on first use inside the event loop)"""
+
+    def __init__(self, pool_size: int = HTTP_POOL_SIZE, per_host: int = HTTP_PER_HOST_CONCURRENCY,
+                 timeout: float = HTTP_TIMEOUT_SECONDS, connect_timeout: float = HTTP_CONNECT_TIMEOUT_SECONDS,
+                 retries: int = HTTP_RETRIES, max_bytes: int = HTTP_MAX_RESPONSE_BYTES):
+        self.pool_size = pool_size
+        self.per_host = per_host
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.retries = retries
+        self.max_bytes = max_bytes
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+
+        # Stats
+        self.requests = 0
+        self.retried = 0
+        self.failures = 0
+        self.truncated = 0
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.per_host,
+                                             ttl_dns_cache=300, enable_cleanup_closed=True)
+            self._session = aiohttp.ClientSession(connector=connector, headers=DEFAULT_HEADERS)
+            self._host_slots = {}
+        return self._session
+
+    async def close(self):
+        """Close the pool (call at shutdown)"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    # ==================== REQUESTS ====================
+    async def get(self, url: str, **kwargs) -> HttpResponse:
+        return await self.request("GET", url, **kwargs)
+
+    async def request(self, method: str, url: str, headers: Optional[Dict[str, str]] = None,
+                      timeout: Optional[float] = None, retries: Optional[int] = None,
+                      max_bytes: Optional[int] = None, **kwargs) -> HttpResponse:
+        """
+        Send a request through the shared pool.
+        Returns the last response (even a 5xx after all retries); raises aiohttp.ClientError /
+        asyncio.TimeoutError only when no response was received at all.
+        """
+        session = self._get_session()
+        retries = self.retries if retries is None else retries
+        client_timeout = aiohttp.ClientTimeout(total=timeout or self.timeout, sock_connect=self.connect_timeout)
+        host = urlsplit(url).netloc.lower()
+        slot = self._host_slots.setdefault(host, asyncio.Semaphore(self.per_host))
+        self.requests += 1
+
+        for attempt in range(retries + 1):
+            retry_after = None
+            try:
+                async with slot:
+                    started = time.perf_counter()
+                    async with session.request(method, url, headers=headers, timeout=client_timeout, **kwargs) as response:
+                        if response.status in RETRY_STATUSES and attempt < retries:
+                            retry_after = response.headers.get("Retry-After")
+                            reason = f"HTTP {response.status}"
+                        else:
+                            return await self._read(response, url, started, attempt + 1, max_bytes or self.max_bytes)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= retries:
+                    self.failures += 1
+                    raise
+                reason = f"{type(e).__name__}: {e}"
+
+            delay = self._backoff(attempt, retry_after)
+            self.retried += 1
+            logger.warning(f"🌐 {method} {url} failed ({reason}), retry {attempt + 1}/{retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def _read(self, response: aiohttp.ClientResponse, url: str, started: float,
+                    attempts: int, max_bytes: int) -> HttpResponse:
+        chunks = []
+        size = 0
+        truncated = False
+        async for chunk in response.content.iter_chunked(READ_CHUNK_BYTES):
+            if size + len(chunk) > max_bytes:
+                chunks.append(chunk[:max_bytes - size])
+                truncated = True
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+        if truncated:
+            self.truncated += 1
+        return HttpResponse(
+            url=str(response.url), status=response.status, headers=CIMultiDict(response.headers),
+            body=b"".join(chunks), truncated=truncated,
+            elapsed_ms=round((time.perf_counter() - started) * 1000, 1),
+            attempts=attempts, charset=response.charset
+        )
+
+    @staticmethod
+    def _backoff(attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after:
+            try:
+                return min(float(retry_after), BACKOFF_MAX_SECONDS * 3)
+            except ValueError:
+                pass  # HTTP-date form - fall back to our own backoff
+        delay = min(BACKOFF_BASE_SECONDS * (2 ** attempt), BACKOFF_MAX_SECONDS)
+        return delay * random.uniform(0.5, 1.0)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'requests': self.requests,
+            'retried': self.retried,
+            'failures': self.failures,
+            'truncated': self.truncated,
+            'hosts': len(self._host_slots),
+            'pool_size': self.pool_size,
+            'per_host_concurrency': self.per_host
+        }
+
+
+# 🎯 GLOBAL HTTP CLIENT INSTANCE
+http_client = HttpClient()
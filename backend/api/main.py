@@ -32,6 +32,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Link"],  # chat history paging cursor
 )
 
 # Database lifecycle
@@ -40,8 +41,61 @@ async def startup():
     await database.connect()
     print("✅ Database connected")
     
+    # ⚡ Start inference worker thread (owns the Llama instance)
+    from inference.worker import inference_worker
+    inference_worker.start()
+    
+    # 📚 Model catalog: persisted GGUF headers + directory watcher (rescans in the background)
+    from inference.catalog import model_catalog
+    await model_catalog.start()
+    
+    # 🔎 Full-text index for chat history (created + backfilled once, then kept in sync by triggers)
+    try:
+        import asyncio
+        from db.fts import ensure_chat_fts
+        if await asyncio.to_thread(ensure_chat_fts):
+            print("🔎 chats_fts created and indexed")
+    except Exception as e:
+        print(f"⚠️ Chat full-text index setup failed: {e}")
+    
+    # 📊 Covering index for chat counts / per-user history
+    try:
+        from db.chat_stats import ensure_chat_indexes
+        if await asyncio.to_thread(ensure_chat_indexes):
+            print("📊 chats (user_id, timestamp) index created")
+    except Exception as e:
+        print(f"⚠️ Chat index setup failed: {e}")
+    
+    # 🏎️ system_settings columns added after the first schema (speculative_*) - before anything selects it
+    try:
+        from db.settings_migration import migrate_system_settings
+        added = await asyncio.to_thread(migrate_system_settings)
+        if added:
+            print(f"🗂️ system_settings migrated, added columns: {', '.join(added)}")
+    except Exception as e:
+        print(f"⚠️ system_settings migration failed: {e}")
+    
+    # 🧹 Memory retention / compaction job (first run delayed, then every MEMORY_COMPACTION_INTERVAL_HOURS)
+    from agents.core.agent_dispatcher import dispatcher
+    dispatcher.agents['memory'].compactor.start()
+    
+    # 🔄 Agent job registry (interrupted jobs marked, queued ones resumed)
+    try:
+        await dispatcher.jobs.start()
+    except Exception as e:
+        print(f"⚠️ Agent job registry start failed: {e}")
+    
+    # 🗂️ Automation tasks (/tasks): idle / running ones from before the restart are picked up again
+    try:
+        from api.tasks import resume_tasks
+        resumed = await resume_tasks()
+        if resumed:
+            print(f"🗂️ Resumed {resumed} automation tasks")
+    except Exception as e:
+        print(f"⚠️ Task resume failed: {e}")
+    
     # Mark database as initialized
-    from api.system import SERVER_INITIALIZATION_STATE
+    from api.system import SERVER_INITIALIZATION_STATE, set_component_status
     SERVER_INITIALIZATION_STATE["components"]["database"] = {
         "status": "success",
         "timestamp": datetime.now().isoformat(),
@@ -81,6 +135,7 @@ async def startup():
                     "timestamp": datetime.now().isoformat(),
                     "message": f"Model {model_name} not found"
                 }
+                set_component_status("warmup", "warning", "Skipped - no model loaded")
         else:
             # No auto-load
             SERVER_INITIALIZATION_STATE["components"]["auto_load"] = {
@@ -88,6 +143,7 @@ async def startup():
                 "timestamp": datetime.now().isoformat(),
                 "message": "Auto-load disabled"
             }
+            set_component_status("warmup", "success", "Skipped - auto-load disabled")
     except Exception as e:
         print(f"⚠️ AUTO-LOAD error: {e}")
         SERVER_INITIALIZATION_STATE["components"]["auto_load"] = {
@@ -95,9 +151,21 @@ async def startup():
             "timestamp": datetime.now().isoformat(),
             "message": f"Auto-load error: {str(e)}"
         }
+        set_component_status("warmup", "warning", "Skipped - no model loaded")
 
 @app.on_event("shutdown")
 async def shutdown():
+    from inference.worker import inference_worker
+    inference_worker.stop()
+    from inference.catalog import model_catalog
+    model_catalog.stop()
+    from agents.core.agent_dispatcher import dispatcher
+    dispatcher.agents['memory'].compactor.stop()
+    dispatcher.jobs.stop()
+    from api.tasks import stop_tasks
+    stop_tasks()
+    from api.http_client import http_client
+    await http_client.close()
     await database.disconnect()
     print("✅ Database disconnected")
 
@@ -117,11 +185,9 @@ async def api_status():
     import sys
     from pathlib import Path
     
-    # Provjeri modele
-    model_dir = Path("/root/MasterCoderAI/modeli")
-    models = []
-    if model_dir.exists():
-        models = [f.name for f in model_dir.iterdir() if f.suffix in ['.gguf', '.bin', '.pt']]
+    # Provjeri modele (📚 model catalog index)
+    from inference.catalog import model_catalog
+    models = [entry["name"] for entry in model_catalog.list()]
     
     # Provjeri bazu
     db_path = Path("/root/MasterCoderAI/backend/data.db")
@@ -146,11 +212,9 @@ async def status():
     import sys
     from pathlib import Path
     
-    # Provjeri modele
-    model_dir = Path("/root/MasterCoderAI/modeli")
-    models = []
-    if model_dir.exists():
-        models = [f.name for f in model_dir.iterdir() if f.suffix in ['.gguf', '.bin', '.pt']]
+    # Provjeri modele (📚 model catalog index)
+    from inference.catalog import model_catalog
+    models = [entry["name"] for entry in model_catalog.list()]
     
     # Provjeri bazu
     db_path = Path("/root/MasterCoderAI/backend/data.db")
@@ -167,13 +231,9 @@ async def status():
 
 @app.get("/admin/models")
 async def list_models():
-    """Lista svih modela iz modeli/ foldera"""
-    from pathlib import Path
-    model_dir = Path("/root/MasterCoderAI/modeli")
-    models = []
-    if model_dir.exists():
-        models = [f.name for f in model_dir.iterdir() if f.suffix in ['.gguf', '.bin', '.pt']]
-    return {"models": models}
+    """Lista svih modela iz model kataloga"""
+    from inference.catalog import model_catalog
+    return {"models": [entry["name"] for entry in model_catalog.list()]}
 
 if __name__ == "__main__":
     import uvicorn
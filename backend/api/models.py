@@ -1,9 +1,9 @@
 # backend/api/models.py
 """
 Database Models (SQLite)
-Tables: users, chats, user_settings, tasks, system_settings
+Tables: users, chats, user_settings, tasks, system_settings, model_catalog, agent_jobs
 """
-from sqlalchemy import Table, Column, Integer, String, Boolean, DateTime, Float, ForeignKey, Text
+from sqlalchemy import Table, Column, Integer, String, Boolean, DateTime, Float, ForeignKey, Text, Index
 from sqlalchemy.sql import func
 import sys
 import os
@@ -29,11 +29,13 @@ chats = Table(
     "chats",
     metadata,
     Column("id", Integer, primary_key=True, autoincrement=True),
-    Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True),
+    Column("user_id", Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
     Column("message", Text, nullable=False),
     Column("response", Text, nullable=False),
     Column("model_name", String(100)),
     Column("timestamp", DateTime, server_default=func.now(), index=True),
+    # Covering index for per-user counts / history (db/chat_stats.py), also serves user_id lookups
+    Index("ix_chats_user_timestamp", "user_id", "timestamp"),
     extend_existing=True,
 )
 
@@ -98,21 +100,75 @@ system_settings = Table(
     Column("rope_freq_base", Float, default=10000.0),
     Column("rope_freq_scale", Float, default=1.0),
     Column("admin_override_all", Boolean, default=True),  # Admin can do ANYTHING
+    Column("speculative_mode", String, default="off"),  # 🏎️ off / prompt_lookup / draft_model
+    Column("speculative_draft_model", String, default=None),  # Small GGUF for draft_model mode
+    Column("speculative_draft_tokens", Integer, default=8),  # Draft tokens per step
     Column("updated_at", DateTime, server_default=func.now(), onupdate=func.now()),
     extend_existing=True,
 )
 
-# Admin tasks table
+# Admin tasks table (🤖 /tasks automation API - db/task_store.py)
 tasks = Table(
     "tasks",
     metadata,
     Column("id", Integer, primary_key=True, autoincrement=True),
     Column("task_type", String(50), nullable=False),
-    Column("status", String(20), default="pending"),
+    Column("status", String(20), default="pending", index=True),  # idle / running / completed / error
     Column("progress", Integer, default=0),
     Column("message", Text),
+    Column("url", Text),
+    Column("description", Text),
+    Column("result", Text),
+    Column("attempts", Integer, default=0),  # runs started (resumed after a restart -> > 1)
     Column("created_by", Integer, ForeignKey("users.id"), nullable=False),
     Column("created_at", DateTime, server_default=func.now()),
     Column("updated_at", DateTime, server_default=func.now(), onupdate=func.now()),
+    Index("ix_tasks_created_by_status", "created_by", "status"),
+    extend_existing=True,
+)
+
+# 📚 Model catalog - parsed GGUF headers (inference/catalog.py keeps it in sync with the model directories)
+model_catalog = Table(
+    "model_catalog",
+    metadata,
+    Column("path", String, primary_key=True),
+    Column("name", String, nullable=False, index=True),
+    Column("directory", String, nullable=False),
+    Column("format", String(10), nullable=False),  # gguf / bin / pt
+    Column("size_bytes", Integer, nullable=False),
+    Column("mtime", Float, nullable=False),  # re-parse only when size/mtime change
+    Column("architecture", String(50)),
+    Column("model_name", String),  # general.name from the header
+    Column("quantization", String(20)),
+    Column("context_length", Integer),
+    Column("n_layer", Integer),
+    Column("n_embd", Integer),
+    Column("n_head", Integer),
+    Column("n_head_kv", Integer),
+    Column("n_vocab", Integer),
+    Column("n_params", Integer),
+    Column("tensor_bytes", Integer),
+    Column("vram_estimate_mb", Float),  # weights + KV cache + compute at n_ctx=8192
+    Column("details", Text),  # JSON: head_dim, n_expert, tensor_types, ...
+    Column("error", Text),  # header parse error (file still listed)
+    Column("indexed_at", DateTime, server_default=func.now()),
+    extend_existing=True,
+)
+
+# 🔄 Background agent jobs (agents/core/job_registry.py) - survive restarts, results kept for polling
+agent_jobs = Table(
+    "agent_jobs",
+    metadata,
+    Column("id", String(32), primary_key=True),  # uuid4 hex
+    Column("agent_type", String(30), nullable=False, index=True),
+    Column("user_id", Integer, nullable=False, index=True),
+    Column("state", String(20), nullable=False, default="queued"),  # queued -> running -> succeeded | failed | cancelled | interrupted
+    Column("input", Text),
+    Column("params", Text),  # JSON
+    Column("result", Text),  # JSON agent result
+    Column("error", Text),
+    Column("created_at", Float, nullable=False),
+    Column("started_at", Float),
+    Column("finished_at", Float),
     extend_existing=True,
 )
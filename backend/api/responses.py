@@ -0,0 +1,32 @@
+"""
+Compact JSON responses for large listings (chat history pages)
+- no whitespace in the JSON body
+- gzip when the client accepts it and the body is big enough to be worth it
+  (per endpoint, not app-wide middleware, so SSE streams in ai.py are never buffered)
+"""
+import gzip
+import json
+from typing import Any, Dict, Optional
+
+from fastapi import Request, Response
+
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 5
+
+
+def compact_json_response(request: Request, payload: Any, headers: Optional[Dict[str, str]] = None) -> Response:
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+    headers = dict(headers or {})
+    headers["Vary"] = "Accept-Encoding"
+    if len(body) >= GZIP_MIN_BYTES and "gzip" in request.headers.get("accept-encoding", "").lower():
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def next_page_headers(request: Request, next_cursor: Optional[str]) -> Dict[str, str]:
+    """X-Next-Cursor + RFC 8288 Link header; the body stays a plain list"""
+    if not next_cursor:
+        return {}
+    next_url = request.url.include_query_params(cursor=next_cursor)
+    return {"X-Next-Cursor": next_cursor, "Link": f'<{next_url}>; rel="next"'}
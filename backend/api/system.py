@@ -13,6 +13,7 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 from db.database import database
 from api.models import system_settings
+from inference.speculative import SPECULATIVE_MODES
 from api.auth import get_current_user
 
 router = APIRouter(prefix="/system", tags=["system"])
@@ -25,7 +26,8 @@ SERVER_INITIALIZATION_STATE = {
         "database": {"status": "not_started", "timestamp": None},
         "models": {"status": "not_started", "timestamp": None}, 
         "gpu": {"status": "not_started", "timestamp": None},
-        "auto_load": {"status": "not_started", "timestamp": None}
+        "auto_load": {"status": "not_started", "timestamp": None},
+        "warmup": {"status": "not_started", "timestamp": None}  # 🔥 steady first-token latency after auto-load
     },
     "admin_ready": False,  # Admin je pokrenuo sistem i podesio sve
     "user_access_enabled": False  # Da li korisnici mogu da se loguju
@@ -48,6 +50,9 @@ class SystemSettingsUpdate(BaseModel):
     rope_freq_base: Optional[float] = None
     rope_freq_scale: Optional[float] = None
     admin_override_all: Optional[bool] = None
+    speculative_mode: Optional[str] = None  # off / prompt_lookup / draft_model (applies on next model load)
+    speculative_draft_model: Optional[str] = None
+    speculative_draft_tokens: Optional[int] = None
 
 def require_admin(current_user=Depends(get_current_user)):
     if not current_user.get("is_admin"):
@@ -81,7 +86,8 @@ async def reset_server_initialization(current_user=Depends(require_admin)):
             "database": {"status": "not_started", "timestamp": None},
             "models": {"status": "not_started", "timestamp": None}, 
             "gpu": {"status": "not_started", "timestamp": None},
-            "auto_load": {"status": "not_started", "timestamp": None}
+            "auto_load": {"status": "not_started", "timestamp": None},
+            "warmup": {"status": "not_started", "timestamp": None}
         },
         "admin_ready": False,
         "user_access_enabled": False
@@ -96,13 +102,19 @@ async def update_component_status(
     message: Optional[str] = None
 ):
     """Update status of initialization component - PUBLIC endpoint"""
+    set_component_status(component, status, message)
+    return {"status": "updated", "component": component}
+
+def set_component_status(component: str, status: str, message: Optional[str] = None, **extra):
+    """Set one initialization component; marks the server initialized once all are done"""
     global SERVER_INITIALIZATION_STATE
     
     if component in SERVER_INITIALIZATION_STATE["components"]:
         SERVER_INITIALIZATION_STATE["components"][component] = {
             "status": status,
             "timestamp": datetime.now().isoformat(),
-            "message": message
+            "message": message,
+            **extra
         }
         
         # Check if all components are done
@@ -114,8 +126,6 @@ async def update_component_status(
         if all_done and not SERVER_INITIALIZATION_STATE["initialized"]:
             SERVER_INITIALIZATION_STATE["initialized"] = True
             SERVER_INITIALIZATION_STATE["initialization_time"] = datetime.now().isoformat()
-    
-    return {"status": "updated", "component": component}
 
 @router.get("/settings")
 async def get_system_settings():
@@ -172,9 +182,18 @@ async def update_system_settings(
         'batch_size': settings_update.batch_size,
         'rope_freq_base': settings_update.rope_freq_base,
         'rope_freq_scale': settings_update.rope_freq_scale,
-        'admin_override_all': settings_update.admin_override_all
+        'admin_override_all': settings_update.admin_override_all,
+        'speculative_mode': settings_update.speculative_mode,
+        'speculative_draft_model': settings_update.speculative_draft_model,
+        'speculative_draft_tokens': settings_update.speculative_draft_tokens
     }
     
+    if settings_update.speculative_mode is not None and settings_update.speculative_mode not in SPECULATIVE_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"speculative_mode must be one of: {', '.join(SPECULATIVE_MODES)}"
+        )
+    
     # Only add non-None values
     for key, value in field_mapping.items():
         if value is not None:
@@ -268,21 +287,19 @@ async def get_system_health():
         }
         health_status["init_required"] = True
     
-    # Check models folders
+    # Check models folders (📚 model catalog index - no directory scan)
     try:
-        model_directories = [
-            Path("/root/MasterCoderAI/modeli"),
-            Path("/mnt/12T/models")
-        ]
+        from inference.catalog import model_catalog
+        model_directories = model_catalog.directories
         
-        total_models = 0
+        gguf_models = model_catalog.list(formats=("gguf",))
+        total_models = len(gguf_models)
         available_dirs = []
         
         for model_dir in model_directories:
-            if model_dir.exists():
-                model_files = list(model_dir.glob("*.gguf"))
-                total_models += len(model_files)
-                available_dirs.append(f"{model_dir}: {len(model_files)} models")
+            count = sum(1 for entry in gguf_models if entry["directory"] == str(model_dir))
+            if count:
+                available_dirs.append(f"{model_dir}: {count} models")
         
         if total_models > 0:
             health_status["models_folder"] = {
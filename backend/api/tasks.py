@@ -1,23 +1,25 @@
 # backend/api/tasks.py
 """
 Task Automation API - AI Learning Tasks
+Tasks live in the tasks table (db/task_store.py), so they survive restarts;
+idle / running tasks are picked up again by resume_tasks() at startup.
 """
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Dict, Optional, List
 import asyncio
-import uuid
 from datetime import datetime
-import requests
 from pathlib import Path
 import json
 
 from api.auth import get_current_user
+from db.task_store import task_store, RUNNING, COMPLETED, ERROR
+from api.http_client import http_client
 
 router = APIRouter(prefix="/tasks", tags=["tasks"])
 
-# In-memory task storage (in production use database)
-tasks_db = {}
+# Background processing tasks of this process (task id -> asyncio task)
+running_tasks: Dict[int, asyncio.Task] = {}
 
 class TaskRequest(BaseModel):
     type: str  # github_train, website_learn, document_analyze, api_monitor
@@ -25,7 +27,7 @@ class TaskRequest(BaseModel):
     description: str
 
 class Task(BaseModel):
-    id: str
+    id: int
     type: str
     url: str
     description: str
@@ -35,9 +37,9 @@ class Task(BaseModel):
     user_id: int
 
 @router.get("")
-async def get_tasks(current_user=Depends(get_current_user)):
+async def get_tasks(current_user=Depends(get_current_user), status: Optional[str] = None):
     """Get all tasks for current user"""
-    user_tasks = [task for task in tasks_db.values() if task['user_id'] == current_user['id']]
+    user_tasks = await task_store.list_for_user(current_user['id'], status=status)
     return {"tasks": user_tasks}
 
 @router.post("/create")
@@ -46,46 +48,68 @@ async def create_task(request: TaskRequest, current_user=Depends(get_current_use
     if not current_user.get('is_admin'):
         raise HTTPException(status_code=403, detail="Only admins can create tasks")
     
-    task_id = str(uuid.uuid4())
-    task = {
-        "id": task_id,
-        "type": request.type,
-        "url": request.url,
-        "description": request.description,
-        "status": "idle",
-        "result": None,
-        "created_at": datetime.now().isoformat(),
-        "user_id": current_user['id']
-    }
-    
-    tasks_db[task_id] = task
+    task = await task_store.create(request.type, request.url, request.description, current_user['id'])
     
     # Start task processing in background
-    asyncio.create_task(process_task(task_id))
+    start_task(task['id'])
     
-    return {"message": "Task created successfully", "task_id": task_id}
+    return {"message": "Task created successfully", "task_id": task['id']}
+
+@router.get("/{task_id}")
+async def get_task(task_id: int, current_user=Depends(get_current_user)):
+    """Get one task (status / result)"""
+    task = await task_store.get(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    if task['user_id'] != current_user['id'] and not current_user.get('is_admin'):
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return task
 
 @router.delete("/{task_id}")
-async def delete_task(task_id: str, current_user=Depends(get_current_user)):
+async def delete_task(task_id: int, current_user=Depends(get_current_user)):
     """Delete task"""
-    if task_id not in tasks_db:
+    task = await task_store.get(task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    task = tasks_db[task_id]
     if task['user_id'] != current_user['id'] and not current_user.get('is_admin'):
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    del tasks_db[task_id]
+    running = running_tasks.pop(task_id, None)
+    if running is not None:
+        running.cancel()
+    await task_store.delete(task_id)
     return {"message": "Task deleted"}
 
-async def process_task(task_id: str):
+def start_task(task_id: int):
+    """Run process_task in the background (keeps a reference so it can be cancelled)"""
+    task = asyncio.create_task(process_task(task_id))
+    running_tasks[task_id] = task
+    task.add_done_callback(lambda _, tid=task_id: running_tasks.pop(tid, None))
+
+async def resume_tasks() -> int:
+    """Restart tasks that were idle or running when the server stopped (call at startup)"""
+    pending = await task_store.resumable()
+    for task in pending:
+        if task['status'] == RUNNING:
+            await task_store.update(task['id'], message="Resumed after server restart")
+        start_task(task['id'])
+    return len(pending)
+
+def stop_tasks():
+    """Cancel in-process work on shutdown; the rows stay idle/running and resume on next start"""
+    for task in list(running_tasks.values()):
+        task.cancel()
+    running_tasks.clear()
+
+async def process_task(task_id: int):
     """Background task processing"""
     try:
-        task = tasks_db.get(task_id)
+        task = await task_store.get(task_id)
         if not task:
             return
         
-        task['status'] = 'running'
+        await task_store.mark_running(task_id)
         print(f"🚀 Processing task {task_id}: {task['type']} - {task['url']}")
         
         if task['type'] == 'github_train':
@@ -99,14 +123,14 @@ async def process_task(task_id: str):
         else:
             result = "Unknown task type"
         
-        task['status'] = 'completed'
-        task['result'] = result
+        await task_store.update(task_id, status=COMPLETED, result=result, progress=100)
         print(f"✅ Task {task_id} completed: {result[:100]}...")
         
+    except asyncio.CancelledError:
+        raise
     except Exception as e:
         print(f"❌ Task {task_id} failed: {str(e)}")
-        task['status'] = 'error'
-        task['result'] = f"Error: {str(e)}"
+        await task_store.update(task_id, status=ERROR, result=f"Error: {str(e)}")
 
 async def process_github_training(url: str, description: str) -> str:
     """Process GitHub repository for training"""
@@ -123,19 +147,18 @@ async def process_github_training(url: str, description: str) -> str:
         owner, repo = parts[0], parts[1]
         api_url = f"https://api.github.com/repos/{owner}/{repo}"
         
-        # Get repository info
-        response = requests.get(api_url, timeout=10)
-        if response.status_code != 200:
-            return f"❌ Cannot access repository: {response.status_code}"
+        # Repository info + contents (independent - fetched concurrently over the shared pool)
+        response, contents_response = await asyncio.gather(
+            http_client.get(api_url, timeout=10),
+            http_client.get(f"{api_url}/contents", timeout=10)
+        )
+        if response.status != 200:
+            return f"❌ Cannot access repository: {response.status}"
         
         repo_info = response.json()
         
-        # Get repository contents
-        contents_url = f"{api_url}/contents"
-        contents_response = requests.get(contents_url, timeout=10)
-        
-        if contents_response.status_code != 200:
-            return f"❌ Cannot read repository contents: {contents_response.status_code}"
+        if contents_response.status != 200:
+            return f"❌ Cannot read repository contents: {contents_response.status}"
         
         contents = contents_response.json()
         
@@ -171,20 +194,21 @@ async def process_website_learning(url: str, description: str) -> str:
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
-        response = requests.get(url, headers=headers, timeout=15)
+        response = await http_client.get(url, headers=headers, timeout=15)
         
-        if response.status_code != 200:
-            return f"❌ Cannot access website: {response.status_code}"
+        if response.status != 200:
+            return f"❌ Cannot access website: {response.status}"
         
         content = response.text
         content_length = len(content)
+        size_note = f" (truncated at {len(response.body):,} bytes)" if response.truncated else ""
         
         # Basic content analysis
         result = f"""🌐 WEBSITE CONTENT ANALYSIS
 
 URL: {url}
 Status: ✅ Accessible
-Content Size: {content_length:,} characters
+Content Size: {content_length:,} characters{size_note}
 Content Type: {response.headers.get('content-type', 'Unknown')}
 
 Learning Task: {description}
@@ -211,12 +235,14 @@ Task: {description}
 async def process_api_monitoring(url: str, description: str) -> str:
     """Monitor API endpoint"""
     try:
-        response = requests.get(url, timeout=10)
+        # Single probe - retrying would hide the failures we are monitoring for
+        response = await http_client.get(url, timeout=10, retries=0)
         return f"""📊 API MONITORING RESULT
 
 URL: {url}
-Status Code: {response.status_code}
-Response Time: ~{len(response.content)} bytes
+Status Code: {response.status}
+Response Time: {response.elapsed_ms:.0f} ms
+Response Size: {len(response.body):,} bytes{'+' if response.truncated else ''}
 Monitoring Task: {description}
 
 ✅ API endpoint monitored successfully!
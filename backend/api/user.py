@@ -2,7 +2,7 @@
 """
 User Routes - Chat Interface, Settings, Chat History
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from pydantic import BaseModel
 from typing import List, Optional
 import sys
@@ -16,6 +16,11 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 from db.database import database
 from api.models import chats, user_settings
 from api.auth import get_current_user
+from db.fts import chat_match, CHAT_SEARCH_SQL
+from db.chat_stats import user_chat_stats
+from db.chat_history import fetch_chat_page, CursorError, DEFAULT_PAGE_SIZE
+from api.responses import compact_json_response, next_page_headers
+from inference.context import context_builder
 
 logger = logging.getLogger(__name__)
 
@@ -59,15 +64,15 @@ async def get_user_profile(current_user=Depends(get_current_user)):
     username = current_user.get("username")
     is_admin = current_user.get("is_admin", False)
     
-    # Get user chat count
-    chat_query = chats.select().where(chats.c.user_id == user_id)
-    user_chats = await database.fetch_all(chat_query)
+    # Get user chat count (COUNT over the covering index, no chat rows loaded)
+    chat_stats = await user_chat_stats(user_id)
     
     return {
         "id": user_id,
         "username": username,
         "is_admin": is_admin,
-        "chat_count": len(user_chats),
+        "chat_count": chat_stats["total_chats"],
+        "last_chat_at": chat_stats["last_chat_at"],
         "account_type": "Admin" if is_admin else "User",
         "features": {
             "ai_chat": True,
@@ -182,11 +187,18 @@ async def update_user_settings(settings: SettingsUpdate, current_user=Depends(ge
 # ==================== CHAT HISTORY (OWN) ====================
 @router.get("/chats")
 async def get_my_chats(
+    request: Request,
     current_user=Depends(get_current_user), 
     user_id: Optional[int] = None,
-    limit: int = 50
+    limit: int = DEFAULT_PAGE_SIZE,
+    cursor: Optional[str] = None,
+    fields: str = "full"
 ):
-    """Get chat history - own chats for regular users, any user for admins"""
+    """
+    Get chat history - own chats for regular users, any user for admins
+    Newest first, keyset paged: pass the X-Next-Cursor response header back as ?cursor=
+    fields: full | preview (first 100 chars) | meta (no text)
+    """
     # If user_id is provided and user is admin, fetch that user's chats
     if user_id is not None:
         if not current_user.get("is_admin"):
@@ -195,13 +207,46 @@ async def get_my_chats(
     else:
         target_user_id = current_user["id"]
     
-    query = (
-        chats.select()
-        .where(chats.c.user_id == target_user_id)
-        .order_by(chats.c.timestamp.desc())
-        .limit(limit)
+    try:
+        rows, next_cursor = await fetch_chat_page(target_user_id, cursor=cursor, limit=limit, fields=fields)
+    except CursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    payload = [
+        {
+            "id": row["id"],
+            "user_message": row["message"],
+            "ai_response": row["response"],
+            "model_name": row["model_name"],
+            "created_at": str(row["timestamp"])
+        }
+        for row in rows
+    ]
+    return compact_json_response(request, payload, next_page_headers(request, next_cursor))
+
+@router.get("/chats/search")
+async def search_my_chats(
+    q: str,
+    current_user=Depends(get_current_user),
+    user_id: Optional[int] = None,
+    limit: int = 20
+):
+    """Full-text search over chat history (BM25 ranked, <mark> highlighted snippets)"""
+    if user_id is not None:
+        if not current_user.get("is_admin"):
+            raise HTTPException(status_code=403, detail="Admin access required")
+        target_user_id = user_id
+    else:
+        target_user_id = current_user["id"]
+    
+    match = chat_match(q, target_user_id)
+    if match is None:
+        raise HTTPException(status_code=400, detail="Search query has no searchable words")
+    
+    rows = await database.fetch_all(
+        CHAT_SEARCH_SQL,
+        values={"query": match, "user_id": target_user_id, "limit": max(1, min(limit, 100))}
     )
-    rows = await database.fetch_all(query)
     
     return [
         {
@@ -209,7 +254,10 @@ async def get_my_chats(
             "user_message": row["message"],
             "ai_response": row["response"],
             "model_name": row["model_name"],
-            "created_at": str(row["timestamp"])
+            "created_at": str(row["timestamp"]),
+            "message_snippet": row["message_snippet"],
+            "response_snippet": row["response_snippet"],
+            "score": round(-row["score"], 4)  # bm25() is lower-is-better
         }
         for row in rows
     ]
@@ -228,6 +276,7 @@ async def delete_my_chat(chat_id: int, current_user=Depends(get_current_user)):
     
     delete_query = chats.delete().where(chats.c.id == chat_id)
     await database.execute(delete_query)
+    context_builder.invalidate(current_user["id"])
     
     return {"message": "Chat deleted successfully"}
 
@@ -236,6 +285,7 @@ async def delete_all_my_chats(current_user=Depends(get_current_user)):
     """Delete all chats from current user"""
     delete_query = chats.delete().where(chats.c.user_id == current_user["id"])
     await database.execute(delete_query)
+    context_builder.invalidate(current_user["id"])
     
     return {"message": "All your chats deleted successfully"}
 # ==================== MODEL CONFIGURATION ====================
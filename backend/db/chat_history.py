@@ -0,0 +1,77 @@
+"""
+MasterCoderAI - Chat history paging (keyset / cursor)
+Stranice idu po (timestamp, id) DESC - WHERE (timestamp, id) < (cursor) umjesto OFFSET-a,
+pa je svaka stranica jedan index seek + LIMIT redova, bez obzira koliko je duboko.
+
+- po korisniku: ix_chats_user_timestamp (user_id, timestamp [, rowid])
+- svi chatovi (admin): ix_chats_timestamp (timestamp [, rowid])
+- username dolazi iz JOIN-a na users (nema upita po redu)
+- fields: full (cijeli tekst), preview (prvih PREVIEW_CHARS znakova, substr u SQL-u),
+  meta (bez teksta)
+"""
+import base64
+from typing import List, Optional, Tuple
+
+from db.database import database
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+PREVIEW_CHARS = 100
+
+CHAT_FIELDS = {
+    "full": "c.message AS message, c.response AS response",
+    "preview": f"substr(c.message, 1, {PREVIEW_CHARS}) AS message, substr(c.response, 1, {PREVIEW_CHARS}) AS response",
+    "meta": "NULL AS message, NULL AS response",
+}
+
+CHAT_PAGE_SQL = """
+    SELECT c.id, c.user_id, u.username, {fields}, c.model_name, c.timestamp
+    FROM chats c
+    LEFT JOIN users u ON u.id = c.user_id
+    WHERE {where}
+    ORDER BY c.timestamp DESC, c.id DESC
+    LIMIT :limit
+"""
+
+
+class CursorError(ValueError):
+    pass
+
+
+def encode_cursor(timestamp, chat_id: int) -> str:
+    raw = f"{timestamp}|{chat_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, chat_id = raw.rsplit("|", 1)
+        return timestamp, int(chat_id)
+    except Exception:
+        raise CursorError("Invalid cursor")
+
+
+async def fetch_chat_page(user_id: Optional[int] = None, cursor: Optional[str] = None,
+                          limit: int = DEFAULT_PAGE_SIZE, fields: str = "full") -> Tuple[List, Optional[str]]:
+    """(rows, next_cursor) - newest first; next_cursor is None on the last page"""
+    if fields not in CHAT_FIELDS:
+        raise CursorError(f"fields must be one of: {', '.join(CHAT_FIELDS)}")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    conditions = []
+    values = {"limit": limit + 1}  # one extra row tells us whether there is a next page
+    if user_id is not None:
+        conditions.append("c.user_id = :user_id")
+        values["user_id"] = user_id
+    if cursor:
+        timestamp, chat_id = decode_cursor(cursor)
+        conditions.append("(c.timestamp, c.id) < (:cursor_ts, :cursor_id)")
+        values.update(cursor_ts=timestamp, cursor_id=chat_id)
+
+    sql = CHAT_PAGE_SQL.format(fields=CHAT_FIELDS[fields], where=" AND ".join(conditions) or "1")
+    rows = await database.fetch_all(sql, values=values)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1]["timestamp"], rows[-1]["id"])
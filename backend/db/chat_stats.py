@@ -0,0 +1,85 @@
+"""
+MasterCoderAI - Chat statistics (aggregate SQL)
+Broj chatova se računa u bazi (COUNT / GROUP BY), nikad fetch_all + len().
+
+- ix_chats_user_timestamp (user_id, timestamp) je covering index za sve ove upite:
+  COUNT(*) WHERE user_id = ?, GROUP BY user_id, MAX(timestamp) - SQLite čita samo
+  index, message/response tekst se ne učitava
+- isti index služi i za "chatovi korisnika po vremenu" (ORDER BY timestamp)
+- ix_chats_timestamp (timestamp) nosi admin listu svih chatova (db/chat_history.py)
+- stari ix_chats_user_id je prefiks novog indexa pa se briše (jedan index manje po INSERT-u)
+"""
+import sqlite3
+from typing import Dict, List, Optional
+
+from db.database import DATABASE_URL, database
+
+CHAT_INDEX_NAME = "ix_chats_user_timestamp"
+CHAT_INDEX_SQL = f"CREATE INDEX IF NOT EXISTS {CHAT_INDEX_NAME} ON chats (user_id, timestamp)"
+# Declared on the model, but databases created before it existed may lack it
+EXTRA_INDEX_SQL = ["CREATE INDEX IF NOT EXISTS ix_chats_timestamp ON chats (timestamp)"]
+REDUNDANT_INDEXES = ["ix_chats_user_id"]
+
+USER_CHAT_STATS_SQL = """
+    SELECT COUNT(*) AS total_chats, MIN(timestamp) AS first_chat_at, MAX(timestamp) AS last_chat_at
+    FROM chats
+    WHERE user_id = :user_id
+"""
+
+# One query for the admin user list, no matter how many users
+USERS_WITH_CHAT_COUNTS_SQL = """
+    SELECT u.id, u.username, u.is_admin, u.created_at,
+           COALESCE(c.total_chats, 0) AS total_chats, c.last_chat_at
+    FROM users u
+    LEFT JOIN (
+        SELECT user_id, COUNT(*) AS total_chats, MAX(timestamp) AS last_chat_at
+        FROM chats
+        GROUP BY user_id
+    ) c ON c.user_id = u.id
+    ORDER BY u.id
+"""
+
+CHAT_COUNTS_BY_USER_SQL = """
+    SELECT user_id, COUNT(*) AS total_chats
+    FROM chats
+    GROUP BY user_id
+"""
+
+
+async def user_chat_stats(user_id: int) -> dict:
+    """{total_chats, first_chat_at, last_chat_at} for one user"""
+    row = await database.fetch_one(USER_CHAT_STATS_SQL, values={"user_id": user_id})
+    return {
+        "total_chats": row["total_chats"] if row else 0,
+        "first_chat_at": str(row["first_chat_at"]) if row and row["first_chat_at"] else None,
+        "last_chat_at": str(row["last_chat_at"]) if row and row["last_chat_at"] else None,
+    }
+
+
+async def chat_counts_by_user() -> Dict[int, int]:
+    rows = await database.fetch_all(CHAT_COUNTS_BY_USER_SQL)
+    return {row["user_id"]: row["total_chats"] for row in rows}
+
+
+async def users_with_chat_counts() -> List[dict]:
+    return [dict(row) for row in await database.fetch_all(USERS_WITH_CHAT_COUNTS_SQL)]
+
+
+def ensure_chat_indexes(db_path: Optional[str] = None) -> bool:
+    """Covering index for chat stats (blocking - run via asyncio.to_thread at startup). True if created."""
+    conn = sqlite3.connect(db_path or DATABASE_URL.replace("sqlite:///", ""))
+    try:
+        exists = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (CHAT_INDEX_NAME,)
+        ).fetchone()
+        conn.execute(CHAT_INDEX_SQL)
+        for sql in EXTRA_INDEX_SQL:
+            conn.execute(sql)
+        for name in REDUNDANT_INDEXES:
+            conn.execute(f"DROP INDEX IF EXISTS {name}")
+        if not exists:
+            conn.execute("ANALYZE chats")
+        conn.commit()
+        return not exists
+    finally:
+        conn.close()
@@ -0,0 +1,216 @@
+"""
+MasterCoderAI - Streaming export (chats, memories)
+Redovi se čitaju u batch-evima po keyset-u (nikad cijela tabela u RAM-u, nikad OFFSET),
+svaki batch je kratak zaseban upit - nema dugih read transakcija koje drže bazu.
+
+- chats: (timestamp, id) ASC preko ix_chats_user_timestamp / ix_chats_timestamp,
+  username iz JOIN-a na users
+- memories (memory.db): id ASC kroz MemoryStore reader pool
+- formati: ndjson, csv, parquet (parquet samo ako je pyarrow instaliran; jedan row group po batch-u)
+"""
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from db.database import database
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# (column, type) - type drives the parquet schema
+CHAT_EXPORT_COLUMNS: List[Tuple[str, str]] = [
+    ("id", "int"), ("user_id", "int"), ("username", "str"), ("message", "str"),
+    ("response", "str"), ("model_name", "str"), ("timestamp", "str"),
+]
+MEMORY_EXPORT_COLUMNS: List[Tuple[str, str]] = [
+    ("id", "int"), ("user_id", "int"), ("memory_type", "str"), ("content", "str"), ("context", "str"),
+    ("importance_score", "float"), ("created_at", "str"), ("accessed_count", "int"),
+    ("last_accessed", "str"), ("tags", "str"), ("summary", "str"),
+]
+
+CHAT_EXPORT_SQL = """
+    SELECT c.id, c.user_id, u.username, c.message, c.response, c.model_name, c.timestamp
+    FROM chats c
+    LEFT JOIN users u ON u.id = c.user_id
+    WHERE {where}
+    ORDER BY c.timestamp, c.id
+    LIMIT :limit
+"""
+MEMORY_EXPORT_SQL = """
+    SELECT id, user_id, memory_type, content, context, importance_score, created_at,
+           accessed_count, last_accessed, tags, summary
+    FROM memories
+    WHERE {where}
+    ORDER BY id
+    LIMIT ?
+"""
+
+
+class ExportError(ValueError):
+    pass
+
+
+def check_format(fmt: str) -> str:
+    if fmt not in EXPORT_MEDIA_TYPES:
+        raise ExportError(f"format must be one of: {', '.join(EXPORT_MEDIA_TYPES)}")
+    if fmt == "parquet" and pa is None:
+        raise ExportError("Parquet export requires pyarrow (pip install pyarrow)")
+    return fmt
+
+
+def _db_timestamp(value: Optional[datetime]) -> Optional[str]:
+    # Stored as 'YYYY-MM-DD HH:MM:SS' text (CURRENT_TIMESTAMP), compare as text
+    return value.strftime("%Y-%m-%d %H:%M:%S") if value else None
+
+
+def export_filename(name: str, fmt: str) -> str:
+    return f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{fmt}"
+
+
+# ==================== SOURCES ====================
+async def chat_batches(user_id: Optional[int] = None, since: Optional[datetime] = None,
+                       until: Optional[datetime] = None,
+                       batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Chats oldest first, batch_size rows at a time"""
+    conditions = []
+    values: Dict[str, Any] = {"limit": batch_size}
+    if user_id is not None:
+        conditions.append("c.user_id = :user_id")
+        values["user_id"] = user_id
+    if since:
+        conditions.append("c.timestamp >= :since")
+        values["since"] = _db_timestamp(since)
+    if until:
+        conditions.append("c.timestamp < :until")
+        values["until"] = _db_timestamp(until)
+    first_sql = CHAT_EXPORT_SQL.format(where=" AND ".join(conditions) or "1")
+    next_sql = CHAT_EXPORT_SQL.format(where=" AND ".join(conditions + ["(c.timestamp, c.id) > (:after_ts, :after_id)"]))
+
+    sql = first_sql
+    while True:
+        rows = await database.fetch_all(sql, values=values)
+        if not rows:
+            return
+        batch = [dict(row) for row in rows]
+        yield batch
+        if len(rows) < batch_size:
+            return
+        sql = next_sql
+        values.update(after_ts=batch[-1]["timestamp"], after_id=batch[-1]["id"])
+
+
+async def memory_batches(store, user_id: Optional[int] = None, since: Optional[datetime] = None,
+                         until: Optional[datetime] = None,
+                         batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[List[Dict[str, Any]]]:
+    """memory.db memories by id, batch_size rows at a time (store = MemoryStore)"""
+    conditions = ["id > ?"]
+    filters: List[Any] = []
+    if user_id is not None:
+        conditions.append("user_id = ?")
+        filters.append(user_id)
+    if since:
+        conditions.append("created_at >= ?")
+        filters.append(_db_timestamp(since))
+    if until:
+        conditions.append("created_at < ?")
+        filters.append(_db_timestamp(until))
+    sql = MEMORY_EXPORT_SQL.format(where=" AND ".join(conditions))
+    columns = [name for name, _ in MEMORY_EXPORT_COLUMNS]
+
+    after_id = 0
+    while True:
+        rows = await store.fetch_all(sql, (after_id, *filters, batch_size))
+        if not rows:
+            return
+        yield [dict(zip(columns, row)) for row in rows]
+        if len(rows) < batch_size:
+            return
+        after_id = rows[-1][0]
+
+
+# ==================== ENCODERS ====================
+async def _ndjson(batches: AsyncIterator[List[Dict[str, Any]]], columns: Sequence[Tuple[str, str]]) -> AsyncIterator[bytes]:
+    async for batch in batches:
+        yield "".join(json.dumps(row, ensure_ascii=False, default=str) + "\n" for row in batch).encode("utf-8")
+
+
+async def _csv(batches: AsyncIterator[List[Dict[str, Any]]], columns: Sequence[Tuple[str, str]]) -> AsyncIterator[bytes]:
+    names = [name for name, _ in columns]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    async for batch in batches:
+        writer.writerows([row.get(name) for name in names] for row in batch)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file for ParquetWriter; bytes are drained after every row group"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def _parquet(batches: AsyncIterator[List[Dict[str, Any]]], columns: Sequence[Tuple[str, str]]) -> AsyncIterator[bytes]:
+    types = {"int": pa.int64(), "float": pa.float64(), "str": pa.string()}
+    schema = pa.schema([(name, types[kind]) for name, kind in columns])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        async for batch in batches:
+            # str() for text columns: timestamps may come back as datetime objects
+            writer.write_table(pa.Table.from_pylist([
+                {name: str(row[name]) if kind == "str" and row.get(name) is not None else row.get(name)
+                 for name, kind in columns}
+                for row in batch
+            ], schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+ENCODERS = {"ndjson": _ndjson, "csv": _csv, "parquet": _parquet}
+
+
+def encode(fmt: str, batches: AsyncIterator[List[Dict[str, Any]]],
+           columns: Sequence[Tuple[str, str]]) -> AsyncIterator[bytes]:
+    """Byte stream for StreamingResponse (call check_format first)"""
+    return ENCODERS[fmt](batches, columns)
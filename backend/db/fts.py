@@ -0,0 +1,107 @@
+"""
+MasterCoderAI - Full-text search (SQLite FTS5)
+chats_fts indeksira chats.message / chats.response, triggeri ga drže u sinkronu.
+
+- external content tablica (content='chats'): tekst se ne duplira, FTS drži samo indeks
+- unicode61 remove_diacritics 2: "sačuvaj" == "sacuvaj"
+- BM25 ranking + snippet() za highlight u rezultatima
+- user_id je indeksirana kolona: MATCH 'user_id:"7" AND (...)' siječe doclist jednog
+  korisnika u samom indeksu, bm25() se ne računa za tuđe redove
+"""
+import re
+import sqlite3
+from typing import Optional
+
+from db.database import DATABASE_URL
+
+TOKENIZER = "unicode61 remove_diacritics 2"
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+MAX_QUERY_TERMS = 16
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+CHAT_FTS_SCHEMA = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS chats_fts USING fts5(
+        message, response, user_id, content='chats', content_rowid='id', tokenize='{TOKENIZER}'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chats_fts_ai AFTER INSERT ON chats BEGIN
+        INSERT INTO chats_fts(rowid, message, response, user_id) VALUES (new.id, new.message, new.response, new.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chats_fts_ad AFTER DELETE ON chats BEGIN
+        INSERT INTO chats_fts(chats_fts, rowid, message, response, user_id)
+        VALUES ('delete', old.id, old.message, old.response, old.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS chats_fts_au AFTER UPDATE OF message, response, user_id ON chats BEGIN
+        INSERT INTO chats_fts(chats_fts, rowid, message, response, user_id)
+        VALUES ('delete', old.id, old.message, old.response, old.user_id);
+        INSERT INTO chats_fts(rowid, message, response, user_id) VALUES (new.id, new.message, new.response, new.user_id);
+    END
+    """,
+]
+
+# message weighs more than response - the user's own words are what they search for
+CHAT_SEARCH_SQL = f"""
+    SELECT c.id, c.message, c.response, c.model_name, c.timestamp,
+           snippet(chats_fts, 0, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}', '…', 12) AS message_snippet,
+           snippet(chats_fts, 1, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}', '…', 24) AS response_snippet,
+           bm25(chats_fts, 2.0, 1.0, 0.0) AS score
+    FROM chats_fts JOIN chats c ON c.id = chats_fts.rowid
+    WHERE chats_fts MATCH :query AND c.user_id = :user_id
+    ORDER BY score
+    LIMIT :limit
+"""
+
+
+def fts_query(text: str, match_any: bool = False) -> Optional[str]:
+    """
+    User text -> safe FTS5 MATCH expression (None if nothing searchable).
+    Every term is quoted, so FTS operators/syntax in the input can't break the query.
+    match_any=False: all terms, last one as prefix (search-as-you-type)
+    match_any=True:  any term, BM25 ranks rows with more/rarer terms first (natural questions)
+    """
+    terms = [term for term in _TERM.findall(text.lower()) if len(term) > 1][:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    if match_any:
+        return " OR ".join(quoted)
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def chat_match(text: str, user_id: int) -> Optional[str]:
+    """MATCH expression for one user's chats (None if nothing searchable)"""
+    query = fts_query(text)
+    if query is None:
+        return None
+    return f'user_id:"{int(user_id)}" AND {{message response}} : ({query})'
+
+
+def ensure_fts(conn: sqlite3.Connection, table: str, schema: list) -> bool:
+    """Create FTS table + triggers; index existing rows if the table is new. True if created."""
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).fetchone()
+    for statement in schema:
+        conn.execute(statement)
+    if not exists:
+        conn.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+    conn.commit()
+    return not exists
+
+
+def ensure_chat_fts(db_path: Optional[str] = None) -> bool:
+    """chats_fts for data.db (blocking - run via asyncio.to_thread at startup)"""
+    conn = sqlite3.connect(db_path or DATABASE_URL.replace("sqlite:///", ""))
+    try:
+        return ensure_fts(conn, "chats_fts", CHAT_FTS_SCHEMA)
+    finally:
+        conn.close()
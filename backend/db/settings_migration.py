@@ -0,0 +1,32 @@
+"""
+MasterCoderAI - system_settings schema upgrade at startup
+Kolone dodane u api/models.py nakon prvog system_settings schema-e dobiju se
+kroz ALTER TABLE ADD COLUMN - migrate_db.py više nije obavezan za postojeće data.db.
+"""
+import sqlite3
+from typing import List, Optional
+
+from db.database import DATABASE_URL
+
+# Columns added after the first system_settings schema: name -> SQLite column definition
+MIGRATED_COLUMNS = {
+    "speculative_mode": "TEXT DEFAULT 'off'",
+    "speculative_draft_model": "TEXT",
+    "speculative_draft_tokens": "INTEGER DEFAULT 8",
+}
+
+
+def migrate_system_settings(db_path: Optional[str] = None) -> List[str]:
+    """Add missing columns to an existing system_settings table (blocking). Returns added columns."""
+    conn = sqlite3.connect(db_path or DATABASE_URL.replace("sqlite:///", ""))
+    try:
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(system_settings)")}
+        if not existing:
+            return []  # No table yet - init_db creates it with every column
+        added = [name for name in MIGRATED_COLUMNS if name not in existing]
+        for name in added:
+            conn.execute(f"ALTER TABLE system_settings ADD COLUMN {name} {MIGRATED_COLUMNS[name]}")
+        conn.commit()
+        return added
+    finally:
+        conn.close()
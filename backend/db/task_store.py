@@ -0,0 +1,137 @@
+"""
+MasterCoderAI - Task store (tasks table) for the /tasks automation API
+Zadaci su u data.db umjesto u dict-u u memoriji - restart ih ne briše.
+
+- lookup po id-u = PRIMARY KEY, lista po korisniku = ix_tasks_created_by_status,
+  resume nakon pada = ix_tasks_status (index seek, nema full scan-a)
+- starije data.db baze (tasks tabela iz init_db bez url/description/result)
+  dobiju nove kolone kroz ALTER TABLE ADD COLUMN pri prvom korištenju
+"""
+import asyncio
+import sqlite3
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.sql import func
+
+from db.database import DATABASE_URL, database, engine
+from api.models import tasks
+
+IDLE = "idle"
+RUNNING = "running"
+COMPLETED = "completed"
+ERROR = "error"
+# Picked up again by api/tasks.py resume_tasks() after a restart / crash
+RESUMABLE_STATES = (IDLE, RUNNING)
+
+# Columns added after the first tasks schema: name -> SQLite column definition
+MIGRATED_COLUMNS = {
+    "url": "TEXT",
+    "description": "TEXT",
+    "result": "TEXT",
+    "attempts": "INTEGER DEFAULT 0",
+}
+TASK_INDEX_SQL = [
+    "CREATE INDEX IF NOT EXISTS ix_tasks_status ON tasks (status)",
+    "CREATE INDEX IF NOT EXISTS ix_tasks_created_by_status ON tasks (created_by, status)",
+]
+
+
+def migrate_task_table(db_path: Optional[str] = None) -> List[str]:
+    """Add missing columns / indexes to an existing tasks table (blocking). Returns added columns."""
+    conn = sqlite3.connect(db_path or DATABASE_URL.replace("sqlite:///", ""))
+    try:
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(tasks)")}
+        added = [name for name in MIGRATED_COLUMNS if name not in existing]
+        for name in added:
+            conn.execute(f"ALTER TABLE tasks ADD COLUMN {name} {MIGRATED_COLUMNS[name]}")
+        for sql in TASK_INDEX_SQL:
+            conn.execute(sql)
+        conn.commit()
+        return added
+    finally:
+        conn.close()
+
+
+def _timestamp(value) -> Optional[str]:
+    if value is None:
+        return None
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+def _row_to_dict(row) -> Dict[str, Any]:
+    """Row -> the task shape the dashboard expects (type / user_id, not task_type / created_by)"""
+    return {
+        "id": row["id"],
+        "type": row["task_type"],
+        "url": row["url"],
+        "description": row["description"],
+        "status": row["status"],
+        "result": row["result"],
+        "progress": row["progress"] or 0,
+        "message": row["message"],
+        "attempts": row["attempts"] or 0,
+        "created_at": _timestamp(row["created_at"]),
+        "updated_at": _timestamp(row["updated_at"]),
+        "user_id": row["created_by"],
+    }
+
+
+class TaskStore:
+    """Async CRUD over the tasks table"""
+
+    def __init__(self):
+        self._ready = False
+
+    async def ensure_table(self):
+        if not self._ready:
+            await asyncio.to_thread(tasks.create, engine, checkfirst=True)
+            added = await asyncio.to_thread(migrate_task_table)
+            if added:
+                print(f"🗂️ tasks table migrated, added columns: {', '.join(added)}")
+            self._ready = True
+
+    async def create(self, task_type: str, url: str, description: str, user_id: int) -> Dict[str, Any]:
+        await self.ensure_table()
+        task_id = await database.execute(tasks.insert().values(
+            task_type=task_type, url=url, description=description,
+            status=IDLE, progress=0, attempts=0, created_by=user_id
+        ))
+        return await self.get(task_id)
+
+    async def get(self, task_id: int) -> Optional[Dict[str, Any]]:
+        await self.ensure_table()
+        row = await database.fetch_one(tasks.select().where(tasks.c.id == task_id))
+        return _row_to_dict(row) if row else None
+
+    async def list_for_user(self, user_id: int, status: Optional[str] = None) -> List[Dict[str, Any]]:
+        await self.ensure_table()
+        query = tasks.select().where(tasks.c.created_by == user_id)
+        if status:
+            query = query.where(tasks.c.status == status)
+        rows = await database.fetch_all(query.order_by(tasks.c.id))
+        return [_row_to_dict(row) for row in rows]
+
+    async def resumable(self) -> List[Dict[str, Any]]:
+        """Tasks that were queued or running when the process stopped"""
+        await self.ensure_table()
+        rows = await database.fetch_all(
+            tasks.select().where(tasks.c.status.in_(RESUMABLE_STATES)).order_by(tasks.c.id)
+        )
+        return [_row_to_dict(row) for row in rows]
+
+    async def update(self, task_id: int, **values):
+        await self.ensure_table()
+        values.setdefault("updated_at", func.now())
+        await database.execute(tasks.update().where(tasks.c.id == task_id).values(**values))
+
+    async def mark_running(self, task_id: int):
+        await self.update(task_id, status=RUNNING, attempts=func.coalesce(tasks.c.attempts, 0) + 1)
+
+    async def delete(self, task_id: int):
+        await self.ensure_table()
+        await database.execute(tasks.delete().where(tasks.c.id == task_id))
+
+
+# 🎯 GLOBAL TASK STORE INSTANCE
+task_store = TaskStore()
@@ -0,0 +1,4 @@
+"""
+⚡ INFERENCE MODULE
+Llama model ownership and request execution off the event loop
+"""
@@ -0,0 +1,416 @@
+"""
+🧮 BATCHED GENERATION ENGINE 🧮
+Continuous batching of several chat completions on one resident model.
+
+The single-request path (Llama.__call__) decodes one sequence at a time,
+so the GPU does a full forward pass per token for a single user. Here a
+second llama.cpp context is created from the same loaded weights with
+n_seq_max = INFERENCE_BATCH_SEQS: every llama_decode() call advances all
+active sequences by one token (plus prompt chunks of newly admitted ones),
+each sequence in its own KV slot (seq_id).
+
+- Requests join as soon as a slot frees up (continuous batching)
+- Each sequence has its own sampler chain (top_k / top_p / temp)
+- Finished sequences release their KV cells via llama_memory_seq_rm
+- Shared system-prompt prefix: one extra sequence (PREFIX_SEQ = n_seq_max) holds
+  the KV cells of the last request prefix; new sequences with the same prefix get
+  those cells via llama_memory_seq_cp and only decode their own suffix
+  (needs a unified KV buffer, otherwise every sequence evaluates its full prompt)
+- Results use the same completion format as Llama.__call__
+
+Runs on the inference worker thread only (same rule as the Llama instance).
+"""
+
+import codecs
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 1 = batching disabled (single-request path)
+DEFAULT_BATCH_SEQS = int(os.getenv("INFERENCE_BATCH_SEQS", "1"))
+# KV cells per sequence; the batch context gets n_seq_max * this
+DEFAULT_BATCH_CTX = int(os.getenv("INFERENCE_BATCH_CTX", "4096"))
+DEFAULT_BATCH_TOKENS = 512
+# Shorter shared prefixes are cheaper to re-decode than to copy
+MIN_SHARED_PREFIX_TOKENS = 32
+
+
+class SlotOverflowError(ValueError):
+    """Prompt does not fit a batch KV slot (the single-request path has the full n_ctx)"""
+
+
+class BatchRequest:
+    """One completion inside the batch"""
+
+    def __init__(self, prompt: str, params: dict,
+                 on_token: Optional[Callable[[str], None]] = None,
+                 on_done: Optional[Callable[[Optional[dict], Optional[BaseException]], None]] = None,
+                 cancel_event=None, prefix: Optional[str] = None):
+        self.prompt = prompt
+        self.params = params
+        self.prefix = prefix  # static system section the prompt starts with (KV shared across sequences)
+        self.on_token = on_token
+        self.on_done = on_done
+        self.cancel_event = cancel_event
+
+
+class _Sequence:
+    """Per-slot decoding state"""
+
+    def __init__(self, seq_id: int, request: BatchRequest, prompt_tokens: List[int], sampler):
+        self.seq_id = seq_id
+        self.request = request
+        self.prompt_tokens = prompt_tokens
+        self.pending = list(prompt_tokens)   # tokens not yet fed to llama_decode
+        self.n_past = 0
+        self.generated: List[int] = []
+        self.text = ""
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        self.sampler = sampler
+        self.finish_reason: Optional[str] = None
+        self.started_at = time.perf_counter()
+
+        params = request.params
+        self.max_tokens = int(params.get("max_tokens") or 256)
+        stop = params.get("stop") or []
+        self.stop = [stop] if isinstance(stop, str) else list(stop)
+
+
+class BatchedGenerationEngine:
+    """
+    Multi-sequence decoder sharing the weights of a loaded Llama instance.
+    add() admits a request, step() runs one llama_decode for all active sequences.
+    """
+
+    def __init__(self, llama, n_seq_max: int = DEFAULT_BATCH_SEQS,
+                 n_ctx_per_seq: int = DEFAULT_BATCH_CTX, n_batch: int = DEFAULT_BATCH_TOKENS):
+        import llama_cpp
+        from llama_cpp import _internals
+
+        self._llama_cpp = llama_cpp
+        self.llama = llama
+        self.n_seq_max = max(1, n_seq_max)
+        self.n_ctx_per_seq = n_ctx_per_seq
+        self.n_batch = n_batch
+
+        # Copied prefix cells are shared between sequences only in a unified KV buffer
+        params = llama_cpp.llama_context_params.from_buffer_copy(llama.context_params)
+        self.share_prefix = hasattr(params, "kv_unified")
+        self.prefix_seq = self.n_seq_max
+        n_seqs = self.n_seq_max + (1 if self.share_prefix else 0)
+        params.n_ctx = n_seqs * n_ctx_per_seq
+        params.n_batch = n_batch
+        params.n_ubatch = min(n_batch, params.n_ubatch or n_batch)
+        params.n_seq_max = n_seqs
+        if self.share_prefix:
+            # Per-sequence limit is enforced here, a unified KV buffer avoids n_ctx / n_seq_max splitting
+            params.kv_unified = True
+
+        self._ctx = _internals.LlamaContext(model=llama._model, params=params, verbose=False)
+        self._batch = _internals.LlamaBatch(n_tokens=n_batch, embd=0, n_seq_max=self.n_seq_max, verbose=False)
+        self._vocab = llama_cpp.llama_model_get_vocab(llama._model.model)
+
+        self.free_slots: List[int] = list(range(self.n_seq_max))
+        self.active: Dict[int, _Sequence] = {}
+        # What the prefix sequence currently holds
+        self._prefix_text: Optional[str] = None
+        self._prefix_tokens: List[int] = []
+
+        # Stats
+        self.steps = 0
+        self.tokens_generated = 0
+        self.prompt_tokens = 0
+        self.decode_seconds = 0.0
+        self.completed = 0
+        self._occupancy_sum = 0
+        self.prefix_loads = 0
+        self.prefix_hits = 0
+        self.prefix_tokens_reused = 0
+
+    # ==================== ADMISSION ====================
+    def has_capacity(self) -> bool:
+        return bool(self.free_slots)
+
+    def add(self, request: BatchRequest):
+        """Admit a request into a free KV slot (SlotOverflowError if the prompt doesn't fit)"""
+        if not self.free_slots:
+            raise RuntimeError("No free batch slot")
+        tokens = self.llama.tokenize(request.prompt.encode("utf-8"), special=True)
+        if len(tokens) >= self.n_ctx_per_seq:
+            raise SlotOverflowError(
+                f"Prompt is {len(tokens)} tokens, batch slot holds {self.n_ctx_per_seq}"
+            )
+        seq_id = self.free_slots.pop(0)
+        seq = _Sequence(seq_id, request, tokens, self._make_sampler(request.params))
+        shared = self._attach_prefix(seq_id, request.prefix, tokens) if request.prefix and self.share_prefix else 0
+        seq.pending = tokens[shared:]
+        seq.n_past = shared
+        self.active[seq_id] = seq
+        self.prompt_tokens += len(tokens) - shared
+
+    # ==================== SHARED PREFIX ====================
+    def _attach_prefix(self, seq_id: int, prefix: str, tokens: List[int]) -> int:
+        """Copy the prefix KV cells into seq_id, returns how many prompt tokens are already decoded"""
+        if prefix != self._prefix_text:
+            prefix_tokens = self.llama.tokenize(prefix.encode("utf-8"), special=True)
+            if len(prefix_tokens) < MIN_SHARED_PREFIX_TOKENS or not self._load_prefix(prefix_tokens):
+                return 0
+            self._prefix_text = prefix
+        # Tokenization may differ at the prefix/suffix boundary - share only the common run,
+        # and leave at least one prompt token to decode (it produces the first logits)
+        shared = 0
+        limit = min(len(self._prefix_tokens), len(tokens) - 1)
+        while shared < limit and self._prefix_tokens[shared] == tokens[shared]:
+            shared += 1
+        if shared < MIN_SHARED_PREFIX_TOKENS:
+            return 0
+        self._ctx.kv_cache_seq_cp(self.prefix_seq, seq_id, 0, shared)
+        self.prefix_hits += 1
+        self.prefix_tokens_reused += shared
+        return shared
+
+    def _load_prefix(self, prefix_tokens: List[int]) -> bool:
+        """Decode prefix_tokens into the prefix sequence (replacing the previous prefix)"""
+        lc = self._llama_cpp
+        self._ctx.kv_cache_seq_rm(self.prefix_seq, -1, -1)
+        self._prefix_text = None
+        self._prefix_tokens = []
+        if len(prefix_tokens) >= self.n_ctx_per_seq:
+            return False
+        batch = self._batch.batch
+        for start in range(0, len(prefix_tokens), self.n_batch):
+            chunk = prefix_tokens[start:start + self.n_batch]
+            for i, token in enumerate(chunk):
+                self._batch_add(batch, i, token, start + i, self.prefix_seq, False)
+            batch.n_tokens = len(chunk)
+            rc = lc.llama_decode(self._ctx.ctx, batch)
+            if rc != 0:
+                logger.warning(f"⚠️ Shared prefix decode failed with code {rc}, sequences decode their full prompt")
+                self._ctx.kv_cache_seq_rm(self.prefix_seq, -1, -1)
+                return False
+        self._prefix_tokens = prefix_tokens
+        self.prefix_loads += 1
+        return True
+
+    def _make_sampler(self, params: dict):
+        lc = self._llama_cpp
+        chain = lc.llama_sampler_chain_init(lc.llama_sampler_chain_default_params())
+        temperature = float(params.get("temperature", 0.8))
+        if temperature <= 0:
+            lc.llama_sampler_chain_add(chain, lc.llama_sampler_init_greedy())
+            return chain
+        lc.llama_sampler_chain_add(chain, lc.llama_sampler_init_top_k(int(params.get("top_k", 40))))
+        lc.llama_sampler_chain_add(chain, lc.llama_sampler_init_top_p(float(params.get("top_p", 0.95)), 1))
+        lc.llama_sampler_chain_add(chain, lc.llama_sampler_init_temp(temperature))
+        seed = params.get("seed")
+        seed = int(seed) if seed is not None else lc.LLAMA_DEFAULT_SEED
+        lc.llama_sampler_chain_add(chain, lc.llama_sampler_init_dist(seed))
+        return chain
+
+    # ==================== DECODE LOOP ====================
+    def step(self):
+        """One llama_decode over all active sequences, then sample where logits were requested"""
+        lc = self._llama_cpp
+        if not self.active:
+            return
+
+        for seq in list(self.active.values()):
+            cancel_event = seq.request.cancel_event
+            if cancel_event is not None and cancel_event.is_set():
+                self._finish(seq, "cancelled")
+        if not self.active:
+            return
+
+        batch = self._batch.batch
+        n = 0
+        logits_at: Dict[int, _Sequence] = {}
+
+        # Sequences that are generating contribute exactly one token each
+        for seq in self.active.values():
+            if not seq.pending and seq.generated:
+                self._batch_add(batch, n, seq.generated[-1], seq.n_past, seq.seq_id, True)
+                seq.n_past += 1
+                logits_at[n] = seq
+                n += 1
+
+        # Remaining room goes to prompt processing of newly admitted sequences
+        for seq in self.active.values():
+            if not seq.pending or n >= self.n_batch:
+                continue
+            take = min(len(seq.pending), self.n_batch - n)
+            chunk, seq.pending = seq.pending[:take], seq.pending[take:]
+            for i, token in enumerate(chunk):
+                last = not seq.pending and i == take - 1
+                self._batch_add(batch, n, token, seq.n_past, seq.seq_id, last)
+                seq.n_past += 1
+                if last:
+                    logits_at[n] = seq
+                n += 1
+
+        if n == 0:
+            return
+        batch.n_tokens = n
+
+        started = time.perf_counter()
+        rc = lc.llama_decode(self._ctx.ctx, batch)
+        if rc != 0:
+            # 1 = no KV slot for the batch; anything else is fatal for these sequences
+            error = RuntimeError(f"llama_decode failed with code {rc}")
+            for seq in list(self.active.values()):
+                self._finish(seq, "error", error)
+            return
+
+        for index, seq in logits_at.items():
+            token = lc.llama_sampler_sample(seq.sampler, self._ctx.ctx, index)
+            self._accept(seq, token)
+
+        self.decode_seconds += time.perf_counter() - started
+        self.steps += 1
+        self._occupancy_sum += len(logits_at)
+
+    def run(self):
+        """Step until every admitted sequence is finished"""
+        while self.active:
+            self.step()
+
+    def generate_all(self, requests: List[BatchRequest]) -> List[dict]:
+        """Run a fixed list of requests through the batch (benchmarks / scripts)"""
+        results: List[Optional[dict]] = [None] * len(requests)
+        queue = list(enumerate(requests))
+
+        def collector(index):
+            def on_done(result, error):
+                results[index] = result if error is None else {"error": str(error)}
+            return on_done
+
+        for index, request in queue:
+            request.on_done = collector(index)
+        while queue or self.active:
+            while queue and self.has_capacity():
+                self.add(queue.pop(0)[1])
+            self.step()
+        return results
+
+    @staticmethod
+    def _batch_add(batch, i: int, token: int, pos: int, seq_id: int, logits: bool):
+        batch.token[i] = token
+        batch.pos[i] = pos
+        batch.n_seq_id[i] = 1
+        batch.seq_id[i][0] = seq_id
+        batch.logits[i] = logits
+
+    def _accept(self, seq: _Sequence, token: int):
+        if self._is_eog(token):
+            self._finish(seq, "stop")
+            return
+
+        seq.generated.append(token)
+        self.tokens_generated += 1
+        piece = self.llama.detokenize([token], prev_tokens=seq.prompt_tokens + seq.generated[:-1])
+        new_text = seq.decoder.decode(piece)
+        if new_text:
+            text = seq.text + new_text
+            stop_at = min((idx for idx in (text.find(s) for s in seq.stop if s) if idx >= 0), default=-1)
+            if stop_at >= 0:
+                new_text = text[len(seq.text):stop_at] if stop_at > len(seq.text) else ""
+                seq.text = text[:stop_at]
+                self._emit(seq, new_text)
+                self._finish(seq, "stop")
+                return
+            seq.text = text
+            self._emit(seq, new_text)
+
+        if len(seq.generated) >= seq.max_tokens or seq.n_past + 1 >= self.n_ctx_per_seq:
+            self._finish(seq, "length")
+
+    def _emit(self, seq: _Sequence, text: str):
+        if text and seq.request.on_token is not None:
+            seq.request.on_token(text)
+
+    def _is_eog(self, token: int) -> bool:
+        lc = self._llama_cpp
+        is_eog = getattr(lc, "llama_vocab_is_eog", None) or getattr(lc, "llama_token_is_eog", None)
+        if is_eog is not None:
+            return bool(is_eog(self._vocab, token))
+        return token == self.llama.token_eos()
+
+    def _finish(self, seq: _Sequence, reason: str, error: Optional[BaseException] = None):
+        lc = self._llama_cpp
+        self.active.pop(seq.seq_id, None)
+        self._ctx.kv_cache_seq_rm(seq.seq_id, -1, -1)
+        self.free_slots.append(seq.seq_id)
+        lc.llama_sampler_free(seq.sampler)
+        seq.sampler = None
+        self.completed += 1
+
+        if seq.request.on_done is None:
+            return
+        if error is not None:
+            seq.request.on_done(None, error)
+            return
+        seq.request.on_done({
+            "id": f"cmpl-batch-{seq.seq_id}-{int(time.time() * 1000)}",
+            "object": "text_completion",
+            "created": int(time.time()),
+            "model": getattr(self.llama, "model_path", ""),
+            "choices": [{
+                "text": seq.text,
+                "index": 0,
+                "logprobs": None,
+                "finish_reason": reason
+            }],
+            "usage": {
+                "prompt_tokens": len(seq.prompt_tokens),
+                "completion_tokens": len(seq.generated),
+                "total_tokens": len(seq.prompt_tokens) + len(seq.generated)
+            }
+        }, None)
+
+    def fail_all(self, error: BaseException):
+        """
+        Report error to every active sequence after a step raised.
+        The KV state is unknown at that point, so the cells aren't touched -
+        the caller closes the engine and builds a fresh one.
+        """
+        lc = self._llama_cpp
+        for seq in list(self.active.values()):
+            self.active.pop(seq.seq_id, None)
+            lc.llama_sampler_free(seq.sampler)
+            seq.sampler = None
+            self.completed += 1
+            if seq.request.on_done is not None:
+                try:
+                    seq.request.on_done(None, error)
+                except Exception as e:
+                    logger.warning(f"⚠️ on_done failed while failing batch sequence {seq.seq_id}: {e}")
+
+    def close(self):
+        """Free the batch context (its KV cache) - weights stay with the Llama instance"""
+        for seq in list(self.active.values()):
+            self._finish(seq, "cancelled")
+        self._batch.close()
+        self._ctx.close()
+
+    def get_stats(self) -> dict:
+        return {
+            "n_seq_max": self.n_seq_max,
+            "n_ctx_per_seq": self.n_ctx_per_seq,
+            "active": len(self.active),
+            "steps": self.steps,
+            "completed": self.completed,
+            "prompt_tokens": self.prompt_tokens,
+            "tokens_generated": self.tokens_generated,
+            "decode_seconds": round(self.decode_seconds, 3),
+            "avg_batch_occupancy": round(self._occupancy_sum / self.steps, 2) if self.steps else 0.0,
+            "tokens_per_second": round(self.tokens_generated / self.decode_seconds, 2) if self.decode_seconds else 0.0,
+            "shared_prefix": {
+                "enabled": self.share_prefix,
+                "tokens": len(self._prefix_tokens),
+                "loads": self.prefix_loads,
+                "hits": self.prefix_hits,
+                "tokens_reused": self.prefix_tokens_reused
+            }
+        }
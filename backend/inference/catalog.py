@@ -0,0 +1,378 @@
+"""
+📚 MODEL CATALOG 📚
+Index of model files with parsed GGUF headers, persisted in the model_catalog table.
+
+The model list endpoints used to iterdir()/glob() both model directories
+and stat() every file on every request - on the 12T spinning drive that
+is slow. Now:
+
+- startup: rows are loaded from the DB, then one background rescan stats
+  the directories and parses headers only for new/changed files (size/mtime)
+- runtime: an inotify watcher (ctypes, Linux) refreshes single files when
+  they are written/moved/deleted; directories that can't be watched
+  (missing mount, non-Linux) are rescanned every MODEL_CATALOG_POLL_SECONDS
+- endpoints read model_catalog.list() - no filesystem access per request
+
+estimate_mb() (weights + KV cache + compute from the header) replaces the
+naive "file size + 2GB" when the model pool makes room for a load.
+"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from db.database import database, engine
+from api.models import model_catalog as model_catalog_table
+from inference.gguf_header import read_gguf_header, summarize_header, estimate_vram_mb
+from inference.model_pool import estimate_model_mb
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIRECTORIES = [
+    Path("/root/MasterCoderAI/modeli"),
+    Path("/mnt/12T/models")
+]
+MODEL_EXTENSIONS = (".gguf", ".bin", ".pt")
+POLL_SECONDS = float(os.getenv("MODEL_CATALOG_POLL_SECONDS", "300"))
+# Wait this long after the last inotify event before re-indexing (copies emit many events)
+DEBOUNCE_SECONDS = 1.0
+
+# inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_UNMOUNT = 0x00002000
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+_EVENT_HEADER = struct.Struct("iIII")
+
+_HEADER_COLUMNS = (
+    "architecture", "model_name", "quantization", "context_length", "n_layer", "n_embd",
+    "n_head", "n_head_kv", "n_vocab", "n_params", "tensor_bytes"
+)
+_DETAIL_KEYS = ("head_dim", "n_expert", "tensor_count", "tensor_types")
+
+
+class _Inotify:
+    """Minimal non-blocking inotify wrapper (Linux only)"""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path: Path) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(str(path)), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch({path}) failed")
+        return wd
+
+    def read_events(self, timeout: float) -> List[Tuple[int, int, str]]:
+        """[(wd, mask, name)] - waits up to `timeout` seconds"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode("utf-8", errors="replace")
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def index_file(path: Path, stat: Optional[os.stat_result] = None) -> dict:
+    """Catalog entry for one model file (blocking - parses the GGUF header)"""
+    stat = stat or path.stat()
+    entry = {
+        "path": str(path),
+        "name": path.name,
+        "directory": str(path.parent),
+        "format": path.suffix.lstrip(".").lower(),
+        "size_bytes": stat.st_size,
+        "mtime": stat.st_mtime,
+        "vram_estimate_mb": None,
+        "details": {},
+        "error": None,
+    }
+    entry.update({column: None for column in _HEADER_COLUMNS})
+    if entry["format"] == "gguf":
+        try:
+            summary = summarize_header(read_gguf_header(str(path)))
+        except Exception as e:
+            entry["error"] = f"Header parse failed: {e}"
+        else:
+            entry.update({column: summary[column] for column in _HEADER_COLUMNS})
+            entry["details"] = {key: summary[key] for key in _DETAIL_KEYS}
+            entry["vram_estimate_mb"] = estimate_vram_mb(summary)
+    return entry
+
+
+def _public(entry: dict) -> dict:
+    size_mb = entry["size_bytes"] / (1024 * 1024)
+    return dict(entry, size_mb=round(size_mb, 2), size_gb=round(size_mb / 1024, 2))
+
+
+class ModelCatalog:
+    """In-memory model index backed by the model_catalog table"""
+
+    def __init__(self, directories: Iterable[Path] = MODEL_DIRECTORIES,
+                 extensions: Iterable[str] = MODEL_EXTENSIONS):
+        self.directories = [Path(d) for d in directories]
+        self.extensions = tuple(extensions)
+        self._entries: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.watch_mode = "off"
+
+        # Stats
+        self.scans = 0
+        self.headers_parsed = 0
+        self.file_events = 0
+        self.last_scan_seconds = 0.0
+        self.last_scan_at: Optional[float] = None
+
+    # ==================== LIFECYCLE ====================
+    async def start(self):
+        """Load the persisted index and start the directory watcher (call once at startup)"""
+        self._loop = asyncio.get_running_loop()
+        await asyncio.to_thread(model_catalog_table.create, engine, checkfirst=True)
+        rows = await database.fetch_all(model_catalog_table.select())
+        with self._lock:
+            self._entries = {row["path"]: self._from_row(row) for row in rows}
+        logger.info(f"📚 Model catalog: {len(rows)} models from DB")
+
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="model-catalog", daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # ==================== INDEXING ====================
+    async def rescan(self) -> dict:
+        """Stat the model directories, (re)parse new or changed files, drop missing ones"""
+        started = time.perf_counter()
+        with self._lock:
+            known = {path: (e["size_bytes"], e["mtime"]) for path, e in self._entries.items()}
+        changed, removed = await asyncio.to_thread(self._scan_directories, known)
+        await self._apply(changed, removed)
+
+        self.scans += 1
+        self.last_scan_seconds = round(time.perf_counter() - started, 3)
+        self.last_scan_at = time.time()
+        summary = {"total": len(self._entries), "changed": len(changed),
+                   "removed": len(removed), "seconds": self.last_scan_seconds}
+        logger.info(f"📚 Model catalog rescan: {summary}")
+        return summary
+
+    def _scan_directories(self, known: Dict[str, tuple]) -> Tuple[List[dict], List[str]]:
+        seen = set()
+        changed = []
+        for directory in self.directories:
+            if not directory.is_dir():
+                continue
+            with os.scandir(directory) as it:
+                for item in it:
+                    if not item.name.lower().endswith(self.extensions) or not item.is_file():
+                        continue
+                    stat = item.stat()
+                    seen.add(item.path)
+                    if known.get(item.path) == (stat.st_size, stat.st_mtime):
+                        continue
+                    changed.append(index_file(Path(item.path), stat))
+                    self.headers_parsed += 1
+        # Gone, or its directory is not mounted any more
+        removed = [path for path in known if path not in seen]
+        return changed, removed
+
+    async def refresh_paths(self, paths: Iterable[str]):
+        """Re-index specific files (inotify events)"""
+        changed, removed = await asyncio.to_thread(self._index_paths, list(paths))
+        await self._apply(changed, removed)
+
+    def _index_paths(self, paths: List[str]) -> Tuple[List[dict], List[str]]:
+        changed, removed = [], []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                removed.append(path)
+                continue
+            changed.append(index_file(Path(path), stat))
+            self.headers_parsed += 1
+        return changed, removed
+
+    async def _apply(self, changed: List[dict], removed: List[str]):
+        with self._lock:
+            removed = [path for path in removed if self._entries.pop(path, None) is not None]
+            for entry in changed:
+                self._entries[entry["path"]] = entry
+        if removed:
+            await database.execute(model_catalog_table.delete().where(model_catalog_table.c.path.in_(removed)))
+        if changed:
+            await database.execute_many(
+                model_catalog_table.insert().prefix_with("OR REPLACE"),
+                [self._to_row(entry) for entry in changed]
+            )
+
+    @staticmethod
+    def _to_row(entry: dict) -> dict:
+        row = {key: value for key, value in entry.items() if key != "details"}
+        row["details"] = json.dumps(entry["details"])
+        return row
+
+    @staticmethod
+    def _from_row(row) -> dict:
+        entry = {key: row[key] for key in (
+            "path", "name", "directory", "format", "size_bytes", "mtime",
+            "vram_estimate_mb", "error") + _HEADER_COLUMNS}
+        entry["details"] = json.loads(row["details"]) if row["details"] else {}
+        return entry
+
+    # ==================== WATCHER ====================
+    def _watch(self):
+        """inotify loop (watcher thread); falls back to periodic rescans for unwatched directories"""
+        try:
+            inotify = _Inotify()
+        except (OSError, AttributeError) as e:
+            logger.warning(f"⚠️ inotify unavailable ({e}), model catalog polls every {POLL_SECONDS:.0f}s")
+            inotify = None
+
+        watches: Dict[int, Path] = {}
+        pending = set()
+        last_event = 0.0
+        next_poll = time.monotonic()   # initial rescan right away
+        try:
+            while not self._stop.is_set():
+                if inotify is not None and self._add_missing_watches(inotify, watches):
+                    # Newly mounted / created directory may already hold models
+                    next_poll = 0.0
+                all_watched = len(watches) == len(self.directories)
+                self.watch_mode = "inotify" if all_watched else ("inotify+polling" if watches else "polling")
+
+                now = time.monotonic()
+                if now >= next_poll:
+                    self._submit(self.rescan())
+                    pending.clear()
+                    next_poll = now + (POLL_SECONDS if not all_watched else float("inf"))
+
+                if inotify is None:
+                    self._stop.wait(min(POLL_SECONDS, max(0.0, next_poll - time.monotonic())))
+                    continue
+
+                for wd, mask, name in inotify.read_events(timeout=DEBOUNCE_SECONDS):
+                    if mask & IN_Q_OVERFLOW:
+                        next_poll = 0.0
+                    elif mask & (IN_IGNORED | IN_DELETE_SELF | IN_MOVE_SELF | IN_UNMOUNT):
+                        # Directory went away - drop the watch, rescan drops its models
+                        if watches.pop(wd, None) is not None:
+                            next_poll = 0.0
+                    elif wd in watches and name.lower().endswith(self.extensions):
+                        pending.add(str(watches[wd] / name))
+                        last_event = time.monotonic()
+                        self.file_events += 1
+
+                if pending and time.monotonic() - last_event >= DEBOUNCE_SECONDS:
+                    self._submit(self.refresh_paths(sorted(pending)))
+                    pending.clear()
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+    def _add_missing_watches(self, inotify: _Inotify, watches: Dict[int, Path]) -> bool:
+        """Watch directories that exist now but weren't watched yet, True if any was added"""
+        watched = set(watches.values())
+        added = False
+        for directory in self.directories:
+            if directory in watched or not directory.is_dir():
+                continue
+            try:
+                watches[inotify.add_watch(directory)] = directory
+                added = True
+                logger.info(f"📚 Watching {directory}")
+            except OSError as e:
+                logger.warning(f"⚠️ Can't watch {directory}: {e}")
+        return added
+
+    def _submit(self, coro):
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        future.add_done_callback(self._log_failure)
+
+    @staticmethod
+    def _log_failure(future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"❌ Model catalog update failed: {future.exception()}")
+
+    # ==================== QUERIES ====================
+    def list(self, formats: Optional[Iterable[str]] = None) -> List[dict]:
+        """Indexed models (directory order, then name), optionally only some formats"""
+        formats = set(formats) if formats else None
+        order = {str(d): i for i, d in enumerate(self.directories)}
+        with self._lock:
+            entries = [e for e in self._entries.values() if formats is None or e["format"] in formats]
+        entries.sort(key=lambda e: (order.get(e["directory"], len(order)), e["name"]))
+        return [_public(e) for e in entries]
+
+    def get(self, path: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(str(path))
+        return _public(entry) if entry else None
+
+    def estimate_mb(self, path: str) -> float:
+        """VRAM needed to load `path` - from the header, naive size + overhead if unparseable (blocking)"""
+        with self._lock:
+            entry = self._entries.get(str(path))
+        if entry is None and str(path).lower().endswith(".gguf"):
+            try:
+                entry = index_file(Path(path))
+            except OSError:
+                entry = None
+        if entry and entry["vram_estimate_mb"]:
+            return entry["vram_estimate_mb"]
+        return estimate_model_mb(str(path))
+
+    def get_status(self) -> dict:
+        with self._lock:
+            total = len(self._entries)
+            errors = sum(1 for e in self._entries.values() if e["error"])
+        return {
+            "directories": [str(d) for d in self.directories],
+            "models": total,
+            "parse_errors": errors,
+            "watch_mode": self.watch_mode,
+            "scans": self.scans,
+            "headers_parsed": self.headers_parsed,
+            "file_events": self.file_events,
+            "last_scan_seconds": self.last_scan_seconds,
+            "last_scan_at": self.last_scan_at
+        }
+
+
+# 🎯 GLOBAL MODEL CATALOG INSTANCE
+model_catalog = ModelCatalog()
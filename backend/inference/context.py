@@ -0,0 +1,210 @@
+"""
+🧵 CONVERSATION CONTEXT BUILDER 🧵
+Feeds previous turns from `chats` back into the Llama 3.1 prompt.
+
+- Last N turns per user, newest kept first when trimming
+- Turns that don't fit verbatim are condensed into a one-line gist each
+  (start of the question + start of the answer) in a short system block
+  ahead of the verbatim turns, as far as the leftover budget allows
+- Token counts come from the loaded model's tokenizer
+- Budget = min(n_ctx, max_context_length) - max_tokens - rest of prompt
+- Tokenized turns are cached per user (keyed by chat id), so each turn is
+  tokenized once, not on every request
+- Tokenization runs in a worker thread (asyncio.to_thread), never on the event loop
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_TURNS = int(os.getenv("CHAT_HISTORY_TURNS", "20"))
+SUMMARIZE_DROPPED_TURNS = os.getenv("CHAT_HISTORY_SUMMARY", "1") == "1"
+GIST_QUESTION_CHARS = 160
+GIST_ANSWER_CHARS = 120
+MAX_CACHED_USERS = 256
+
+# Headroom for the few tokens llama.cpp adds around the prompt
+SAFETY_MARGIN_TOKENS = 64
+
+
+def format_turn(message: str, response: str) -> str:
+    """One past user/assistant exchange in Llama 3.1 chat format"""
+    return (
+        f"<|start_header_id|>user<|end_header_id|>\n\n{message}<|eot_id|>"
+        f"<|start_header_id|>assistant<|end_header_id|>\n\n{response}<|eot_id|>"
+    )
+
+
+def _clip(text: str, limit: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit].rstrip() + "…"
+
+
+def summarize_turn(message: str, response: str) -> str:
+    """One-line gist of an exchange that no longer fits in the prompt verbatim"""
+    return f"- User: {_clip(message, GIST_QUESTION_CHARS)} | Assistant: {_clip(response, GIST_ANSWER_CHARS)}\n"
+
+
+def format_summary(gists: List[str]) -> str:
+    return (
+        "<|start_header_id|>system<|end_header_id|>\n\n"
+        f"Summary of earlier turns in this conversation:\n{''.join(gists)}<|eot_id|>"
+    )
+
+
+class ConversationContextBuilder:
+    """
+    Builds a token-budgeted history block for a user.
+    Cache layout: (model_name, user_id) -> {chat_id: (formatted_turn, n_tokens, gist, gist_tokens)}
+    (token counts depend on the tokenizer, so each resident model has its own entries)
+    """
+
+    def __init__(self, history_turns: int = DEFAULT_HISTORY_TURNS):
+        self.history_turns = history_turns
+        self._cache: "OrderedDict[Tuple[str, int], Dict[int, Tuple[str, int, str, int]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # model_name -> tokens of an empty summary block (header + eot)
+        self._summary_overhead: Dict[str, int] = {}
+
+        # Stats
+        self.turns_tokenized = 0
+        self.turns_from_cache = 0
+
+    def count_tokens(self, model, text: str) -> int:
+        # llama_tokenize only reads the (immutable) vocab, safe next to a running generation
+        return len(model.tokenize(text.encode("utf-8"), add_bos=False, special=True))
+
+    def _tokenize_turns(self, model, rows) -> Dict[int, Tuple[str, int, str, int]]:
+        """Format + tokenize fetched turns (blocking - run via asyncio.to_thread)"""
+        entries = {}
+        for row in rows:
+            message, response = row["message"] or "", row["response"] or ""
+            turn = format_turn(message, response)
+            gist = summarize_turn(message, response)
+            entries[row["id"]] = (turn, self.count_tokens(model, turn), gist, self.count_tokens(model, gist))
+        return entries
+
+    def _user_cache(self, user_id: int, model_name: str) -> Dict[int, Tuple[str, int, str, int]]:
+        key = (model_name, user_id)
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = {}
+            self._cache.move_to_end(key)
+            while len(self._cache) > MAX_CACHED_USERS:
+                self._cache.popitem(last=False)
+            return self._cache[key]
+
+    def invalidate(self, user_id: Optional[int] = None):
+        """Forget cached turns (e.g. after chat history was deleted)"""
+        with self._lock:
+            if user_id is None:
+                self._cache.clear()
+            else:
+                for key in [k for k in self._cache if k[1] == user_id]:
+                    del self._cache[key]
+
+    async def build(self, database, chats_table, user_id: int, model, model_name: str,
+                    budget_tokens: int, max_turns: Optional[int] = None) -> Tuple[str, dict]:
+        """
+        Returns (history_prompt_block, stats).
+        Only turns that aren't cached yet are fetched with their text and tokenized.
+        """
+        max_turns = self.history_turns if max_turns is None else max_turns
+        stats = {
+            "turns_available": 0,
+            "turns_included": 0,
+            "turns_summarized": 0,
+            "turns_dropped": 0,
+            "history_tokens": 0,
+            "budget_tokens": max(budget_tokens, 0)
+        }
+        if max_turns <= 0 or budget_tokens <= 0:
+            return "", stats
+
+        # 1. Cheap id-only query for the newest N turns
+        id_query = (
+            chats_table.select()
+            .with_only_columns(chats_table.c.id)
+            .where(chats_table.c.user_id == user_id)
+            .order_by(chats_table.c.id.desc())
+            .limit(max_turns)
+        )
+        recent_ids = [row["id"] for row in await database.fetch_all(id_query)]
+        stats["turns_available"] = len(recent_ids)
+        if not recent_ids:
+            return "", stats
+
+        user_cache = self._user_cache(user_id, model_name)
+
+        # 2. Fetch + tokenize only turns we haven't seen
+        missing_ids = [chat_id for chat_id in recent_ids if chat_id not in user_cache]
+        if missing_ids:
+            text_query = (
+                chats_table.select()
+                .with_only_columns(chats_table.c.id, chats_table.c.message, chats_table.c.response)
+                .where(chats_table.c.id.in_(missing_ids))
+            )
+            rows = await database.fetch_all(text_query)
+            entries = await asyncio.to_thread(self._tokenize_turns, model, rows)
+            user_cache.update(entries)
+            self.turns_tokenized += len(entries)
+        self.turns_from_cache += len(recent_ids) - len(missing_ids)
+
+        # Drop turns that fell out of the window (or were deleted)
+        keep = set(recent_ids)
+        for chat_id in [cid for cid in user_cache if cid not in keep]:
+            del user_cache[chat_id]
+
+        # 3. Newest first until budget is spent, then restore chronological order
+        selected: List[str] = []
+        used = 0
+        for chat_id in recent_ids:
+            turn, n_tokens, _, _ = user_cache[chat_id]
+            if used + n_tokens > budget_tokens:
+                break
+            selected.append(turn)
+            used += n_tokens
+
+        # 4. Older turns that didn't fit: one-line gists, newest first, in what's left
+        summary = ""
+        dropped_ids = recent_ids[len(selected):]
+        if dropped_ids and SUMMARIZE_DROPPED_TURNS:
+            gists: List[str] = []
+            if model_name not in self._summary_overhead:
+                self._summary_overhead[model_name] = await asyncio.to_thread(
+                    self.count_tokens, model, format_summary([])
+                )
+            summary_tokens = self._summary_overhead[model_name]
+            for chat_id in dropped_ids:
+                _, _, gist, gist_tokens = user_cache[chat_id]
+                if used + summary_tokens + gist_tokens > budget_tokens:
+                    break
+                gists.append(gist)
+                summary_tokens += gist_tokens
+            if gists:
+                summary = format_summary(list(reversed(gists)))
+                used += summary_tokens
+                stats["turns_summarized"] = len(gists)
+
+        stats["turns_included"] = len(selected)
+        stats["turns_dropped"] = len(recent_ids) - len(selected) - stats["turns_summarized"]
+        stats["history_tokens"] = used
+        return summary + "".join(reversed(selected)), stats
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "cached_users": len({user_id for _, user_id in self._cache}),
+                "cached_turns": sum(len(turns) for turns in self._cache.values()),
+                "turns_tokenized": self.turns_tokenized,
+                "turns_from_cache": self.turns_from_cache
+            }
+
+
+# 🎯 GLOBAL CONTEXT BUILDER INSTANCE
+context_builder = ConversationContextBuilder()
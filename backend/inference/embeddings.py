@@ -0,0 +1,95 @@
+"""
+🧬 TEXT EMBEDDINGS 🧬
+Small embedding GGUF (EMBEDDING_MODEL_PATH) for semantic lookups.
+
+The chat models are loaded without embedding=True, so semantic features use
+a separate, lazily loaded llama.cpp instance on CPU. It has its own lock and
+does not go through the inference worker - embedding a short text takes
+milliseconds and must not wait behind chat generations.
+
+Vectors are L2-normalized float32, so cosine similarity is a dot product.
+If no embedding model is configured every call returns None and callers
+fall back to their non-semantic path.
+"""
+
+import logging
+import os
+import threading
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL_PATH = os.getenv("EMBEDDING_MODEL_PATH", "")
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "4"))
+
+
+class TextEmbedder:
+    """Lazy llama.cpp embedding model (thread-safe, blocking - use asyncio.to_thread)"""
+
+    def __init__(self, model_path: str = EMBEDDING_MODEL_PATH):
+        self.model_path = model_path
+        self._model = None
+        self._lock = threading.Lock()
+        self._failed = False
+
+        # Stats
+        self.texts_embedded = 0
+
+    @property
+    def available(self) -> bool:
+        return bool(self.model_path) and not self._failed and os.path.exists(self.model_path)
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self._model.n_embd() if self._model is not None else None
+
+    def _load(self):
+        if self._model is not None:
+            return self._model
+        from llama_cpp import Llama
+        logger.info(f"🧬 Loading embedding model {self.model_path}")
+        try:
+            self._model = Llama(
+                model_path=self.model_path,
+                embedding=True,
+                n_gpu_layers=0,
+                n_threads=EMBEDDING_THREADS,
+                verbose=False
+            )
+        except Exception as e:
+            self._failed = True
+            logger.error(f"❌ Embedding model failed to load: {e}")
+            raise
+        return self._model
+
+    def embed(self, texts: List[str]) -> Optional[np.ndarray]:
+        """(len(texts), dim) normalized matrix, None if embeddings are unavailable"""
+        if not texts or not self.available:
+            return None
+        with self._lock:
+            try:
+                vectors = self._load().embed(texts, normalize=True)
+            except Exception as e:
+                logger.warning(f"⚠️ Embedding failed: {e}")
+                return None
+            self.texts_embedded += len(texts)
+        return np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1)
+
+    def embed_one(self, text: str) -> Optional[np.ndarray]:
+        matrix = self.embed([text])
+        return matrix[0] if matrix is not None else None
+
+    def get_stats(self) -> dict:
+        return {
+            "model_path": self.model_path or None,
+            "available": self.available,
+            "loaded": self._model is not None,
+            "dim": self.dim,
+            "texts_embedded": self.texts_embedded
+        }
+
+
+# 🎯 GLOBAL EMBEDDER INSTANCE
+text_embedder = TextEmbedder()
@@ -0,0 +1,232 @@
+"""
+📜 GGUF HEADER PARSER 📜
+Reads model metadata without loading the model (pure Python, no llama.cpp).
+
+A GGUF file starts with a small header:
+    magic "GGUF" | version | tensor_count | kv_count
+    kv_count x (key, type, value)          <- architecture, context length, tokenizer...
+    tensor_count x (name, dims, type, offset)
+followed by the tensor data (gigabytes) which we never touch. Parsing the
+header is one sequential read of a few MB (mostly the tokenizer vocabulary),
+so it's cheap even on the 12T spinning drive.
+
+Also holds the VRAM estimate used by the model catalog / pool:
+    weights (exact tensor bytes) + KV cache (f16, n_ctx) + compute buffers + CUDA overhead
+"""
+
+import os
+import struct
+from typing import Any, BinaryIO, Dict, Optional
+
+GGUF_MAGIC = b"GGUF"
+READ_BUFFER_BYTES = 1024 * 1024
+
+# GGUF metadata value types
+_UINT8, _INT8, _UINT16, _INT16, _UINT32, _INT32, _FLOAT32, _BOOL, _STRING, _ARRAY, _UINT64, _INT64, _FLOAT64 = range(13)
+_SCALAR_FORMATS = {
+    _UINT8: "<B", _INT8: "<b", _UINT16: "<H", _INT16: "<h", _UINT32: "<I", _INT32: "<i",
+    _FLOAT32: "<f", _BOOL: "<?", _UINT64: "<Q", _INT64: "<q", _FLOAT64: "<d",
+}
+
+# ggml tensor type -> (name, elements per block, bytes per block)
+GGML_TYPES = {
+    0: ("F32", 1, 4), 1: ("F16", 1, 2), 2: ("Q4_0", 32, 18), 3: ("Q4_1", 32, 20),
+    6: ("Q5_0", 32, 22), 7: ("Q5_1", 32, 24), 8: ("Q8_0", 32, 34), 9: ("Q8_1", 32, 40),
+    10: ("Q2_K", 256, 84), 11: ("Q3_K", 256, 110), 12: ("Q4_K", 256, 144), 13: ("Q5_K", 256, 176),
+    14: ("Q6_K", 256, 210), 15: ("Q8_K", 256, 292), 16: ("IQ2_XXS", 256, 66), 17: ("IQ2_XS", 256, 74),
+    18: ("IQ3_XXS", 256, 98), 19: ("IQ1_S", 256, 50), 20: ("IQ4_NL", 32, 18), 21: ("IQ3_S", 256, 110),
+    22: ("IQ2_S", 256, 82), 23: ("IQ4_XS", 256, 136), 24: ("I8", 1, 1), 25: ("I16", 1, 2),
+    26: ("I32", 1, 4), 27: ("I64", 1, 8), 28: ("F64", 1, 8), 29: ("IQ1_M", 256, 56),
+    30: ("BF16", 1, 2), 34: ("TQ1_0", 256, 54), 35: ("TQ2_0", 256, 66), 39: ("MXFP4", 32, 17),
+}
+
+# general.file_type (llama_ftype) -> quantization label
+FILE_TYPES = {
+    0: "F32", 1: "F16", 2: "Q4_0", 3: "Q4_1", 7: "Q8_0", 8: "Q5_0", 9: "Q5_1", 10: "Q2_K",
+    11: "Q3_K_S", 12: "Q3_K_M", 13: "Q3_K_L", 14: "Q4_K_S", 15: "Q4_K_M", 16: "Q5_K_S",
+    17: "Q5_K_M", 18: "Q6_K", 19: "IQ2_XXS", 20: "IQ2_XS", 21: "Q2_K_S", 22: "IQ3_XS",
+    23: "IQ3_XXS", 24: "IQ1_S", 25: "IQ4_NL", 26: "IQ3_S", 27: "IQ3_M", 28: "IQ2_S",
+    29: "IQ2_M", 30: "IQ4_XS", 31: "IQ1_M", 32: "BF16", 36: "TQ1_0", 37: "TQ2_0", 38: "MXFP4_MOE",
+}
+
+# VRAM estimate knobs
+DEFAULT_ESTIMATE_CTX = 8192      # matches n_ctx used by /ai/models/load
+DEFAULT_ESTIMATE_BATCH = 512
+CUDA_OVERHEAD_MB = int(os.getenv("MODEL_CUDA_OVERHEAD_MB", "400"))
+
+
+class GGUFError(ValueError):
+    """Not a GGUF file / truncated or unsupported header"""
+
+
+class _Reader:
+    def __init__(self, f: BinaryIO):
+        self.f = f
+
+    def read(self, n: int) -> bytes:
+        data = self.f.read(n)
+        if len(data) != n:
+            raise GGUFError("Truncated GGUF header")
+        return data
+
+    def scalar(self, fmt: str):
+        return struct.unpack(fmt, self.read(struct.calcsize(fmt)))[0]
+
+    def string(self) -> str:
+        return self.read(self.scalar("<Q")).decode("utf-8", errors="replace")
+
+    def skip_string(self):
+        self.f.seek(self.scalar("<Q"), os.SEEK_CUR)
+
+    def value(self, value_type: int) -> Any:
+        if value_type in _SCALAR_FORMATS:
+            return self.scalar(_SCALAR_FORMATS[value_type])
+        if value_type == _STRING:
+            return self.string()
+        if value_type == _ARRAY:
+            item_type = self.scalar("<I")
+            count = self.scalar("<Q")
+            if item_type in _SCALAR_FORMATS:
+                size = struct.calcsize(_SCALAR_FORMATS[item_type])
+                if count <= 64:
+                    return list(struct.unpack(f"<{count}{_SCALAR_FORMATS[item_type][1]}", self.read(size * count)))
+                # Token scores / types etc. - only the length is interesting
+                self.f.seek(size * count, os.SEEK_CUR)
+                return _ArrayLength(count)
+            if item_type == _STRING:
+                for _ in range(count):
+                    self.skip_string()
+                return _ArrayLength(count)
+            # Nested arrays (rare) - parse and drop
+            for _ in range(count):
+                self.value(item_type)
+            return _ArrayLength(count)
+        raise GGUFError(f"Unknown GGUF value type {value_type}")
+
+
+class _ArrayLength(int):
+    """Placeholder for large arrays: we keep just the element count"""
+
+
+def read_gguf_header(path: str) -> dict:
+    """
+    Parse the GGUF header of `path` (blocking).
+    Returns {"version", "metadata": {key: scalar}, "array_lengths": {key: n},
+             "tensor_count", "tensor_bytes", "n_params", "tensor_types": {type: count}}
+    """
+    with open(path, "rb", buffering=READ_BUFFER_BYTES) as f:
+        reader = _Reader(f)
+        if reader.read(4) != GGUF_MAGIC:
+            raise GGUFError("Not a GGUF file")
+        version = reader.scalar("<I")
+        if version < 2:
+            raise GGUFError(f"GGUF v{version} is not supported")
+        tensor_count = reader.scalar("<Q")
+        kv_count = reader.scalar("<Q")
+
+        metadata: Dict[str, Any] = {}
+        array_lengths: Dict[str, int] = {}
+        for _ in range(kv_count):
+            key = reader.string()
+            value = reader.value(reader.scalar("<I"))
+            if isinstance(value, _ArrayLength):
+                array_lengths[key] = int(value)
+            else:
+                metadata[key] = value
+
+        tensor_bytes = 0
+        n_params = 0
+        tensor_types: Dict[str, int] = {}
+        for _ in range(tensor_count):
+            reader.skip_string()
+            n_dims = reader.scalar("<I")
+            n_elements = 1
+            for _ in range(n_dims):
+                n_elements *= reader.scalar("<Q")
+            ggml_type = reader.scalar("<I")
+            reader.scalar("<Q")   # data offset
+            type_name, block_size, block_bytes = GGML_TYPES.get(ggml_type, (f"TYPE_{ggml_type}", 1, 0))
+            tensor_bytes += n_elements // block_size * block_bytes
+            n_params += n_elements
+            tensor_types[type_name] = tensor_types.get(type_name, 0) + 1
+
+    return {
+        "version": version,
+        "metadata": metadata,
+        "array_lengths": array_lengths,
+        "tensor_count": tensor_count,
+        "tensor_bytes": tensor_bytes,
+        "n_params": n_params,
+        "tensor_types": tensor_types,
+    }
+
+
+def summarize_header(header: dict) -> dict:
+    """Catalog fields (architecture, quantization, context length, layers...) from a parsed header"""
+    meta = header["metadata"]
+    arch = meta.get("general.architecture")
+
+    def arch_value(name: str) -> Optional[Any]:
+        return meta.get(f"{arch}.{name}") if arch else None
+
+    n_embd = arch_value("embedding_length")
+    n_head = arch_value("attention.head_count")
+    n_head_kv = arch_value("attention.head_count_kv") or n_head
+    # head_count can be a per-layer array in some architectures - use the first layer
+    if isinstance(n_head, list):
+        n_head = n_head[0] if n_head else None
+    if isinstance(n_head_kv, list):
+        n_head_kv = n_head_kv[0] if n_head_kv else None
+
+    file_type = meta.get("general.file_type")
+    if file_type in FILE_TYPES:
+        quantization = FILE_TYPES[file_type]
+    elif header["tensor_types"]:
+        # Most common tensor type as a fallback
+        quantization = max(header["tensor_types"].items(), key=lambda item: item[1])[0]
+    else:
+        quantization = None
+
+    return {
+        "architecture": arch,
+        "model_name": meta.get("general.name"),
+        "quantization": quantization,
+        "context_length": arch_value("context_length"),
+        "n_layer": arch_value("block_count"),
+        "n_embd": n_embd,
+        "n_head": n_head,
+        "n_head_kv": n_head_kv,
+        "head_dim": arch_value("attention.key_length") or (n_embd // n_head if n_embd and n_head else None),
+        "n_vocab": arch_value("vocab_size") or header["array_lengths"].get("tokenizer.ggml.tokens"),
+        "n_expert": arch_value("expert_count"),
+        "n_params": header["n_params"],
+        "tensor_count": header["tensor_count"],
+        "tensor_bytes": header["tensor_bytes"],
+        "tensor_types": header["tensor_types"],
+    }
+
+
+def estimate_vram_mb(summary: dict, n_ctx: int = DEFAULT_ESTIMATE_CTX,
+                     n_batch: int = DEFAULT_ESTIMATE_BATCH) -> Optional[float]:
+    """
+    MB needed to run the model fully offloaded with n_ctx context:
+    - weights: exact tensor bytes from the header
+    - KV cache: 2 (K+V) * n_layer * n_ctx * n_head_kv * head_dim * 2 bytes (f16)
+    - compute: logits + attention scores for one n_batch ubatch
+    - CUDA context / cuBLAS workspace (MODEL_CUDA_OVERHEAD_MB)
+    None if the header lacks the needed fields.
+    """
+    n_layer = summary.get("n_layer")
+    n_head_kv = summary.get("n_head_kv")
+    head_dim = summary.get("head_dim")
+    if not summary.get("tensor_bytes") or not n_layer or not n_head_kv or not head_dim:
+        return None
+    if summary.get("context_length"):
+        n_ctx = min(n_ctx, summary["context_length"])
+
+    weights = summary["tensor_bytes"]
+    kv_cache = 2 * n_layer * n_ctx * n_head_kv * head_dim * 2
+    n_vocab = summary.get("n_vocab") or 0
+    n_head = summary.get("n_head") or n_head_kv
+    compute = n_batch * n_vocab * 4 + n_head * n_ctx * n_batch * 4
+    return round((weights + kv_cache + compute) / (1024 * 1024) + CUDA_OVERHEAD_MB, 1)
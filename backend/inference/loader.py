@@ -0,0 +1,296 @@
+"""
+📦 MODEL LOAD JOBS 📦
+Cancellable GGUF loading with byte-level progress and a time breakdown.
+
+A load goes through these phases (seconds recorded in job.phases):
+- read:    sequential read of the file into the page cache (off the inference thread),
+           byte progress + cancel between chunks; skipped if the file doesn't fit in RAM
+- draft:   speculative draft model (only if configured)
+- mmap:    Llama() start -> first llama.cpp progress callback (open, metadata, mmap)
+- offload: llama.cpp progress 0 -> 1 (tensor data to RAM/VRAM)
+- context: progress 1 -> Llama() returned (KV cache, compute buffers)
+
+llama-cpp-python doesn't expose llama_model_params.progress_callback, so
+during Llama() construction the params factory is wrapped to install our
+callback (only for the loading thread). Returning False from the callback
+makes llama.cpp abort the load - that is how cancel works mid-load.
+"""
+
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK_BYTES = 64 * 1024 * 1024
+MAX_FINISHED_JOBS = 20
+# MODEL_USE_MLOCK: auto (default) / 1 / 0
+MLOCK_MODE = os.getenv("MODEL_USE_MLOCK", "auto").lower()
+
+_job_ids = itertools.count(1)
+# Only one Llama() construction may wrap the params factory at a time
+_params_patch_lock = threading.Lock()
+
+
+class LoadCancelled(Exception):
+    """Model load was cancelled by the user"""
+
+
+def _available_ram_bytes() -> Optional[int]:
+    try:
+        import psutil
+        return psutil.virtual_memory().available
+    except Exception:
+        return None
+
+
+def mlock_policy(model_path: str) -> tuple:
+    """
+    (use_mlock, reason). Replaces the old '"/mnt/" in path' check:
+    mlock pins the whole file in RAM, so only do it when it fits and the file
+    lives on the root filesystem (external drives page in too slowly for mlock).
+    """
+    if MLOCK_MODE in ("1", "true", "on"):
+        return True, "MODEL_USE_MLOCK=1"
+    if MLOCK_MODE in ("0", "false", "off"):
+        return False, "MODEL_USE_MLOCK=0"
+    try:
+        size = os.path.getsize(model_path)
+        same_device = os.stat(model_path).st_dev == os.stat("/").st_dev
+    except OSError as e:
+        return False, f"stat failed: {e}"
+    if not same_device:
+        return False, "model on a separate (external) filesystem"
+    available = _available_ram_bytes()
+    if available is not None and size > available * 0.8:
+        return False, "model larger than 80% of available RAM"
+    return True, "local filesystem, fits in RAM"
+
+
+class ModelLoadJob:
+    """One model load (state + progress), filled in by the loading threads"""
+
+    def __init__(self, model_name: str, model_path: str, source: str = "api"):
+        self.id = next(_job_ids)
+        self.model_name = model_name
+        self.model_path = str(model_path)
+        self.source = source
+        self.state = "queued"   # queued -> reading -> loading -> ready | failed | cancelled
+        self.error: Optional[str] = None
+        self.bytes_total = 0
+        self.bytes_read = 0
+        self.read_skipped_reason: Optional[str] = None
+        self.load_progress = 0.0   # llama.cpp progress callback (0..1)
+        self.use_mlock: Optional[bool] = None
+        self.mlock_reason: Optional[str] = None
+        self.phases: "OrderedDict[str, float]" = OrderedDict()
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.cancel_event = threading.Event()
+        # Set when the load job is queued on the inference worker (lets cancel() drop it)
+        self.worker_job = None
+
+        self._load_started: Optional[float] = None
+        self._first_progress: Optional[float] = None
+        self._progress_done: Optional[float] = None
+
+        try:
+            self.bytes_total = os.path.getsize(self.model_path)
+        except OSError:
+            pass
+
+    # ==================== STATE ====================
+    @property
+    def done(self) -> bool:
+        return self.state in ("ready", "failed", "cancelled")
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def cancel(self) -> bool:
+        if self.done:
+            return False
+        self.cancel_event.set()
+        return True
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise LoadCancelled(f"Loading {self.model_name} cancelled")
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.finished_at = time.time()
+        if error is None:
+            self.state = "ready"
+            self.load_progress = 1.0
+        elif isinstance(error, LoadCancelled) or self.cancel_event.is_set():
+            self.state = "cancelled"
+            self.error = str(error) or "cancelled"
+        else:
+            self.state = "failed"
+            self.error = str(error)
+        total = self.finished_at - self.created_at
+        logger.info(f"📦 Load {self.model_name}: {self.state} in {total:.1f}s {dict(self.phases)}")
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = round(self.phases.get(name, 0.0) + time.perf_counter() - started, 3)
+
+    @property
+    def progress(self) -> float:
+        """Overall 0..1 - read phase and llama.cpp load count half each"""
+        if self.state == "ready":
+            return 1.0
+        read_part = 1.0 if self.read_skipped_reason or not self.bytes_total else self.bytes_read / self.bytes_total
+        return round(0.5 * read_part + 0.5 * self.load_progress, 4)
+
+    # ==================== PHASE 1: READ ====================
+    def prefetch(self, chunk_bytes: int = READ_CHUNK_BYTES):
+        """Stream the GGUF through the page cache so mmap in llama.cpp doesn't hit the disk (blocking)"""
+        self.check_cancelled()
+        available = _available_ram_bytes()
+        if available is not None and self.bytes_total > available * 0.8:
+            # Would evict itself from the page cache before llama.cpp gets to it
+            self.read_skipped_reason = "model larger than 80% of available RAM"
+            return
+
+        self.state = "reading"
+        buffer = bytearray(chunk_bytes)
+        view = memoryview(buffer)
+        with self.phase("read"):
+            with open(self.model_path, "rb", buffering=0) as f:
+                if hasattr(os, "posix_fadvise"):
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                while True:
+                    self.check_cancelled()
+                    n = f.readinto(view)
+                    if not n:
+                        break
+                    self.bytes_read += n
+
+    # ==================== PHASE 2: LLAMA.CPP LOAD ====================
+    def load(self, **llama_kwargs):
+        """Construct Llama(model_path, **llama_kwargs) with progress + cancel (blocking)"""
+        self.check_cancelled()
+        from llama_cpp import Llama
+        import llama_cpp.llama_cpp as llama_cpp_lib
+
+        if "use_mlock" not in llama_kwargs:
+            self.use_mlock, self.mlock_reason = mlock_policy(self.model_path)
+            llama_kwargs["use_mlock"] = self.use_mlock
+        else:
+            self.use_mlock, self.mlock_reason = llama_kwargs["use_mlock"], "explicit"
+
+        callback = llama_cpp_lib.llama_progress_callback(self._on_progress)
+        original_params = llama_cpp_lib.llama_model_default_params
+        loader_thread = threading.current_thread()
+
+        def params_with_progress():
+            params = original_params()
+            if threading.current_thread() is loader_thread:
+                params.progress_callback = callback
+            return params
+
+        self.state = "loading"
+        self._load_started = time.perf_counter()
+        with _params_patch_lock:
+            llama_cpp_lib.llama_model_default_params = params_with_progress
+            try:
+                model = Llama(model_path=self.model_path, **llama_kwargs)
+            except Exception:
+                self.check_cancelled()   # aborted by our callback -> LoadCancelled
+                raise
+            finally:
+                llama_cpp_lib.llama_model_default_params = original_params
+
+        ended = time.perf_counter()
+        first = self._first_progress or ended
+        progress_done = self._progress_done or first
+        self.phases["mmap"] = round(first - self._load_started, 3)
+        self.phases["offload"] = round(progress_done - first, 3)
+        self.phases["context"] = round(ended - progress_done, 3)
+
+        if self.cancel_event.is_set():
+            # Cancelled after llama.cpp finished loading - drop it
+            del model
+            raise LoadCancelled(f"Loading {self.model_name} cancelled")
+        return model
+
+    def _on_progress(self, progress: float, user_data) -> bool:
+        # Called from inside llama.cpp - must never raise
+        now = time.perf_counter()
+        if self._first_progress is None:
+            self._first_progress = now
+        if progress >= 1.0 and self._progress_done is None:
+            self._progress_done = now
+        self.load_progress = float(progress)
+        return not self.cancel_event.is_set()
+
+    def to_dict(self) -> dict:
+        read_seconds = self.phases.get("read")
+        return {
+            "job_id": self.id,
+            "model_name": self.model_name,
+            "model_path": self.model_path,
+            "source": self.source,
+            "state": self.state,
+            "progress": self.progress,
+            "bytes_total": self.bytes_total,
+            "bytes_read": self.bytes_read,
+            "read_mb_per_second": round(self.bytes_read / read_seconds / 1e6, 1) if read_seconds else None,
+            "read_skipped_reason": self.read_skipped_reason,
+            "load_progress": round(self.load_progress, 4),
+            "use_mlock": self.use_mlock,
+            "mlock_reason": self.mlock_reason,
+            "phases": dict(self.phases),
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "elapsed_seconds": round((self.finished_at or time.time()) - self.created_at, 2)
+        }
+
+
+class ModelLoader:
+    """Registry of load jobs (one active at a time, last MAX_FINISHED_JOBS kept)"""
+
+    def __init__(self):
+        self._jobs: "OrderedDict[int, ModelLoadJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, model_name: str, model_path: str, source: str = "api") -> ModelLoadJob:
+        job = ModelLoadJob(model_name, model_path, source)
+        with self._lock:
+            self._jobs[job.id] = job
+            finished = [jid for jid, j in self._jobs.items() if j.done]
+            for jid in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+                del self._jobs[jid]
+        return job
+
+    def get(self, job_id: int) -> Optional[ModelLoadJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active(self) -> Optional[ModelLoadJob]:
+        with self._lock:
+            return next((j for j in reversed(self._jobs.values()) if not j.done), None)
+
+    def latest(self) -> Optional[ModelLoadJob]:
+        with self._lock:
+            return next(reversed(self._jobs.values()), None) if self._jobs else None
+
+    def list(self) -> list:
+        with self._lock:
+            return [job.to_dict() for job in reversed(self._jobs.values())]
+
+
+# 🎯 GLOBAL MODEL LOADER INSTANCE
+model_loader = ModelLoader()
@@ -0,0 +1,174 @@
+"""
+🗂️ MODEL POOL 🗂️
+Keeps several GGUF models resident and routes requests to them.
+
+Loading a model from /mnt/12T/models takes tens of seconds, so instead of
+deleting the current model on every switch we keep multiple Llama
+instances warm under a memory budget (MODEL_POOL_BUDGET_MB, default = total
+GPU memory) and evict the least recently used one when a new model needs room.
+
+All mutations happen on the inference worker thread; reads are lock-protected.
+"""
+
+import gc
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Same overhead assumption as /ai/models (KV cache + scratch buffers)
+MODEL_OVERHEAD_MB = 2048
+
+
+def default_budget_mb() -> float:
+    """MODEL_POOL_BUDGET_MB env, else total GPU memory, else 24GB"""
+    env_budget = os.getenv("MODEL_POOL_BUDGET_MB")
+    if env_budget:
+        return float(env_budget)
+    try:
+        import GPUtil
+        total = sum(gpu.memoryTotal for gpu in GPUtil.getGPUs())
+        if total > 0:
+            return float(total)
+    except Exception:
+        pass
+    return 24000.0
+
+
+def estimate_model_mb(model_path: str) -> float:
+    """Naive resident size estimate: file size + fixed overhead"""
+    try:
+        return os.path.getsize(model_path) / (1024 * 1024) + MODEL_OVERHEAD_MB
+    except OSError:
+        return float(MODEL_OVERHEAD_MB)
+
+
+class PooledModel:
+    """One resident Llama instance"""
+
+    def __init__(self, name: str, model: Any, size_mb: float):
+        self.name = name
+        self.model = model
+        self.size_mb = size_mb
+        self.loaded_at = time.time()
+        self.last_used = self.loaded_at
+        self.uses = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "size_mb": round(self.size_mb, 0),
+            "loaded_at": self.loaded_at,
+            "last_used": self.last_used,
+            "uses": self.uses
+        }
+
+
+class ModelPool:
+    """LRU pool of resident models bounded by a memory budget"""
+
+    def __init__(self, budget_mb: Optional[float] = None):
+        self.budget_mb = budget_mb if budget_mb is not None else default_budget_mb()
+        self._models: "OrderedDict[str, PooledModel]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Called with the model name after eviction (e.g. drop its prefix-cache states)
+        self.on_evict: Optional[Callable[[str], None]] = None
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # ==================== LOOKUP ====================
+    def get(self, name: Optional[str]) -> Optional[Any]:
+        """Resident model by name (marks it most recently used)"""
+        if not name:
+            return None
+        with self._lock:
+            entry = self._models.get(name)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._models.move_to_end(name)
+            entry.last_used = time.time()
+            entry.uses += 1
+            self.hits += 1
+            return entry.model
+
+    def peek(self, name: Optional[str]) -> Optional[Any]:
+        """Resident model by name without touching LRU order / stats"""
+        if not name:
+            return None
+        with self._lock:
+            entry = self._models.get(name)
+            return entry.model if entry else None
+
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            return name in self._models
+
+    def names(self) -> List[str]:
+        """Resident model names, most recently used last"""
+        with self._lock:
+            return list(self._models.keys())
+
+    @property
+    def used_mb(self) -> float:
+        with self._lock:
+            return sum(entry.size_mb for entry in self._models.values())
+
+    # ==================== MUTATION (inference thread) ====================
+    def make_room(self, size_mb: float, keep: Optional[str] = None):
+        """Evict LRU models until `size_mb` more fits in the budget"""
+        while True:
+            with self._lock:
+                used = sum(entry.size_mb for entry in self._models.values())
+                if used + size_mb <= self.budget_mb:
+                    return
+                victim = next((name for name in self._models if name != keep), None)
+            if victim is None:
+                # Nothing left to evict - try anyway, llama.cpp will fail loudly if it doesn't fit
+                return
+            logger.info(f"🗂️ Evicting {victim} to make room for {size_mb:.0f} MB")
+            self.remove(victim)
+            self.evictions += 1
+
+    def add(self, name: str, model: Any, size_mb: float):
+        """Register a loaded model (replaces an existing instance with the same name)"""
+        self.remove(name)
+        self.make_room(size_mb)
+        with self._lock:
+            self._models[name] = PooledModel(name, model, size_mb)
+
+    def remove(self, name: str) -> bool:
+        """Drop a resident model and free its memory"""
+        with self._lock:
+            entry = self._models.pop(name, None)
+        if entry is None:
+            return False
+        try:
+            del entry.model
+        except Exception:
+            pass
+        del entry
+        gc.collect()
+        if self.on_evict is not None:
+            self.on_evict(name)
+        return True
+
+    def get_status(self) -> dict:
+        with self._lock:
+            used = sum(entry.size_mb for entry in self._models.values())
+            return {
+                "budget_mb": round(self.budget_mb, 0),
+                "used_mb": round(used, 0),
+                "free_mb": round(self.budget_mb - used, 0),
+                "models": [entry.to_dict() for entry in self._models.values()],
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
@@ -0,0 +1,160 @@
+"""
+💾 PROMPT PREFIX KV-STATE CACHE 💾
+Pays the prompt-processing cost of the static system prompt once.
+
+Every /ai/chat prompt starts with the same Llama 3.1 system section
+(base uncensored prompt + capability addons). We evaluate that prefix once,
+snapshot the llama.cpp state (save_state) and restore it (load_state) for
+the next request with the same prefix. llama-cpp-python's generate() then
+sees the matching prefix in its input_ids and only evaluates the suffix.
+
+Entries are keyed by sha256(model_name + prefix) and evicted LRU when the
+total state size exceeds the RAM budget (PREFIX_CACHE_MAX_MB).
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_MB = int(os.getenv("PREFIX_CACHE_MAX_MB", "1024"))
+
+# Prefixes shorter than this are cheaper to re-evaluate than to restore
+MIN_PREFIX_TOKENS = 32
+
+
+class PrefixEntry:
+    """One cached llama.cpp state snapshot"""
+
+    def __init__(self, model_name: str, state: Any, tokens: List[int]):
+        self.model_name = model_name
+        self.state = state
+        self.tokens = tokens
+        self.size_bytes = int(getattr(state, "llama_state_size", 0) or 0)
+        self.created_at = time.time()
+        self.hits = 0
+
+
+class PrefixStateCache:
+    """
+    LRU cache of llama.cpp states for system-prompt prefixes.
+    All prime() calls happen on the inference worker thread.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, PrefixEntry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.skipped = 0
+        self.tokens_saved = 0
+
+    @staticmethod
+    def make_key(model_name: str, prefix: str) -> str:
+        return hashlib.sha256(f"{model_name}\x00{prefix}".encode("utf-8")).hexdigest()
+
+    # ==================== LRU ====================
+    def get(self, key: str) -> Optional[PrefixEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, entry: PrefixEntry):
+        with self._lock:
+            if entry.size_bytes > self.max_bytes:
+                logger.warning(f"⚠️ Prefix state ({entry.size_bytes / 1e6:.1f} MB) bigger than cache budget, not cached")
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old.size_bytes
+            self._entries[key] = entry
+            self._bytes += entry.size_bytes
+            while self._bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size_bytes
+                self.evictions += 1
+
+    def clear(self):
+        """Drop all states"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def drop_model(self, model_name: str):
+        """Drop states of one model (they belong to that model instance)"""
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if e.model_name == model_name]:
+                self._bytes -= self._entries.pop(key).size_bytes
+
+    # ==================== PRIMING ====================
+    def prime(self, model, model_name: str, prefix: str) -> str:
+        """
+        Make sure model's KV cache starts with `prefix` before generation.
+        Returns 'hit', 'miss', 'resident' (already in KV) or 'skipped'.
+        Must run on the inference thread (touches llama.cpp context).
+        """
+        if not prefix:
+            return "skipped"
+
+        key = self.make_key(model_name, prefix)
+        entry = self.get(key)
+
+        if entry is not None:
+            if _kv_starts_with(model, entry.tokens):
+                # Previous request left the same prefix in KV - nothing to restore
+                entry.hits += 1
+                self.hits += 1
+                self.tokens_saved += len(entry.tokens)
+                return "resident"
+            model.load_state(entry.state)
+            entry.hits += 1
+            self.hits += 1
+            self.tokens_saved += len(entry.tokens)
+            return "hit"
+
+        tokens = model.tokenize(prefix.encode("utf-8"), special=True)
+        if len(tokens) < MIN_PREFIX_TOKENS or len(tokens) >= model.n_ctx():
+            self.skipped += 1
+            return "skipped"
+
+        self.misses += 1
+        if not _kv_starts_with(model, tokens):
+            model.reset()
+            model.eval(tokens)
+        self.put(key, PrefixEntry(model_name, model.save_state(), tokens))
+        return "miss"
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "size_mb": round(self._bytes / (1024 * 1024), 1),
+                "max_mb": round(self.max_bytes / (1024 * 1024), 1),
+                "hits": self.hits,
+                "misses": self.misses,
+                "skipped": self.skipped,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "prompt_tokens_saved": self.tokens_saved
+            }
+
+
+def _kv_starts_with(model, tokens: List[int]) -> bool:
+    """True if the model's evaluated tokens already begin with `tokens`"""
+    n = len(tokens)
+    if model.n_tokens < n:
+        return False
+    return list(model.input_ids[:n]) == list(tokens)
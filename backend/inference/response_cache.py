@@ -0,0 +1,244 @@
+"""
+🗃️ CHAT RESPONSE CACHE 🗃️
+Answers repeated /ai/chat questions without touching the model.
+
+Greetings, "koliko je sati", IPTV support FAQs... are asked verbatim over
+and over. A finished response is stored under
+    sha256(model, system-prompt hash, normalized message, sampling params)
+with TTL (RESPONSE_CACHE_TTL) and LRU eviction (RESPONSE_CACHE_MAX_ENTRIES).
+
+Two tiers:
+- exact: normalized message (case / whitespace insensitive)
+- semantic (RESPONSE_CACHE_SEMANTIC=1 + EMBEDDING_MODEL_PATH): nearest cached
+  message with the same model/system prompt/params, cosine >= RESPONSE_CACHE_SIMILARITY
+
+The key has no user or clock in it, so:
+- questions about the current date/time never use the cache (they'd go stale)
+- only answers generated WITHOUT chat history are stored (a history-bearing
+  answer would leak the user's turns to other users)
+- with history attached, a self-contained question (no reference to earlier
+  turns or to the user, see refers_to_conversation) may still be answered from
+  the shared entries, so FAQs hit in the default include_history setup
+Only low-temperature (near deterministic) requests use the cache automatically,
+others must opt in.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL", "600"))
+DEFAULT_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000"))
+# Requests at or below this temperature are cached without opt-in
+DEFAULT_MAX_TEMPERATURE = float(os.getenv("RESPONSE_CACHE_MAX_TEMPERATURE", "0.3"))
+SEMANTIC_ENABLED = os.getenv("RESPONSE_CACHE_SEMANTIC", "0") == "1"
+DEFAULT_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+
+_WHITESPACE = re.compile(r"\s+")
+# Answers that depend on the clock (the prompt's date line) must not be replayed
+_TIME_SENSITIVE = re.compile(
+    r"\b(koliko je sati|koje je vrijeme|koji je (danas )?datum|koji je dan|danas|sutra|jučer|sada|trenutno|"
+    r"what time|what day|what date|today|tomorrow|yesterday|right now|current time|current date)\b"
+)
+
+# Follow-ups and personal questions depend on the conversation ("a zašto?", "kako se zovem",
+# "explain it again") - deliberately broad: a false positive only costs a cache miss
+_CONVERSATION_REFERENCE = re.compile(
+    r"\b(it|its|that|this|these|those|they|them|he|she|him|her|i|me|my|mine|myself|we|us|our|"
+    r"again|above|previous|earlier|before|continue|more|same|also|last|why|you said|your answer|"
+    r"to|ovo|ono|taj|ta|tog|toga|tome|tim|njega|njemu|nju|njoj|njih|oni|opet|gore|prethodn\w*|ranij\w*|"
+    r"nastavi\w*|još|isto|također|takođe|zašto|ja|mene|meni|mi|moj\w*|naš\w*|nas|nama|sam|smo|"
+    r"zovem|imam|živim|radim|rekao si|rekla si|tvoj odgovor)\b"
+)
+
+
+def normalize_message(message: str) -> str:
+    return _WHITESPACE.sub(" ", message.strip().lower())
+
+
+def is_time_sensitive(message: str) -> bool:
+    return _TIME_SENSITIVE.search(normalize_message(message)) is not None
+
+
+def refers_to_conversation(message: str) -> bool:
+    """True if the answer may depend on earlier turns or on who is asking"""
+    return _CONVERSATION_REFERENCE.search(normalize_message(message)) is not None
+
+
+class CachedResponse:
+    """One stored answer"""
+
+    def __init__(self, key: str, scope: str, message: str, response: str,
+                 model_name: str, embedding: Optional[np.ndarray] = None):
+        self.key = key
+        self.scope = scope
+        self.message = message
+        self.response = response
+        self.model_name = model_name
+        self.embedding = embedding
+        self.created_at = time.time()
+        self.hits = 0
+
+
+class ResponseCache:
+    """TTL + LRU response cache with an optional embedding-similarity tier"""
+
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_temperature: float = DEFAULT_MAX_TEMPERATURE,
+                 semantic: bool = SEMANTIC_ENABLED, similarity: float = DEFAULT_SIMILARITY):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_temperature = max_temperature
+        self.semantic = semantic
+        self.similarity = similarity
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        # scope -> {key: None}; scope = everything in the key except the message
+        self._scopes: Dict[str, Dict[str, None]] = {}
+        self._lock = threading.Lock()
+
+        # Stats
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    # ==================== KEYS ====================
+    @staticmethod
+    def make_scope(model_name: str, system_prompt: str, params: dict) -> str:
+        system_hash = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+        sampling = json.dumps(params, sort_keys=True, default=str)
+        return hashlib.sha256(f"{model_name}\x00{system_hash}\x00{sampling}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def make_key(scope: str, message: str) -> str:
+        return hashlib.sha256(f"{scope}\x00{normalize_message(message)}".encode("utf-8")).hexdigest()
+
+    def should_use(self, temperature: float, opt_in: Optional[bool]) -> bool:
+        """opt_in: True = always, False = never, None = only at low temperature"""
+        if opt_in is not None:
+            use = opt_in
+        else:
+            use = temperature <= self.max_temperature
+        if not use:
+            self.bypassed += 1
+        return use
+
+    # ==================== LOOKUP ====================
+    def get(self, scope: str, message: str,
+            embedding: Optional[np.ndarray] = None) -> Optional[Tuple[CachedResponse, str, float]]:
+        """(entry, tier, similarity) or None"""
+        key = self.make_key(scope, message)
+        with self._lock:
+            entry = self._get_fresh_locked(key)
+            if entry is not None:
+                self.exact_hits += 1
+                entry.hits += 1
+                return entry, "exact", 1.0
+
+            if embedding is not None:
+                match = self._nearest_locked(scope, embedding)
+                if match is not None:
+                    entry, score = match
+                    self._entries.move_to_end(entry.key)
+                    self.semantic_hits += 1
+                    entry.hits += 1
+                    return entry, "semantic", score
+
+            self.misses += 1
+            return None
+
+    def _get_fresh_locked(self, key: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry.created_at > self.ttl_seconds:
+            self._remove_locked(key)
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _nearest_locked(self, scope: str, embedding: np.ndarray) -> Optional[Tuple[CachedResponse, float]]:
+        keys = [k for k in self._scopes.get(scope, ()) if self._entries[k].embedding is not None]
+        if not keys:
+            return None
+        now = time.time()
+        keys = [k for k in keys if now - self._entries[k].created_at <= self.ttl_seconds]
+        if not keys:
+            return None
+        matrix = np.stack([self._entries[k].embedding for k in keys])
+        scores = matrix @ embedding
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity:
+            return None
+        return self._entries[keys[best]], float(scores[best])
+
+    # ==================== STORE ====================
+    def put(self, scope: str, message: str, response: str, model_name: str,
+            embedding: Optional[np.ndarray] = None):
+        if not response:
+            return
+        key = self.make_key(scope, message)
+        with self._lock:
+            self._remove_locked(key)
+            self._entries[key] = CachedResponse(key, scope, message, response, model_name, embedding)
+            self._scopes.setdefault(scope, {})[key] = None
+            self.stores += 1
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove_locked(oldest)
+                self.evictions += 1
+
+    def _remove_locked(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        scope_keys = self._scopes.get(entry.scope)
+        if scope_keys is not None:
+            scope_keys.pop(key, None)
+            if not scope_keys:
+                del self._scopes[entry.scope]
+
+    def clear(self, model_name: Optional[str] = None) -> int:
+        """Drop all entries (or one model's), returns number removed"""
+        with self._lock:
+            keys = [k for k, e in self._entries.items() if model_name is None or e.model_name == model_name]
+            for key in keys:
+                self._remove_locked(key)
+            return len(keys)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "max_temperature": self.max_temperature,
+                "semantic_enabled": self.semantic,
+                "similarity_threshold": self.similarity,
+                "hits": hits,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+                "bypassed": self.bypassed,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+
+# 🎯 GLOBAL RESPONSE CACHE INSTANCE
+response_cache = ResponseCache()
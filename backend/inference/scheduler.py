@@ -0,0 +1,263 @@
+"""
+🚦 FAIR REQUEST SCHEDULER 🚦
+Admission control in front of the single loaded model.
+
+- Priority lanes: system (model load/unload) > admin > user
+- Round-robin across user_id inside a lane, so one user flooding /ai/chat
+  can't push everyone else to the back of the line
+- Bounded queue depth -> QueueFullError (mapped to HTTP 429 by the API)
+- Queue position + ETA for every waiting job
+"""
+
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, List, Optional
+
+# Priority lanes (lower = served first)
+PRIORITY_SYSTEM = 0
+PRIORITY_ADMIN = 1
+PRIORITY_USER = 2
+
+LANE_NAMES = {
+    PRIORITY_SYSTEM: "system",
+    PRIORITY_ADMIN: "admin",
+    PRIORITY_USER: "user"
+}
+
+DEFAULT_MAX_QUEUE_DEPTH = int(os.getenv("INFERENCE_MAX_QUEUE_DEPTH", "32"))
+
+_job_ids = itertools.count(1)
+
+
+class QueueFullError(Exception):
+    """Raised when the inference queue is at max depth"""
+
+    def __init__(self, depth: int, retry_after: float):
+        super().__init__(f"Inference queue is full ({depth} requests waiting)")
+        self.depth = depth
+        self.retry_after = retry_after
+
+
+class InferenceJob:
+    """One unit of work for the inference thread"""
+
+    def __init__(self, fn: Callable, args: tuple, future, loop,
+                 user_id: Optional[int] = None, priority: int = PRIORITY_USER,
+                 batchable: bool = False):
+        self.id = next(_job_ids)
+        self.fn = fn
+        self.args = args
+        self.future = future
+        self.loop = loop
+        self.user_id = user_id
+        self.priority = priority
+        # Generation jobs that may share a llama_decode batch (inference/batching.py)
+        self.batchable = batchable
+        self.enqueued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        # Filled in at enqueue time so callers can report it
+        self.initial_position = 0
+        self.initial_eta_seconds = 0.0
+
+    @property
+    def wait_seconds(self) -> float:
+        end = self.started_at if self.started_at is not None else time.monotonic()
+        return end - self.enqueued_at
+
+
+class FairRequestScheduler:
+    """
+    Thread-safe priority + per-user round-robin queue.
+    put()/cancel()/position() are called from the event loop,
+    get() blocks on the inference thread.
+    """
+
+    def __init__(self, max_depth: int = DEFAULT_MAX_QUEUE_DEPTH):
+        self.max_depth = max_depth
+        self._cond = threading.Condition()
+        # lane -> OrderedDict(user_id -> deque[InferenceJob]); dict order = round-robin order
+        self._lanes: Dict[int, "OrderedDict[Any, deque]"] = {
+            lane: OrderedDict() for lane in LANE_NAMES
+        }
+        self._size = 0
+        self._closed = False
+
+        # Service time estimate (EMA) for ETA
+        self.avg_job_seconds = 5.0
+        self._ema_alpha = 0.2
+        self.busy = False
+
+        # Stats
+        self.total_enqueued = 0
+        self.total_rejected = 0
+
+    # ==================== PRODUCER SIDE ====================
+    def put(self, job: InferenceJob):
+        """Enqueue job, raise QueueFullError if user-facing depth limit is hit"""
+        with self._cond:
+            # System jobs (model loading) are never rejected
+            if job.priority != PRIORITY_SYSTEM and self._user_facing_size() >= self.max_depth:
+                self.total_rejected += 1
+                raise QueueFullError(self._size, self.eta_seconds(self._size))
+
+            lane = self._lanes[job.priority]
+            if job.user_id not in lane:
+                lane[job.user_id] = deque()
+            lane[job.user_id].append(job)
+            self._size += 1
+            self.total_enqueued += 1
+
+            job.initial_position = self._position_locked(job)
+            job.initial_eta_seconds = self.eta_seconds(job.initial_position)
+            self._cond.notify()
+
+    def cancel(self, job: InferenceJob) -> bool:
+        """Remove a job that hasn't started yet"""
+        with self._cond:
+            lane = self._lanes[job.priority]
+            user_jobs = lane.get(job.user_id)
+            if not user_jobs or job not in user_jobs:
+                return False
+            user_jobs.remove(job)
+            if not user_jobs:
+                del lane[job.user_id]
+            self._size -= 1
+            return True
+
+    def close(self):
+        """Wake up get() so the worker thread can exit"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    # ==================== CONSUMER SIDE ====================
+    def get(self) -> Optional[InferenceJob]:
+        """Block until a job is available; None once closed"""
+        with self._cond:
+            while self._size == 0 and not self._closed:
+                self._cond.wait()
+            if self._size == 0:
+                return None
+
+            return self._pop_next_locked()
+
+    def get_nowait(self, predicate: Optional[Callable[[InferenceJob], bool]] = None) -> Optional[InferenceJob]:
+        """
+        Next job without blocking, only if it satisfies predicate.
+        Used to top up a running batch: if the next job in fair order
+        can't join (e.g. a model load), nothing is taken so it isn't overtaken.
+        """
+        with self._cond:
+            head = self._peek_next_locked()
+            if head is None or (predicate is not None and not predicate(head)):
+                return None
+            return self._pop_next_locked()
+
+    def _peek_next_locked(self) -> Optional[InferenceJob]:
+        for priority in sorted(self._lanes):
+            lane = self._lanes[priority]
+            if lane:
+                return next(iter(lane.values()))[0]
+        return None
+
+    def _pop_next_locked(self) -> Optional[InferenceJob]:
+        for priority in sorted(self._lanes):
+            lane = self._lanes[priority]
+            if not lane:
+                continue
+            # Round-robin: take head of first user, rotate user to the back
+            user_id, user_jobs = next(iter(lane.items()))
+            job = user_jobs.popleft()
+            if user_jobs:
+                lane.move_to_end(user_id)
+            else:
+                del lane[user_id]
+            self._size -= 1
+            job.started_at = time.monotonic()
+            return job
+        return None
+
+    def record_service_time(self, seconds: float):
+        """Feed actual job duration into ETA estimate"""
+        with self._cond:
+            self.avg_job_seconds = (1 - self._ema_alpha) * self.avg_job_seconds + self._ema_alpha * seconds
+
+    # ==================== POSITION / ETA ====================
+    def position(self, job: InferenceJob) -> Optional[int]:
+        """Jobs ahead of this one (0 = next), None if no longer queued"""
+        with self._cond:
+            return self._position_locked(job)
+
+    def _position_locked(self, job: InferenceJob) -> Optional[int]:
+        ahead = 0
+        for priority in sorted(self._lanes):
+            lane = self._lanes[priority]
+            if priority < job.priority:
+                ahead += sum(len(q) for q in lane.values())
+                continue
+            if priority > job.priority:
+                break
+
+            user_jobs = lane.get(job.user_id)
+            if not user_jobs or job not in user_jobs:
+                return None
+            # Round k of the rotation serves the k-th job of every user
+            rank = user_jobs.index(job)
+            ahead += rank
+            before_us = True
+            for other_user, other_jobs in lane.items():
+                if other_user == job.user_id:
+                    before_us = False
+                    continue
+                ahead += min(len(other_jobs), rank)
+                # Users before us in rotation order also get their turn in our round
+                if before_us and len(other_jobs) > rank:
+                    ahead += 1
+        return ahead
+
+    def eta_seconds(self, position: Optional[int]) -> float:
+        if position is None:
+            return 0.0
+        in_flight = 1 if self.busy else 0
+        return round((position + in_flight) * self.avg_job_seconds, 1)
+
+    def _user_facing_size(self) -> int:
+        return self._size - sum(len(q) for q in self._lanes[PRIORITY_SYSTEM].values())
+
+    def __len__(self) -> int:
+        return self._size
+
+    def get_status(self) -> dict:
+        with self._cond:
+            lanes = {}
+            for priority, lane in self._lanes.items():
+                lanes[LANE_NAMES[priority]] = {
+                    str(user_id): len(jobs) for user_id, jobs in lane.items()
+                }
+            return {
+                "queued": self._size,
+                "max_depth": self.max_depth,
+                "busy": self.busy,
+                "avg_job_seconds": round(self.avg_job_seconds, 2),
+                "lanes": lanes,
+                "total_enqueued": self.total_enqueued,
+                "total_rejected": self.total_rejected
+            }
+
+    def user_jobs(self, user_id: int) -> List[dict]:
+        """Queue positions for one user's waiting jobs"""
+        with self._cond:
+            result = []
+            for lane in self._lanes.values():
+                for job in lane.get(user_id, ()):
+                    position = self._position_locked(job)
+                    result.append({
+                        "job_id": job.id,
+                        "position": position,
+                        "eta_seconds": self.eta_seconds(position),
+                        "waiting_seconds": round(job.wait_seconds, 1)
+                    })
+            return result
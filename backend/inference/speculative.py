@@ -0,0 +1,184 @@
+"""
+🏎️ SPECULATIVE DECODING 🏎️
+Cheap draft tokens verified by the big model in one forward pass.
+
+llama-cpp-python accepts a `draft_model` in Llama(...): after every sampled
+token it asks the draft for a few candidate tokens, evaluates them together
+with the main model and keeps the prefix the main model agrees with.
+Two draft sources, selected in system_settings.speculative_mode:
+
+- "prompt_lookup": n-gram matches from the prompt itself (LlamaPromptLookupDecoding),
+  free, works well when the answer quotes the prompt / code / history
+- "draft_model":  small GGUF with the same tokenizer (e.g. Llama 3.2 1B for 3.1 8B/70B),
+  greedy drafts of speculative_draft_tokens tokens
+
+Note: with a draft model llama-cpp-python keeps logits for every position
+(logits_all), which costs n_ctx * n_vocab floats of RAM per loaded model.
+
+Draft objects are duck-typed LlamaDraftModel (callable: input_ids -> draft ids),
+so this module doesn't need llama_cpp at import time.
+"""
+
+import logging
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SPECULATIVE_MODES = ("off", "prompt_lookup", "draft_model")
+DEFAULT_DRAFT_TOKENS = 8
+
+
+class SmallModelDraft:
+    """Greedy drafts from a small Llama sharing the main model's vocabulary"""
+
+    def __init__(self, draft, num_pred_tokens: int = DEFAULT_DRAFT_TOKENS):
+        import llama_cpp
+        self._llama_cpp = llama_cpp
+        self.draft = draft
+        self.num_pred_tokens = num_pred_tokens
+        self.n_vocab = draft.n_vocab()
+
+    def __call__(self, input_ids: np.ndarray, /, **kwargs) -> np.ndarray:
+        draft = self.draft
+        ids = np.asarray(input_ids, dtype=np.intc)
+        if len(ids) == 0 or len(ids) >= draft.n_ctx() - 1:
+            return np.array([], dtype=np.intc)
+
+        # Reuse draft KV for the common prefix (rejected drafts are rolled back)
+        n = min(draft.n_tokens, len(ids) - 1)
+        mismatch = np.nonzero(draft.input_ids[:n] != ids[:n])[0]
+        n_common = int(mismatch[0]) if len(mismatch) else n
+        draft.n_tokens = n_common
+        draft.eval(ids[n_common:].tolist())
+
+        tokens = []
+        budget = min(self.num_pred_tokens, draft.n_ctx() - draft.n_tokens - 1)
+        while len(tokens) < budget:
+            logits = np.ctypeslib.as_array(
+                self._llama_cpp.llama_get_logits_ith(draft._ctx.ctx, -1), shape=(self.n_vocab,)
+            )
+            token = int(np.argmax(logits))
+            tokens.append(token)
+            if len(tokens) < budget:
+                draft.eval([token])
+        return np.array(tokens, dtype=np.intc)
+
+
+class CountingDraftModel:
+    """Wraps a draft source and counts calls / proposed tokens for acceptance metrics"""
+
+    def __init__(self, inner, mode: str, draft_name: Optional[str] = None):
+        self.inner = inner
+        self.mode = mode
+        self.draft_name = draft_name
+        self._lock = threading.Lock()
+
+        # Stats
+        self.calls = 0
+        self.proposed = 0
+        self.completion_tokens = 0
+        self.accepted = 0
+        self.requests = 0
+
+    def __call__(self, input_ids: np.ndarray, /, **kwargs) -> np.ndarray:
+        draft_tokens = self.inner(input_ids, **kwargs)
+        with self._lock:
+            self.calls += 1
+            self.proposed += len(draft_tokens)
+        return draft_tokens
+
+    def snapshot(self) -> tuple:
+        with self._lock:
+            return self.calls, self.proposed
+
+    def request_metrics(self, before: tuple, completion_tokens: int, seconds: float) -> dict:
+        """
+        Per-request numbers from counter deltas.
+        Every draft call starts one verification pass of the main model, and each pass
+        yields 1 sampled token + the accepted drafts, so accepted ~= tokens - passes.
+        """
+        calls, proposed = self.snapshot()
+        calls -= before[0]
+        proposed -= before[1]
+        passes = max(calls, 1)
+        accepted = max(0, min(completion_tokens - calls, proposed))
+        with self._lock:
+            self.requests += 1
+            self.completion_tokens += completion_tokens
+            self.accepted += accepted
+        return {
+            "mode": self.mode,
+            "draft_model": self.draft_name,
+            "draft_calls": calls,
+            "draft_tokens_proposed": proposed,
+            "draft_tokens_accepted": accepted,
+            "acceptance_rate": round(accepted / proposed, 3) if proposed else 0.0,
+            # Tokens per main-model pass = speedup over one-token-per-pass decoding
+            "estimated_speedup": round(completion_tokens / passes, 2) if completion_tokens else 1.0,
+            "tokens_per_second": round(completion_tokens / seconds, 2) if seconds > 0 else 0.0
+        }
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "draft_model": self.draft_name,
+                "requests": self.requests,
+                "draft_calls": self.calls,
+                "draft_tokens_proposed": self.proposed,
+                "draft_tokens_accepted": self.accepted,
+                "acceptance_rate": round(self.accepted / self.proposed, 3) if self.proposed else 0.0,
+                "estimated_speedup": round(self.completion_tokens / self.calls, 2) if self.calls else 1.0
+            }
+
+
+def build_draft_model(mode: Optional[str], num_pred_tokens: Optional[int] = None,
+                      draft_model_path: Optional[str] = None,
+                      n_gpu_layers: int = -1, n_ctx: int = 8192) -> Optional[CountingDraftModel]:
+    """
+    Draft model for Llama(draft_model=...) according to system settings.
+    Returns None when speculative decoding is off.
+    Blocking (may load a GGUF) - call on the inference worker thread.
+    """
+    mode = (mode or "off").lower()
+    if mode not in SPECULATIVE_MODES:
+        raise ValueError(f"Unknown speculative_mode '{mode}', expected one of {SPECULATIVE_MODES}")
+    if mode == "off":
+        return None
+    num_pred_tokens = num_pred_tokens or DEFAULT_DRAFT_TOKENS
+
+    if mode == "prompt_lookup":
+        from llama_cpp.llama_speculative import LlamaPromptLookupDecoding
+        logger.info(f"🏎️ Speculative decoding: prompt lookup ({num_pred_tokens} tokens)")
+        return CountingDraftModel(LlamaPromptLookupDecoding(num_pred_tokens=num_pred_tokens), mode)
+
+    if not draft_model_path:
+        raise ValueError("speculative_mode 'draft_model' needs speculative_draft_model")
+    from llama_cpp import Llama
+    started = time.perf_counter()
+    draft = Llama(
+        model_path=str(draft_model_path),
+        n_ctx=n_ctx,
+        n_gpu_layers=n_gpu_layers,
+        n_batch=512,
+        verbose=False
+    )
+    logger.info(
+        f"🏎️ Speculative decoding: draft model {draft_model_path} "
+        f"({num_pred_tokens} tokens) loaded in {time.perf_counter() - started:.1f}s"
+    )
+    return CountingDraftModel(SmallModelDraft(draft, num_pred_tokens), mode, str(draft_model_path))
+
+
+def check_draft_vocab(main_model, draft: Optional[CountingDraftModel]):
+    """Draft tokens are fed to the main model as-is, so vocabularies must match"""
+    if draft is None or not isinstance(draft.inner, SmallModelDraft):
+        return
+    if draft.inner.n_vocab != main_model.n_vocab():
+        raise ValueError(
+            f"Draft model vocabulary ({draft.inner.n_vocab}) doesn't match main model ({main_model.n_vocab()})"
+        )
@@ -0,0 +1,96 @@
+"""
+🔥 MODEL WARM-UP 🔥
+Makes the first chat after boot as fast as the hundredth.
+
+With use_mmap=True llama.cpp maps the GGUF and pages weights in lazily,
+and CUDA kernels / compute buffers are set up on first use, so the first
+real request pays for all of it. After auto-load we:
+
+1. prefetch_pages(): posix_fadvise + madvise(WILLNEED) over the whole file
+   -> kernel readahead of every page the mapping will touch
+2. warm_up(): short dummy generations until time-to-first-token is at
+   steady state (two consecutive runs within WARMUP_TOLERANCE), at most
+   WARMUP_MAX_RUNS runs
+
+Only then is the "warmup" component in SERVER_INITIALIZATION_STATE marked success.
+"""
+
+import logging
+import mmap
+import os
+import time
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+WARMUP_MAX_RUNS = int(os.getenv("WARMUP_MAX_RUNS", "5"))
+WARMUP_TOLERANCE = float(os.getenv("WARMUP_TOLERANCE", "0.15"))
+WARMUP_TOKENS = int(os.getenv("WARMUP_TOKENS", "8"))
+WARMUP_PROMPT = (
+    "<|begin_of_text|><|start_header_id|>user<|end_header_id|>\n\n"
+    "Hello<|eot_id|><|start_header_id|>assistant<|end_header_id|>\n\n"
+)
+
+
+def prefetch_pages(model_path: str) -> dict:
+    """Ask the kernel to read the whole GGUF into page cache (blocking, returns timing)"""
+    started = time.perf_counter()
+    size = os.path.getsize(model_path)
+    advised = []
+    with open(model_path, "rb") as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+            advised.append("fadvise")
+        if size and hasattr(mmap, "MADV_WILLNEED"):
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+                mapping.madvise(mmap.MADV_WILLNEED)
+                advised.append("madvise")
+    return {
+        "bytes": size,
+        "advice": advised,
+        "seconds": round(time.perf_counter() - started, 3)
+    }
+
+
+def measure_first_token(model, prompt: str = WARMUP_PROMPT, max_tokens: int = WARMUP_TOKENS) -> tuple:
+    """(time_to_first_token, total_seconds) for one short greedy generation"""
+    started = time.perf_counter()
+    first_token = None
+    for _ in model(prompt=prompt, max_tokens=max_tokens, temperature=0.0, stream=True):
+        if first_token is None:
+            first_token = time.perf_counter() - started
+    total = time.perf_counter() - started
+    return (first_token if first_token is not None else total), total
+
+
+def is_steady(latencies: List[float], tolerance: float = WARMUP_TOLERANCE) -> bool:
+    """Last two first-token latencies within `tolerance` of each other"""
+    if len(latencies) < 2:
+        return False
+    previous, last = latencies[-2], latencies[-1]
+    return abs(last - previous) <= tolerance * max(previous, 1e-6)
+
+
+def warm_up(model, max_runs: int = WARMUP_MAX_RUNS, tolerance: float = WARMUP_TOLERANCE) -> dict:
+    """Dummy generations until first-token latency settles (inference worker thread)"""
+    started = time.perf_counter()
+    latencies: List[float] = []
+    for _ in range(max(1, max_runs)):
+        # Fresh KV each run - we want to measure prompt eval, not prefix reuse
+        model.reset()
+        first_token, _ = measure_first_token(model)
+        latencies.append(first_token)
+        if is_steady(latencies, tolerance):
+            break
+    model.reset()
+
+    report = {
+        "runs": len(latencies),
+        "steady": is_steady(latencies, tolerance),
+        "first_token_ms": [round(latency * 1000, 1) for latency in latencies],
+        "cold_first_token_ms": round(latencies[0] * 1000, 1),
+        "steady_first_token_ms": round(latencies[-1] * 1000, 1),
+        "seconds": round(time.perf_counter() - started, 3)
+    }
+    logger.info(f"🔥 Warm-up: {report}")
+    return report
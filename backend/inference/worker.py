@@ -0,0 +1,447 @@
+"""
+⚡ INFERENCE WORKER ⚡
+Owns the loaded Llama instance on its own dedicated thread.
+
+llama.cpp calls are blocking (model load, prompt eval, token sampling), so
+running them inside `async def` endpoints freezes the whole uvicorn loop.
+Every model operation is submitted here instead and awaited by the caller,
+while /health, login and agent endpoints keep being served.
+
+Jobs are pulled from a FairRequestScheduler (inference/scheduler.py), so
+chat requests are admitted per-user round-robin with admin priority.
+
+With INFERENCE_BATCH_SEQS > 1, generation jobs for the same model are
+decoded together by a BatchedGenerationEngine (inference/batching.py);
+new jobs join the running batch as soon as a sequence finishes. The batch
+engine shares the system-prompt prefix KV between its sequences itself;
+the PrefixStateCache below serves the single-request path.
+"""
+
+import asyncio
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, Optional
+
+from .scheduler import (
+    FairRequestScheduler, InferenceJob, QueueFullError,
+    PRIORITY_SYSTEM, PRIORITY_ADMIN, PRIORITY_USER
+)
+from .prefix_cache import PrefixStateCache
+from .model_pool import ModelPool
+from .batching import BatchedGenerationEngine, BatchRequest, SlotOverflowError, DEFAULT_BATCH_SEQS
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceWorker:
+    """
+    Single-thread inference executor.
+    - Only this thread ever touches the Llama instances (kept in a ModelPool)
+    - model_name is the default model; requests may route to any resident one
+    - submit() returns an asyncio future that resolves on the caller's loop
+    - Jobs run strictly one at a time (llama.cpp context is not thread-safe),
+      except generation jobs which may share one batched llama_decode
+    """
+
+    def __init__(self, name: str = "llama-inference", scheduler: Optional[FairRequestScheduler] = None):
+        self.name = name
+        self.model_name: Optional[str] = None
+
+        self.scheduler = scheduler or FairRequestScheduler()
+        self.prefix_cache = PrefixStateCache()
+        self.pool = ModelPool()
+        self.pool.on_evict = self._on_model_evicted
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        # Continuous batching (1 = off)
+        self.batch_seqs = DEFAULT_BATCH_SEQS
+        self._engine: Optional[BatchedGenerationEngine] = None
+        self._engine_model: Optional[str] = None
+        # Set when the batch context could not be allocated (out of memory) - batching stays off
+        self.batching_disabled: Optional[Dict[str, Any]] = None
+        self.batch_fallbacks = 0
+
+        # Stats
+        self.busy = False
+        self.jobs_completed = 0
+        self.jobs_failed = 0
+        self.last_job_seconds = 0.0
+        self.single_tokens = 0
+        self.single_seconds = 0.0
+
+    # ==================== LIFECYCLE ====================
+    def start(self):
+        """Start worker thread (idempotent)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+            logger.info(f"⚡ Inference worker '{self.name}' started")
+
+    def stop(self):
+        """Stop worker thread after the current job"""
+        if self._thread is None:
+            return
+        self.scheduler.close()
+        self._thread.join(timeout=5)
+        self._thread = None
+
+    @property
+    def queue_size(self) -> int:
+        return len(self.scheduler)
+
+    def _run(self):
+        while True:
+            job = self.scheduler.get()
+            if job is None:
+                break
+
+            if job.future.cancelled():
+                continue
+
+            self.busy = True
+            self.scheduler.busy = True
+            try:
+                if job.batchable and self.batch_seqs > 1:
+                    self._run_batched(job)
+                else:
+                    self._run_job(job)
+            except Exception as e:
+                # Never let the inference thread die - every queued future would hang
+                logger.exception(f"❌ Inference worker loop error: {e}")
+                if not job.future.done():
+                    job.loop.call_soon_threadsafe(_resolve, job.future, None, e)
+            finally:
+                self.busy = False
+                self.scheduler.busy = False
+
+    def _run_job(self, job: InferenceJob):
+        started = time.perf_counter()
+        try:
+            result = job.fn(*job.args)
+        except BaseException as e:
+            self.jobs_failed += 1
+            job.loop.call_soon_threadsafe(_resolve, job.future, None, e)
+        else:
+            self.jobs_completed += 1
+            job.loop.call_soon_threadsafe(_resolve, job.future, result, None)
+        finally:
+            self.last_job_seconds = time.perf_counter() - started
+            if job.priority != PRIORITY_SYSTEM:
+                self.scheduler.record_service_time(self.last_job_seconds)
+
+    # ==================== CONTINUOUS BATCHING ====================
+    def _run_batched(self, first_job: InferenceJob):
+        """Decode first_job together with every queued generation job for the same model"""
+        model_name = self.route(first_job.args[3])
+        model = self.pool.peek(model_name)
+        if model is None or getattr(model, "draft_model", None) is not None:
+            # No model (evicted / being switched) -> the single path reports it for this job only;
+            # speculative decoding lives in Llama.generate - the batch engine has no draft support
+            self._run_job(first_job)
+            return
+        try:
+            engine = self._get_engine(model_name)
+        except Exception as e:
+            self.batch_fallbacks += 1
+            if _is_out_of_memory(e):
+                # The batch KV buffer does not fit next to the weights - it won't fit next time either
+                self.batch_seqs = 1
+                self.batching_disabled = {
+                    "reason": str(e),
+                    "model_name": model_name,
+                    "at": time.time()
+                }
+                logger.error(f"❌ Batched generation disabled (batch context out of memory for {model_name}): {e}")
+            else:
+                logger.warning(f"⚠️ Batched generation failed for this request, running it alone: {e}")
+            self._run_job(first_job)
+            return
+
+        def joins_batch(job: InferenceJob) -> bool:
+            return job.batchable and self.route(job.args[3]) == model_name
+
+        self._admit(engine, first_job)
+        while engine.active:
+            # Top up free slots from the queue (fair order is kept by get_nowait)
+            while engine.has_capacity():
+                job = self.scheduler.get_nowait(joins_batch)
+                if job is None:
+                    break
+                if not job.future.cancelled():
+                    self._admit(engine, job)
+            try:
+                engine.step()
+            except Exception as e:
+                # llama_decode / sampler / on_token failure - the batch context state is unknown:
+                # fail what's in flight, drop the context, the next job gets a fresh engine
+                failed = len(engine.active)
+                engine.fail_all(e)
+                self.jobs_failed += failed
+                self._close_engine()
+                logger.error(f"❌ Batched decode step failed, {failed} request(s) failed: {e}")
+                return
+
+    def _get_engine(self, model_name: Optional[str]) -> BatchedGenerationEngine:
+        model = self.pool.get(model_name)
+        if model is None:
+            raise RuntimeError("No model loaded")
+        if self._engine is not None and self._engine_model == model_name and self._engine.llama is model:
+            return self._engine
+        self._close_engine()
+        self._engine = BatchedGenerationEngine(model, n_seq_max=self.batch_seqs)
+        self._engine_model = model_name
+        logger.info(f"🧮 Batched generation ready for {model_name} ({self.batch_seqs} sequences)")
+        return self._engine
+
+    def _close_engine(self):
+        if self._engine is not None:
+            self._engine.close()
+        self._engine = None
+        self._engine_model = None
+
+    def _admit(self, engine: BatchedGenerationEngine, job: InferenceJob):
+        prompt, params, prefix, _model_name, on_token, cancel_event = job.args
+        started = time.perf_counter()
+
+        def on_done(result: Optional[dict], error: Optional[BaseException]):
+            elapsed = time.perf_counter() - started
+            self.last_job_seconds = elapsed
+            # Jobs overlap - effective service time is shared by the sequences in flight
+            self.scheduler.record_service_time(elapsed / (len(engine.active) + 1))
+            if error is not None:
+                self.jobs_failed += 1
+            else:
+                self.jobs_completed += 1
+            job.loop.call_soon_threadsafe(_resolve, job.future, result, error)
+
+        try:
+            engine.add(BatchRequest(prompt, params, on_token=on_token,
+                                    on_done=on_done, cancel_event=cancel_event, prefix=prefix))
+        except SlotOverflowError as e:
+            # Long history prompts are budgeted against the model's n_ctx, not the batch slot
+            self.batch_fallbacks += 1
+            logger.info(f"🧮 {e} - running this request on the single path")
+            self._run_job(job)
+        except Exception as e:
+            self.jobs_failed += 1
+            job.loop.call_soon_threadsafe(_resolve, job.future, None, e)
+
+    # ==================== SUBMIT API ====================
+    def enqueue(self, fn: Callable, *args, user_id: Optional[int] = None,
+                priority: int = PRIORITY_SYSTEM, batchable: bool = False) -> InferenceJob:
+        """
+        Schedule fn(*args) on the inference thread.
+        Returns the job (job.future is awaitable, job.initial_position/eta are set).
+        Raises QueueFullError for user/admin jobs when the queue is at max depth.
+        """
+        self.start()
+        loop = asyncio.get_running_loop()
+        job = InferenceJob(fn, args, loop.create_future(), loop, user_id=user_id,
+                           priority=priority, batchable=batchable)
+        self.scheduler.put(job)
+        return job
+
+    def submit(self, fn: Callable, *args, user_id: Optional[int] = None,
+               priority: int = PRIORITY_SYSTEM) -> asyncio.Future:
+        """Schedule fn(*args) on the inference thread, return awaitable future"""
+        return self.enqueue(fn, *args, user_id=user_id, priority=priority).future
+
+    def cancel(self, job: InferenceJob) -> bool:
+        """Drop a job that is still waiting in the queue"""
+        removed = self.scheduler.cancel(job)
+        if removed and not job.future.done():
+            job.future.cancel()
+        return removed
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Run fn on the inference thread (system priority) and await its result"""
+        return await self.submit(fn, *args)
+
+    def enqueue_generate(self, prompt: str, params: dict, user_id: Optional[int] = None,
+                         is_admin: bool = False, prefix: Optional[str] = None,
+                         model_name: Optional[str] = None,
+                         on_token: Optional[Callable[[str], None]] = None,
+                         cancel_event: Optional[threading.Event] = None) -> InferenceJob:
+        """
+        Queue a raw completion for a chat user (routed to model_name if resident).
+        on_token(text) is called on the inference thread for every streamed piece;
+        setting cancel_event stops generation early.
+        """
+        priority = PRIORITY_ADMIN if is_admin else PRIORITY_USER
+        return self.enqueue(self._generate_sync, prompt, params, prefix, model_name, on_token, cancel_event,
+                            user_id=user_id, priority=priority, batchable=True)
+
+    async def generate(self, prompt: str, user_id: Optional[int] = None, is_admin: bool = False,
+                       prefix: Optional[str] = None, model_name: Optional[str] = None, **params) -> dict:
+        """Raw completion with a resident model (non-streaming)"""
+        job = self.enqueue_generate(prompt, params, user_id=user_id, is_admin=is_admin,
+                                    prefix=prefix, model_name=model_name)
+        return await job.future
+
+    def _generate_sync(self, prompt: str, params: dict, prefix: Optional[str] = None,
+                       model_name: Optional[str] = None,
+                       on_token: Optional[Callable[[str], None]] = None,
+                       cancel_event: Optional[threading.Event] = None) -> dict:
+        """Single-request generation (batching off); same result format as the batch engine"""
+        if cancel_event is not None and cancel_event.is_set():
+            return _completion("", "cancelled", 0)
+        model, name = self.acquire(model_name)
+        self.prime_prefix(prefix, model, name)
+        draft = getattr(model, "draft_model", None)
+        draft_before = draft.snapshot() if hasattr(draft, "snapshot") else None
+        started = time.perf_counter()
+
+        if on_token is None:
+            result = model(prompt=prompt, **params)
+            n_tokens = result.get("usage", {}).get("completion_tokens", 0)
+            self._record_single(n_tokens, started)
+            if draft_before is not None:
+                result["speculative"] = draft.request_metrics(draft_before, n_tokens, time.perf_counter() - started)
+            return result
+
+        text, finish_reason, n_tokens = "", None, 0
+        for chunk in model(prompt=prompt, stream=True, **params):
+            if cancel_event is not None and cancel_event.is_set():
+                finish_reason = "cancelled"
+                break
+            choice = chunk["choices"][0]
+            if choice.get("text"):
+                text += choice["text"]
+                n_tokens += 1
+                on_token(choice["text"])
+            finish_reason = choice.get("finish_reason") or finish_reason
+        self._record_single(n_tokens, started)
+        result = _completion(text, finish_reason, n_tokens)
+        if draft_before is not None:
+            result["speculative"] = draft.request_metrics(draft_before, n_tokens, time.perf_counter() - started)
+        return result
+
+    def _record_single(self, n_tokens: int, started: float):
+        self.single_tokens += n_tokens
+        self.single_seconds += time.perf_counter() - started
+
+    def prime_prefix(self, prefix: Optional[str], model=None, model_name: Optional[str] = None) -> str:
+        """Restore cached KV state for the system-prompt prefix (inference thread only)"""
+        if model is None:
+            model, model_name = self.model, self.model_name
+        if not prefix or model is None:
+            return "skipped"
+        try:
+            return self.prefix_cache.prime(model, model_name, prefix)
+        except Exception as e:
+            # Cache is an optimization only - generation re-evaluates the prompt anyway
+            logger.warning(f"⚠️ Prefix cache prime failed: {e}")
+            self.prefix_cache.clear()
+            return "error"
+
+    # ==================== MODEL OWNERSHIP ====================
+    @property
+    def model(self):
+        """Default model instance (last one loaded via /ai/models/load)"""
+        return self.pool.peek(self.model_name)
+
+    def route(self, model_name: Optional[str]) -> Optional[str]:
+        """Name of the model a request for `model_name` will run on (None = nothing loaded)"""
+        if model_name and model_name in self.pool:
+            return model_name
+        if self.model_name and self.model_name in self.pool:
+            return self.model_name
+        return None
+
+    def acquire(self, model_name: Optional[str] = None):
+        """(model, name) for a request - touches LRU order (inference thread only)"""
+        name = self.route(model_name)
+        model = self.pool.get(name)
+        if model is None:
+            raise RuntimeError("No model loaded")
+        return model, name
+
+    def set_model(self, model, model_name: str, size_mb: float = 0.0, make_default: bool = True):
+        """Install a freshly loaded model into the pool (call from the inference thread)"""
+        self.pool.add(model_name, model, size_mb)
+        if make_default or self.model_name not in self.pool:
+            self.model_name = model_name
+
+    def unload_model(self, model_name: Optional[str] = None):
+        """Drop a resident model, default model if no name given (call from the inference thread)"""
+        name = model_name or self.model_name
+        if name:
+            self.pool.remove(name)
+
+    def _on_model_evicted(self, model_name: str):
+        self.prefix_cache.drop_model(model_name)
+        if model_name == self._engine_model:
+            # Batch context holds a reference to the evicted weights
+            self._close_engine()
+        if model_name == self.model_name:
+            # Fall back to the most recently used resident model
+            resident = self.pool.names()
+            self.model_name = resident[-1] if resident else None
+
+    def get_status(self) -> dict:
+        return {
+            "thread_alive": self._thread is not None and self._thread.is_alive(),
+            "busy": self.busy,
+            "queued_jobs": self.queue_size,
+            "scheduler": self.scheduler.get_status(),
+            "prefix_cache": self.prefix_cache.get_stats(),
+            "jobs_completed": self.jobs_completed,
+            "jobs_failed": self.jobs_failed,
+            "last_job_seconds": round(self.last_job_seconds, 3),
+            "model_name": self.model_name,
+            "model_pool": self.pool.get_status(),
+            "throughput": {
+                "single": {
+                    "tokens_generated": self.single_tokens,
+                    "tokens_per_second": round(self.single_tokens / self.single_seconds, 2) if self.single_seconds else 0.0
+                },
+                "batched": dict(self._engine.get_stats(), model_name=self._engine_model) if self._engine else None,
+                "batch_seqs": self.batch_seqs,
+                "batch_fallbacks": self.batch_fallbacks,
+                "batching_disabled": self.batching_disabled
+            },
+            "speculative": self._speculative_stats()
+        }
+
+    def _speculative_stats(self) -> dict:
+        """Draft acceptance totals per resident model that has speculative decoding on"""
+        stats = {}
+        for name in self.pool.names():
+            draft = getattr(self.pool.peek(name), "draft_model", None)
+            if hasattr(draft, "get_stats"):
+                stats[name] = draft.get_stats()
+        return stats
+
+
+def _is_out_of_memory(error: BaseException) -> bool:
+    """llama.cpp reports a failed KV allocation as a NULL context ("Failed to create llama_context")"""
+    if isinstance(error, MemoryError):
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in ("failed to create llama_context", "out of memory", "failed to allocate"))
+
+
+def _completion(text: str, finish_reason: Optional[str], n_tokens: int) -> dict:
+    """Minimal completion dict for streamed generations (same shape as Llama.__call__)"""
+    return {
+        "choices": [{"text": text, "index": 0, "logprobs": None, "finish_reason": finish_reason}],
+        "usage": {"completion_tokens": n_tokens}
+    }
+
+
+def _resolve(future: asyncio.Future, result: Any, error: Optional[BaseException]):
+    """Set future outcome on its own loop (caller may have given up already)"""
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+# 🎯 GLOBAL INFERENCE WORKER INSTANCE
+inference_worker = InferenceWorker()
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 Database Migration Script
-Adds auto_load_model_name column to system_settings table
+Adds auto_load_model_name, web_search_enabled and speculative_* columns to system_settings table
 WITHOUT deleting existing data!
 """
 import sqlite3
@@ -38,6 +38,21 @@ def migrate():
         else:
             print("✅ web_search_enabled already exists")
         
+        # 🏎️ Speculative decoding settings
+        speculative_columns = [
+            ("speculative_mode", "TEXT DEFAULT 'off'"),
+            ("speculative_draft_model", "TEXT"),
+            ("speculative_draft_tokens", "INTEGER DEFAULT 8"),
+        ]
+        for column_name, column_type in speculative_columns:
+            if column_name not in columns:
+                print(f"🔧 Adding {column_name} column...")
+                cursor.execute(f"ALTER TABLE system_settings ADD COLUMN {column_name} {column_type}")
+                conn.commit()
+                print(f"✅ {column_name} added!")
+            else:
+                print(f"✅ {column_name} already exists")
+        
         # Verify
         cursor.execute("SELECT * FROM system_settings")
         row = cursor.fetchone()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark: batched generation vs. single-request mode (CPU)
+
+Runs the same N prompts twice on a small GGUF:
+  1. one after another through Llama.__call__ (what the worker does with INFERENCE_BATCH_SEQS=1)
+  2. together through BatchedGenerationEngine (INFERENCE_BATCH_SEQS=N)
+and prints aggregate tokens/sec for both.
+
+Usage:
+    python testiranje/benchmark_batching.py /path/to/tiny-model.gguf [--requests 8] [--tokens 64]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from llama_cpp import Llama
+from inference.batching import BatchedGenerationEngine, BatchRequest
+
+PROMPTS = [
+    "Napiši kratku pjesmu o moru.",
+    "Explain what a hash map is.",
+    "List three uses of Python.",
+    "Što je umjetna inteligencija?",
+    "Write a haiku about autumn.",
+    "Describe the color blue to someone who cannot see.",
+    "Give me a tip for writing clean code.",
+    "What is the capital of Croatia?",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("model_path")
+    parser.add_argument("--requests", type=int, default=8)
+    parser.add_argument("--tokens", type=int, default=64)
+    parser.add_argument("--ctx", type=int, default=512, help="context per sequence")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 4)
+    args = parser.parse_args()
+
+    print(f"🚀 Loading {args.model_path} (CPU, {args.threads} threads)...")
+    model = Llama(
+        model_path=args.model_path,
+        n_ctx=args.ctx,
+        n_threads=args.threads,
+        n_gpu_layers=0,
+        verbose=False
+    )
+    prompts = [PROMPTS[i % len(PROMPTS)] for i in range(args.requests)]
+    # Greedy sampling so both runs generate the same text
+    params = {"max_tokens": args.tokens, "temperature": 0.0, "top_k": 40, "top_p": 0.95}
+
+    # 1. Single-request mode
+    print(f"\n🐢 Single-request mode: {len(prompts)} requests x {args.tokens} tokens")
+    started = time.perf_counter()
+    single_tokens = 0
+    for prompt in prompts:
+        model.reset()
+        result = model(prompt, **params)
+        single_tokens += result["usage"]["completion_tokens"]
+    single_seconds = time.perf_counter() - started
+    single_tps = single_tokens / single_seconds
+    print(f"   {single_tokens} tokens in {single_seconds:.2f}s -> {single_tps:.1f} tok/s")
+
+    # 2. Batched mode
+    print(f"\n🧮 Batched mode: {len(prompts)} sequences in one context")
+    engine = BatchedGenerationEngine(model, n_seq_max=len(prompts), n_ctx_per_seq=args.ctx)
+    started = time.perf_counter()
+    results = engine.generate_all([BatchRequest(prompt, dict(params)) for prompt in prompts])
+    batch_seconds = time.perf_counter() - started
+    batch_tokens = sum(r["usage"]["completion_tokens"] for r in results if "usage" in r)
+    batch_tps = batch_tokens / batch_seconds
+    print(f"   {batch_tokens} tokens in {batch_seconds:.2f}s -> {batch_tps:.1f} tok/s")
+    print(f"   engine stats: {engine.get_stats()}")
+    engine.close()
+
+    print(f"\n📊 Speedup: {batch_tps / single_tps:.2f}x aggregate tokens/sec")
+
+
+if __name__ == "__main__":
+    main()
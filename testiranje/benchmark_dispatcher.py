@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Benchmark: AgentDispatcher routing - per-keyword substring scans vs. Aho-Corasick automaton
+
+The old _detect_agent_type did `keyword in text` + text.count(keyword) for every
+keyword of every agent (plus every exclusion phrase). The dispatcher now scores
+all agents in one pass with agents/core/keyword_matcher.py. This script times
+both on short chat messages and long pasted documents, and first checks that old
+and new detection agree (scores and the routed agent list), including keywords that
+overlap themselves ('aa' in 'aaaa' counts 2 like str.count, not 3). Exits 1 on any
+mismatch.
+
+Usage:
+    python testiranje/benchmark_dispatcher.py [--repeat 20]
+"""
+import argparse
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+os.environ.setdefault("MEMORY_DB_PATH", "/tmp/benchmark_dispatcher_memory.db")
+logging.disable(logging.CRITICAL)
+
+from agents.core.agent_dispatcher import SIMPLE_CONVERSATION, dispatcher
+
+PROSE = (
+    "Evo dokumenta koji sam kopirao iz wiki stranice. The deployment runs on a single GPU server "
+    "with a llama model loaded at startup. When the queue is full the API returns 429 and the client "
+    "retries with backoff. Korisnik je prijavio grešku u kalendaru: sastanak se ne prikazuje danas, "
+    "iako je termin sačuvan. We should check the logs, open the config file and compare it with the "
+    "backup. Please also send an email to the team with a link to the dashboard and remind me tomorrow. "
+)
+
+
+def legacy_scores(agent_keywords: dict, simple_conversational: list, input_lower: str) -> dict:
+    """The pre-automaton scoring loop (keywords lowercased like the matcher does)"""
+    is_simple = any(phrase in input_lower for phrase in simple_conversational)
+    scores = {}
+    for agent_type, keywords in agent_keywords.items():
+        if agent_type == 'web' and is_simple:
+            continue
+        score = 0
+        for keyword in keywords:
+            keyword = keyword.lower()
+            if keyword in input_lower:
+                score += len(keyword) * input_lower.count(keyword)
+        if score > 0:
+            scores[agent_type] = score
+    return scores
+
+
+def matcher_scores(input_lower: str) -> dict:
+    scores = dispatcher.keyword_matcher.scores(input_lower)
+    if scores.pop(SIMPLE_CONVERSATION, 0) > 0:
+        scores.pop('web', None)
+    return scores
+
+
+def legacy_detect(agent_keywords: dict, simple_conversational: list, priority_order: list, input_lower: str) -> list:
+    """The pre-automaton _detect_agent_type ordering on top of legacy_scores"""
+    scores = legacy_scores(agent_keywords, simple_conversational, input_lower)
+    detected = [agent for agent in priority_order if agent in scores]
+    for agent, _ in sorted(scores.items(), key=lambda x: x[1], reverse=True):
+        if agent not in detected:
+            detected.append(agent)
+    return detected
+
+
+def check_parity(rng: random.Random) -> int:
+    """Old vs new detection on fixed cases + random inputs; returns the number of mismatches"""
+    from agents.core.keyword_matcher import KeywordMatcher
+
+    mismatches = 0
+    agent_keywords = dispatcher.agent_keywords
+    simple = dispatcher.simple_conversational
+    cases = [
+        "", "hi", "hello, how are you", "search the web for python news", "website web webweb",
+        "remind me tomorrow to send an email", "open the config file and check the logs",
+        PROSE.lower(), (PROSE * 5).lower(),
+    ]
+    vocabulary = [k.lower() for keywords in agent_keywords.values() for k in keywords] + [p.lower() for p in simple]
+    for _ in range(500):
+        cases.append(" ".join(rng.choice(vocabulary + PROSE.lower().split()) for _ in range(rng.randint(1, 40))))
+        cases.append("".join(rng.choice(vocabulary)[:rng.randint(1, 6)] for _ in range(rng.randint(1, 20))))
+    for text in cases:
+        if legacy_scores(agent_keywords, simple, text) != matcher_scores(text) or \
+                legacy_detect(agent_keywords, simple, dispatcher.priority_order, text) != dispatcher._detect_agent_type(text):
+            mismatches += 1
+            print(f"❌ dispatcher mismatch for {text[:60]!r}")
+
+    # Self-overlapping keywords ('aa', 'aba', 'abab') next to plain ones
+    overlapping = {"x": ["aa", "aba", "web"], "y": ["abab", "a", "aa"], "z": ["website", "b"]}
+    matcher = KeywordMatcher(overlapping)
+    alphabet = "abw"
+    texts = ["aaaa", "aaaaa", "abababa", "ababab", "website web"] + [
+        "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 30))) for _ in range(2_000)
+    ]
+    for text in texts:
+        expected = {}
+        for group, keywords in overlapping.items():
+            score = sum(len(k) * text.count(k) for k in keywords)
+            if score:
+                expected[group] = score
+        if matcher.scores(text) != expected:
+            mismatches += 1
+            print(f"❌ overlap mismatch for {text!r}: {matcher.scores(text)} != {expected}")
+    print(f"{'✅' if not mismatches else '❌'} old vs new detection: {len(cases) + len(texts)} inputs, {mismatches} mismatches")
+    return mismatches
+
+
+def timed(fn, text: str, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(text)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    if check_parity(rng):
+        sys.exit(1)
+    words = PROSE.split()
+    inputs = {
+        "short chat": "hi, please search the web for the latest news about python",
+        "1 KB": (PROSE * 3)[:1_000],
+        "10 KB": " ".join(rng.choice(words) for _ in range(1_600))[:10_000],
+        "100 KB": " ".join(rng.choice(words) for _ in range(16_000))[:100_000],
+        "1 MB": " ".join(rng.choice(words) for _ in range(160_000))[:1_000_000],
+    }
+
+    agent_keywords = dispatcher.agent_keywords
+    simple = dispatcher.simple_conversational
+    print(f"🔤 {dispatcher.keyword_matcher.get_stats()}")
+    print(f"\n{'input':<12}{'legacy ms':>12}{'automaton ms':>15}{'speedup':>10}  same scores")
+    for name, text in inputs.items():
+        text = text.lower()
+        repeat = args.repeat * 100 if len(text) < 2_000 else args.repeat
+        legacy_ms = timed(lambda t: legacy_scores(agent_keywords, simple, t), text, repeat)
+        matcher_ms = timed(matcher_scores, text, repeat)
+        same = legacy_scores(agent_keywords, simple, text) == matcher_scores(text)
+        print(f"{name:<12}{legacy_ms:>12.4f}{matcher_ms:>15.4f}{legacy_ms / max(matcher_ms, 1e-6):>9.1f}x  {same}")
+
+    # Cost grows with the keyword count for the legacy loop, not for the automaton
+    many = {agent: keywords + [f"{agent}kw{i}" for i in range(200)] for agent, keywords in agent_keywords.items()}
+    from agents.core.keyword_matcher import KeywordMatcher
+    big_matcher = KeywordMatcher(dict(many, **{SIMPLE_CONVERSATION: simple}))
+    text = inputs["100 KB"].lower()
+    legacy_ms = timed(lambda t: legacy_scores(many, simple, t), text, args.repeat)
+    matcher_ms = timed(big_matcher.scores, text, args.repeat)
+    print(f"\n100 KB with {big_matcher.get_stats()['keywords']} keywords: "
+          f"legacy {legacy_ms:.2f} ms, automaton {matcher_ms:.2f} ms ({legacy_ms / matcher_ms:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmark: chat history search - FTS5 (chats_fts, BM25) vs. LIKE scan
+
+Builds a throwaway SQLite file with N synthetic chat rows (default 1M),
+indexes them with the same schema/triggers the backend uses (db/fts.py)
+and times the same searches both ways:
+  1. LIKE '%term%' over message/response (what a naive search does - full table scan)
+  2. chats_fts MATCH + bm25() + snippet() (CHAT_SEARCH_SQL used by /user/chats/search)
+
+Usage:
+    python testiranje/benchmark_fts.py [--rows 1000000] [--users 5] [--repeat 5] [--db /tmp/fts_bench.db]
+"""
+import argparse
+import itertools
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from db.fts import CHAT_FTS_SCHEMA, CHAT_SEARCH_SQL, chat_match, ensure_fts
+
+STOP_WORDS = "the a is of and to in for on with how why what when can should please i you je da se u na".split()
+TOPIC_WORDS = (
+    "docker kubernetes python fastapi model gpu memorija baza upit odgovor server deploy "
+    "llama kontekst token brzina greška rješenje kod funkcija klasa test benchmark mreža "
+    "iptv viber kalendar zadatak email datoteka pretraga korisnik postavke tema sigurnost"
+).split()
+# Zipf-like vocabulary: a few very common words, topic words, long tail of rare ones
+VOCABULARY = STOP_WORDS + TOPIC_WORDS + [f"term{i}" for i in range(20000)]
+CUM_WEIGHTS = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(VOCABULARY))))
+
+QUERIES = ["the", "docker", "kubernetes deploy", "greška baza", "term12345", "llama kontekst token"]
+
+
+def sentence(rng: random.Random, n: int) -> str:
+    return " ".join(rng.choices(VOCABULARY, cum_weights=CUM_WEIGHTS, k=n))
+
+
+def build(db_path: str, rows: int, users: int):
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("""
+        CREATE TABLE chats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            message TEXT NOT NULL,
+            response TEXT NOT NULL,
+            model_name VARCHAR(100),
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("CREATE INDEX ix_chats_user_id ON chats (user_id)")
+
+    rng = random.Random(42)
+    started = time.perf_counter()
+    batch = 10000
+    for start in range(0, rows, batch):
+        conn.executemany(
+            "INSERT INTO chats (user_id, message, response, model_name) VALUES (?, ?, ?, ?)",
+            [
+                (rng.randint(1, users), sentence(rng, rng.randint(5, 20)), sentence(rng, rng.randint(20, 80)), "bench.gguf")
+                for _ in range(min(batch, rows - start))
+            ]
+        )
+    conn.commit()
+    print(f"📦 {rows:,} rows inserted in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    ensure_fts(conn, "chats_fts", CHAT_FTS_SCHEMA)
+    print(f"🔎 chats_fts built in {time.perf_counter() - started:.1f}s")
+    return conn
+
+
+def timed(conn: sqlite3.Connection, sql: str, params, repeat: int) -> tuple:
+    samples = []
+    n = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        n = len(conn.execute(sql, params).fetchall())
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), n
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--db", default="/tmp/fts_bench.db")
+    args = parser.parse_args()
+
+    conn = build(args.db, args.rows, args.users)
+    user_id = 1
+
+    print(f"\n{'query':<24}{'LIKE ms':>12}{'FTS5 ms':>12}{'speedup':>10}{'hits':>8}")
+    for query in QUERIES:
+        terms = query.split()
+        like_sql = (
+            "SELECT id, message, response FROM chats WHERE user_id = ? AND "
+            + " AND ".join("(message LIKE ? OR response LIKE ?)" for _ in terms)
+            + " ORDER BY timestamp DESC LIMIT ?"
+        )
+        like_params = [user_id] + [f"%{t}%" for t in terms for _ in range(2)] + [args.limit]
+        like_ms, _ = timed(conn, like_sql, like_params, args.repeat)
+
+        fts_params = {"query": chat_match(query, user_id), "user_id": user_id, "limit": args.limit}
+        fts_ms, hits = timed(conn, CHAT_SEARCH_SQL, fts_params, args.repeat)
+        print(f"{query:<24}{like_ms:>12.1f}{fts_ms:>12.1f}{like_ms / max(fts_ms, 1e-3):>9.1f}x{hits:>8}")
+
+    conn.close()
+    size_mb = os.path.getsize(args.db) / 1e6
+    print(f"\n💾 DB size with index: {size_mb:.0f} MB ({args.db})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+🧪 RESPONSE CACHE SCOPE TEST
+Two users with different chat histories must never share a cached answer,
+and date/time questions must never be served from the cache - while a plain
+FAQ still hits in the default configuration (include_history on).
+
+Runs the same decision path as /ai/chat (prompt_cacheable -> response_cache_scope
+-> get / put) against a fresh ResponseCache - no model or database needed.
+
+Usage:
+    python testiranje/test_response_cache_scope.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import api.ai as ai
+from api.ai import ChatRequest, prompt_cacheable, response_cache_scope
+from inference.response_cache import ResponseCache
+
+SYSTEM_PROMPT = "You are an advanced AI assistant."
+
+
+def prepared_for(request: ChatRequest, history_block: str) -> dict:
+    """What build_chat_prompt returns for default settings (only the fields the cache uses)"""
+    return {
+        "cacheable": prompt_cacheable(request, history_block),
+        "cache_store": not history_block,
+        "model_name": "model.gguf",
+        "system_prompt": SYSTEM_PROMPT,
+        "max_tokens": 512,
+        "temperature": 0.2,
+        "top_p": 0.9,
+        "top_k": 40,
+    }
+
+
+def ask(request: ChatRequest, history_block: str, answer: str):
+    """Cache lookup like /ai/chat; on a miss the 'model' answers and the result is stored if allowed"""
+    prepared = prepared_for(request, history_block)
+    scope = response_cache_scope(request, prepared)
+    if scope:
+        cached = ai.response_cache.get(scope, request.message)
+        if cached:
+            return cached[0].response, True
+        if prepared["cache_store"]:
+            ai.response_cache.put(scope, request.message, answer, "model.gguf")
+    return answer, False
+
+
+def test_users_with_history_never_share_hits():
+    ai.response_cache = ResponseCache()
+    history_a = "<|start_header_id|>user<|end_header_id|>\n\nZovem se Ana<|eot_id|>"
+    history_b = "<|start_header_id|>user<|end_header_id|>\n\nZovem se Marko<|eot_id|>"
+    for use_cache in (None, True):  # auto (temperature 0.2) and explicit opt-in
+        request = ChatRequest(message="Kako se zovem?", use_cache=use_cache)
+        answer_a, hit_a = ask(request, history_a, "Zoveš se Ana.")
+        answer_b, hit_b = ask(request, history_b, "Zoveš se Marko.")
+        assert not hit_a and not hit_b, "history-bearing request was served from the cache"
+        assert answer_b == "Zoveš se Marko.", f"user B got user A's answer: {answer_b}"
+    assert ai.response_cache.get_stats()["entries"] == 0, "history-bearing answers were stored"
+    print("✅ users with different histories never share a cached answer")
+
+
+def test_history_answers_never_stored():
+    ai.response_cache = ResponseCache()
+    history = "<|start_header_id|>user<|end_header_id|>\n\nOdgovaraj na engleskom<|eot_id|>"
+    request = ChatRequest(message="Šta je Python?")
+    ask(request, history, "Python is a programming language.")
+    answer, hit = ask(request, "", "Python je programski jezik.")
+    assert not hit and answer == "Python je programski jezik.", "an answer built from chat history was shared"
+    assert ai.response_cache.get_stats()["entries"] == 1
+    print("✅ answers generated with chat history are never stored")
+
+
+def test_faq_hits_with_history_in_default_config():
+    ai.response_cache = ResponseCache()
+    request = ChatRequest(message="Koliko košta IPTV paket?")  # defaults: include_history on, temperature 0.2
+    assert request.include_history and request.use_cache is None
+    # First user, first message (no history yet) -> generated and stored
+    ask(request, "", "Osnovni paket košta 10 EUR mjesečno.")
+    # Another user deep into a conversation asks the same FAQ
+    history = "<|start_header_id|>user<|end_header_id|>\n\nZdravo<|eot_id|>"
+    answer, hit = ask(request, history, "(model called again)")
+    assert hit and answer == "Osnovni paket košta 10 EUR mjesečno.", "FAQ missed the cache with history attached"
+    # ...but a follow-up that leans on the conversation never reads the shared entries
+    follow_up = ChatRequest(message="A zašto toliko košta IPTV paket?")
+    assert response_cache_scope(follow_up, prepared_for(follow_up, history)) is None
+    print("✅ self-contained FAQs hit the cache in the default configuration")
+
+
+def test_time_questions_bypass_cache():
+    ai.response_cache = ResponseCache()
+    request = ChatRequest(message="Koliko je sati?", use_cache=True)
+    ask(request, "", "14:05")
+    answer, hit = ask(request, "", "14:15")
+    assert not hit and answer == "14:15", "time question was answered from the cache"
+    print("✅ date/time questions bypass the cache")
+
+
+def test_history_less_requests_still_cached():
+    ai.response_cache = ResponseCache()
+    request = ChatRequest(message="Šta je Python?", include_history=False)
+    ask(request, "", "Python je programski jezik.")
+    answer, hit = ask(request, "", "(model called again)")
+    assert hit and answer == "Python je programski jezik.", "plain FAQ question missed the cache"
+    print("✅ history-less questions are still shared")
+
+
+if __name__ == "__main__":
+    test_users_with_history_never_share_hits()
+    test_history_answers_never_stored()
+    test_faq_hits_with_history_in_default_config()
+    test_time_questions_bypass_cache()
+    test_history_less_requests_still_cached()
+    print("\n✅ All response cache scope tests passed")